@@ -65,3 +65,27 @@ class DocumentQARequest(BaseModel):
                 ]
             }
         }
+
+class DocumentQuestionsRequest(BaseModel):
+    """Request model for questions about documents registered with /hackrx/documents"""
+    document_ids: List[str] = Field(..., min_items=1, description="Ids returned when the documents were registered")
+    questions: List[str] = Field(..., min_items=1, description="List of questions to answer")
+    
+    @validator('questions')
+    def validate_questions(cls, v):
+        """Validate questions are not empty"""
+        validated_questions = []
+        for question in v:
+            if not question or not question.strip():
+                raise ValueError("Questions cannot be empty")
+            validated_questions.append(question.strip())
+        
+        return validated_questions
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "document_ids": ["3f2a9c..."],
+                "questions": ["What is the grace period for premium payment?"]
+            }
+        }
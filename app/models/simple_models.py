@@ -43,6 +43,24 @@ class SimpleDocumentQARequest:
                 raise ValueError("Questions cannot be empty")
             self.questions.append(question.strip())
 
+class SimpleDocumentQuestionsRequest:
+    """Questions about registered documents without Pydantic"""
+    
+    def __init__(self, data: dict):
+        self.document_ids = data.get('document_ids', [])
+        if not self.document_ids or not all(isinstance(doc_id, str) and doc_id for doc_id in self.document_ids):
+            raise ValueError("At least one document id is required")
+        
+        self.questions = []
+        questions_data = data.get('questions', [])
+        if not questions_data:
+            raise ValueError("At least one question is required")
+        
+        for question in questions_data:
+            if not question or not question.strip():
+                raise ValueError("Questions cannot be empty")
+            self.questions.append(question.strip())
+
 class SimpleAnswerResult:
     """Simple answer result without Pydantic"""
     
@@ -63,13 +81,17 @@ class SimpleAnswerResult:
 class SimpleDocumentQAResponse:
     """Simple document Q&A response without Pydantic"""
     
-    def __init__(self, answers: List[SimpleAnswerResult], processing_time: float):
+    def __init__(self, answers: List[SimpleAnswerResult], processing_time: float, metadata: Optional[Dict[str, Any]] = None):
         self.answers = answers
         self.processing_time = processing_time
+        self.metadata = metadata
     
     def to_dict(self) -> dict:
-        return {
+        result = {
             "answers": [answer.to_dict() for answer in self.answers],
             "processing_time": self.processing_time,
             "total_questions": len(self.answers)
         }
+        if self.metadata is not None:
+            result["metadata"] = self.metadata
+        return result
@@ -0,0 +1,232 @@
+"""
+Admission control for document ingestion
+
+Requests are checked against MAX_DOCUMENTS, MAX_QUESTIONS and
+MAX_CONTENT_SIZE before any work starts. Their ingestion (download, parse,
+chunk, embed and index) then runs under a process-wide budget: at most
+ADMISSION_MAX_CONCURRENT at once, within ADMISSION_MEMORY_BUDGET estimated
+bytes. Work over budget waits its turn in a bounded FIFO queue; when the
+queue is full, or the wait exceeds ADMISSION_MAX_WAIT, it is rejected with
+a Retry-After estimate instead of piling onto the box.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Optional
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Estimated peak memory per byte of document content: decoded content,
+# extracted text, overlapping chunks, cleaned copies and embeddings
+MEMORY_PER_CONTENT_BYTE = 6
+
+# Estimated memory per question: query embedding, retrieved context and prompt
+MEMORY_PER_QUESTION = 64 * 1024
+
+# Size assumed for a URL document, which is only known once downloaded
+URL_DOCUMENT_BYTES = 2 * 1024 * 1024
+
+
+class RequestLimitError(ValueError):
+    """A request exceeds MAX_DOCUMENTS, MAX_QUESTIONS or MAX_CONTENT_SIZE"""
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when ingestion cannot start because the admission queue is full or the wait timed out"""
+    
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def content_bytes(doc_type: str, content: str) -> int:
+    """Size of a document's content once decoded (base64 for files); 0 for URLs"""
+    if doc_type == "url":
+        return 0
+    if doc_type in ("pdf", "docx"):
+        return len(content) * 3 // 4
+    return len(content)
+
+
+class AdmissionTicket:
+    """A slot held by one ingestion"""
+    
+    __slots__ = ("cost", "started")
+    
+    def __init__(self, cost: int):
+        self.cost = cost
+        self.started = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Request limits and a concurrency and memory budget for ingestion
+    
+    Slots are handed out in arrival order, so a large request at the head
+    of the queue is not starved by smaller ones behind it. A request larger
+    than the whole memory budget still runs, alone.
+    """
+    
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        memory_budget: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        max_documents: Optional[int] = None,
+        max_questions: Optional[int] = None,
+        max_content_size: Optional[int] = None
+    ):
+        """
+        Args:
+            max_concurrent: Ingestions running at once (ADMISSION_MAX_CONCURRENT)
+            memory_budget: Estimated bytes all running ingestions may use (ADMISSION_MEMORY_BUDGET)
+            queue_size: Requests that may wait for a slot; 0 rejects at once (ADMISSION_QUEUE_SIZE)
+            max_wait: Seconds a request waits before it is rejected (ADMISSION_MAX_WAIT)
+            max_documents: Documents per request (MAX_DOCUMENTS)
+            max_questions: Questions per request (MAX_QUESTIONS)
+            max_content_size: Bytes of document content per request (MAX_CONTENT_SIZE)
+        """
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(
+            os.getenv("ADMISSION_MAX_CONCURRENT", "2")
+        )
+        self.memory_budget = memory_budget if memory_budget is not None else int(
+            os.getenv("ADMISSION_MEMORY_BUDGET", "536870912")
+        )
+        self.queue_size = queue_size if queue_size is not None else int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+        self.max_documents = max_documents if max_documents is not None else int(os.getenv("MAX_DOCUMENTS", "10"))
+        self.max_questions = max_questions if max_questions is not None else int(os.getenv("MAX_QUESTIONS", "50"))
+        self.max_content_size = max_content_size if max_content_size is not None else int(
+            os.getenv("MAX_CONTENT_SIZE", "10485760")
+        )
+        
+        self.in_flight = 0
+        self.reserved = 0
+        self._waiters: deque = deque()
+        # Moving average of how long an ingestion holds its slot, for Retry-After
+        self._hold_seconds = 5.0
+        self.counters = {"admitted": 0, "waited": 0, "rejected": 0}
+    
+    def check(self, documents: Iterable[Any], questions: int) -> int:
+        """
+        Check a request against the limits and estimate its ingestion memory
+        
+        Args:
+            documents: Documents with .type and .content
+            questions: Number of questions
+        
+        Returns:
+            Estimated peak memory in bytes
+        
+        Raises:
+            RequestLimitError: If the request exceeds a limit
+        """
+        documents = list(documents)
+        if len(documents) > self.max_documents:
+            raise RequestLimitError(f"Too many documents: {len(documents)} (limit {self.max_documents})")
+        if questions > self.max_questions:
+            raise RequestLimitError(f"Too many questions: {questions} (limit {self.max_questions})")
+        
+        size = sum(content_bytes(doc.type, doc.content) for doc in documents)
+        if size > self.max_content_size:
+            raise RequestLimitError(f"Document content too large: {size} bytes (limit {self.max_content_size})")
+        urls = sum(1 for doc in documents if doc.type == "url")
+        return (size + urls * URL_DOCUMENT_BYTES) * MEMORY_PER_CONTENT_BYTE + questions * MEMORY_PER_QUESTION
+    
+    async def acquire(self, cost: int, wait: bool = False) -> AdmissionTicket:
+        """
+        Take an ingestion slot, waiting in the queue if the budget is in use
+        
+        Args:
+            cost: Estimated bytes, from check()
+            wait: Wait as long as it takes, outside the bounded queue (for
+                background jobs, which are bounded by their own workers)
+        
+        Returns:
+            Ticket to pass to release()
+        
+        Raises:
+            AdmissionRejectedError: If the queue is full or the wait timed out
+        """
+        cost = min(cost, self.memory_budget)
+        if not self._waiters and self._fits(cost):
+            return self._take(cost)
+        if not wait and self._queued() >= self.queue_size:
+            self._reject("Server busy: ingestion queue is full")
+        
+        future = asyncio.get_running_loop().create_future()
+        entry = (cost, future)
+        self._waiters.append(entry)
+        self.counters["waited"] += 1
+        try:
+            return await asyncio.wait_for(future, None if wait else self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as the wait ended: pass it on
+                self.release(future.result())
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                # The head of the queue may have been what held the others back
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(f"Server busy: no ingestion slot within {self.max_wait:g}s")
+            raise
+    
+    def release(self, ticket: AdmissionTicket):
+        """Return a slot taken with acquire()"""
+        self.in_flight -= 1
+        self.reserved -= ticket.cost
+        held = time.monotonic() - ticket.started
+        self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held
+        self._wake()
+    
+    def retry_after(self) -> int:
+        """Seconds until a new request would likely get a slot"""
+        ahead = self._queued() + 1
+        return max(1, math.ceil(self._hold_seconds * ahead / max(1, self.max_concurrent)))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Running and queued ingestions, reserved memory and admission counters"""
+        return {
+            "in_flight": self.in_flight,
+            "queued": self._queued(),
+            "reserved_bytes": self.reserved,
+            "memory_budget": self.memory_budget,
+            **self.counters,
+        }
+    
+    def _fits(self, cost: int) -> bool:
+        if self.in_flight >= self.max_concurrent:
+            return False
+        return self.in_flight == 0 or self.reserved + cost <= self.memory_budget
+    
+    def _take(self, cost: int) -> AdmissionTicket:
+        self.in_flight += 1
+        self.reserved += cost
+        self.counters["admitted"] += 1
+        return AdmissionTicket(cost)
+    
+    def _wake(self):
+        while self._waiters:
+            cost, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(cost):
+                return
+            self._waiters.popleft()
+            future.set_result(self._take(cost))
+    
+    def _queued(self) -> int:
+        return sum(1 for _, future in self._waiters if not future.done())
+    
+    def _reject(self, reason: str):
+        self.counters["rejected"] += 1
+        retry_after = self.retry_after()
+        logger.warning(f"{reason}; {self.in_flight} running, {self._queued()} queued, retry after {retry_after}s")
+        raise AdmissionRejectedError(reason, retry_after)
@@ -0,0 +1,195 @@
+"""
+Persistent exact-match answer cache
+
+Answers are stored in SQLite keyed by the model name, the prompt template
+version, the question and a hash of the exact context string, so re-running
+the same question set against the same policy skips the LLM entirely. The
+store is bounded by a byte budget (least recently used entries are evicted)
+and a TTL. Triggers keep the stored byte and entry counts in a one-row
+table, so enforcing the budget never scans the answers, and the counts stay
+right when several worker processes share the file.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Request header asking for fresh answers; "Cache-Control: no-cache" is honoured too
+BYPASS_HEADER = "X-Cache-Bypass"
+
+
+def bypass_requested(headers: Mapping[str, str]) -> bool:
+    """Whether request headers ask to skip cached answers"""
+    if headers.get(BYPASS_HEADER, "").strip().lower() in ("1", "true", "yes"):
+        return True
+    return "no-cache" in headers.get("Cache-Control", "").lower()
+
+
+class AnswerCache:
+    """
+    SQLite-backed cache of LLM answers with a size budget and TTL
+    """
+    
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            path: SQLite database file (":memory:" for a process-local cache)
+            max_bytes: Budget for the stored answers; least recently used entries are evicted beyond it
+            ttl: Seconds an answer stays valid, 0 for no expiry
+        """
+        self.path = path or os.getenv("ANSWER_CACHE_PATH", "data/answer_cache.sqlite3")
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+        )
+        self.ttl = ttl if ttl is not None else float(os.getenv("ANSWER_CACHE_TTL", "604800"))
+        
+        if self.path != ":memory:":
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._db = self._connect()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        logger.info(f"Initialized answer cache at {self.path}")
+    
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # A connection must not be used across fork(), so each worker process opens its own
+        if self._pid != os.getpid():
+            self._db = self._connect()
+            self._pid = os.getpid()
+        return self._db
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        conn.execute("CREATE INDEX IF NOT EXISTS answers_created_at ON answers (created_at)")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                entries INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            )"""
+        )
+        # Counted once for a store created before the totals table existed
+        conn.execute(
+            "INSERT OR IGNORE INTO totals (id, entries, bytes) SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM answers"
+        )
+        conn.executescript(
+            """CREATE TRIGGER IF NOT EXISTS answers_inserted AFTER INSERT ON answers BEGIN
+                UPDATE totals SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS answers_updated AFTER UPDATE OF size ON answers BEGIN
+                UPDATE totals SET bytes = bytes + NEW.size - OLD.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS answers_deleted AFTER DELETE ON answers BEGIN
+                UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0;
+            END;"""
+        )
+        return conn
+    
+    @staticmethod
+    def make_key(model_name: str, prompt_version: str, question: str, context: str) -> str:
+        """
+        Build the cache key for an LLM call
+        
+        The context is hashed as-is: any change in the retrieved chunks, their
+        order or the document produces a different key.
+        """
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        material = json.dumps([model_name, prompt_version, question, context_hash])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached answer for key, or None on a miss or expired entry"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+    
+    def set(self, key: str, answer: Dict[str, Any]):
+        """Store an answer, evicting old entries to stay within the size budget"""
+        value = json.dumps(answer)
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete would not fire the delete trigger
+            self._conn.execute(
+                """INSERT INTO answers (key, value, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,
+                    created_at = excluded.created_at, last_used = excluded.last_used""",
+                (key, value, size, now, now)
+            )
+            self._enforce_budget(now)
+    
+    def _enforce_budget(self, now: float):
+        """Drop expired entries, then least recently used ones while over budget"""
+        if self.ttl:
+            cursor = self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            self.evictions += max(cursor.rowcount, 0)
+        
+        total = self._conn.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evict = []
+        for key, size in self._conn.execute("SELECT key, size FROM answers ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM answers WHERE key = ?", evict)
+        self.evictions += len(evict)
+    
+    def clear(self):
+        """Remove all cached answers"""
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss metrics and current size"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
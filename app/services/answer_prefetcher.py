@@ -0,0 +1,134 @@
+"""
+Background pre-answering of a standard question set
+
+Most policies are asked the same battery of questions. As soon as a document
+is indexed, a background job answers a configured question set into the
+answer cache at below-live priority, so later requests for those questions
+are cache hits. The job is cancelled when its document's index is replaced.
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.utils.logger import setup_logger
+from app.utils.metrics import detach_breakdown
+from app.utils.question_sets import load_question_set
+
+logger = setup_logger(__name__)
+
+# Indexes remembered as already pre-answered, so repeat requests do not redo the work
+MAX_COMPLETED = 256
+
+
+class AnswerPrefetcher:
+    """
+    Runs one pre-answering job per indexed document
+    """
+    
+    def __init__(self, pipeline, questions: Optional[List[str]] = None):
+        """
+        Args:
+            pipeline: QAPipeline whose retriever, caches and scheduler are used
+            questions: Question set to pre-answer, defaults to the
+                PREFETCH_QUESTION_SET spec ("standard", a file path, or "" for none)
+        """
+        self.pipeline = pipeline
+        if questions is None:
+            spec = os.getenv("PREFETCH_QUESTION_SET", "")
+            try:
+                questions = load_question_set(spec)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load pre-answering question set '{spec}': {e}")
+                questions = []
+        self.questions = questions
+        self.jobs: Dict[str, asyncio.Task] = {}
+        self.completed: "OrderedDict[str, None]" = OrderedDict()
+        self.counters = {
+            "started": 0, "completed": 0, "cancelled": 0,
+            "answered": 0, "cached": 0, "extracted": 0, "failed": 0
+        }
+        
+        if self.questions and pipeline.answer_cache is None:
+            logger.info("Pre-answering disabled: the answer cache is off")
+        pipeline.retriever.add_eviction_listener(self.cancel)
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.questions) and self.pipeline.answer_cache is not None
+    
+    def start(self, exclude: Iterable[str] = (), retriever=None) -> Optional[asyncio.Task]:
+        """
+        Start pre-answering for the document currently indexed
+        
+        Args:
+            exclude: Questions the live request is already answering
+            retriever: Router holding the document, when it is not the
+                pipeline's own (a request's spawned index)
+        
+        Returns:
+            The background task, or None if disabled or this index is already
+            being or has been pre-answered
+        """
+        retriever = retriever or self.pipeline.retriever
+        fingerprint = retriever.fingerprint
+        if not self.enabled or fingerprint is None or fingerprint in self.jobs:
+            return None
+        if fingerprint in self.completed:
+            self.completed.move_to_end(fingerprint)
+            return None
+        
+        skip = set(exclude)
+        questions = [question for question in self.questions if question not in skip]
+        if not questions:
+            return None
+        
+        task = asyncio.ensure_future(self._run(self.pipeline.for_retriever(retriever), fingerprint, questions))
+        self.jobs[fingerprint] = task
+        self.counters["started"] += 1
+        task.add_done_callback(lambda done: self._finished(fingerprint, done))
+        logger.info(f"Pre-answering {len(questions)} questions for index {fingerprint[:12]}")
+        return task
+    
+    async def _run(self, pipeline, fingerprint: str, questions: List[str]):
+        # Started during a request, but its stage times are not that request's
+        detach_breakdown()
+        counts = await pipeline.precompute(questions, fingerprint)
+        for key, value in counts.items():
+            self.counters[key] += value
+        logger.info(f"Pre-answering for index {fingerprint[:12]} finished: {counts}")
+    
+    def _finished(self, fingerprint: str, task: asyncio.Task):
+        if self.jobs.get(fingerprint) is task:
+            del self.jobs[fingerprint]
+        if task.cancelled():
+            self.counters["cancelled"] += 1
+        elif task.exception() is not None:
+            logger.error(f"Pre-answering for index {fingerprint[:12]} failed: {task.exception()}")
+        else:
+            self.counters["completed"] += 1
+            self.completed[fingerprint] = None
+            if len(self.completed) > MAX_COMPLETED:
+                self.completed.popitem(last=False)
+    
+    def cancel(self, fingerprint: str) -> bool:
+        """Cancel the job for an evicted index; returns whether one was running"""
+        task = self.jobs.pop(fingerprint, None)
+        if task is None:
+            return False
+        logger.info(f"Index {fingerprint[:12]} evicted, cancelling its pre-answering")
+        task.cancel()
+        return True
+    
+    def cancel_all(self):
+        """Cancel every running job (on shutdown)"""
+        for fingerprint in list(self.jobs):
+            self.cancel(fingerprint)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "question_set_size": len(self.questions),
+            "running": len(self.jobs),
+            **self.counters
+        }
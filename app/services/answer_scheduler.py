@@ -0,0 +1,291 @@
+"""
+Rate-limit-aware scheduler for LLM calls
+
+Runs LLM calls with bounded concurrency, throttles them with token buckets
+for requests-per-minute and tokens-per-minute, and retries rate-limit (429)
+and server (5xx) errors with jittered exponential backoff. Background calls
+(e.g. pre-answering) only get a slot when no live call is waiting for one.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+LIVE = 0
+BACKGROUND = 1
+
+# Estimated tokens of the call running in this context, to charge duplicates (hedges) of it
+_call_tokens: ContextVar[int] = ContextVar("llm_call_tokens", default=0)
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """Extract an HTTP status code from an SDK or HTTP client exception"""
+    for candidate in (
+        getattr(error, "code", None),
+        getattr(error, "status_code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(candidate, int):
+            return candidate
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an LLM call error is worth retrying (429, 5xx, timeouts, dropped connections)"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = error_status(error)
+    return status is not None and (status == 429 or 500 <= status < 600)
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at a per-minute rate
+    """
+    
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: Refill rate; 0 or less disables the limit
+            capacity: Burst size, defaults to one minute's worth of tokens
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop = None
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, amount: float = 1) -> float:
+        """
+        Wait until amount tokens are available and take them
+        
+        Args:
+            amount: Tokens to take (capped at the bucket capacity)
+        
+        Returns:
+            Seconds spent waiting
+        """
+        if self.rate <= 0:
+            return 0.0
+        
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+    
+    def available(self, amount: float = 1) -> bool:
+        """Whether amount tokens could be taken now without waiting or jumping the queue"""
+        if self.rate <= 0:
+            return True
+        if self._lock is not None and self._lock.locked():
+            return False
+        self._refill()
+        return self.tokens >= min(amount, self.capacity)
+    
+    def take(self, amount: float = 1):
+        """Take tokens already checked with available()"""
+        if self.rate > 0:
+            self.tokens -= min(amount, self.capacity)
+
+
+class PrioritySemaphore:
+    """
+    Async semaphore that hands freed slots to the waiter with the lowest priority value
+    """
+    
+    def __init__(self, value: int):
+        self.value = value
+        self.in_use = 0
+        self._waiters: list = []
+        self._order = itertools.count()
+    
+    async def acquire(self, priority: int = LIVE):
+        # Freed slots are handed to waiters on release, so a free slot means nobody is waiting
+        if self.in_use < self.value:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Cancelled just after being handed a slot: pass it on
+                self.release()
+            raise
+    
+    def release(self):
+        self.in_use -= 1
+        while self._waiters and self.in_use < self.value:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.in_use += 1
+                future.set_result(None)
+    
+    def waiting(self, priority: int) -> int:
+        """Waiters queued at a priority"""
+        return sum(1 for level, _, future in self._waiters if level == priority and not future.done())
+
+
+class AnswerScheduler:
+    """
+    Bounded-concurrency executor for LLM calls with rate limiting and retries
+    """
+    
+    def __init__(self, max_concurrency: Optional[int] = None, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_retries: Optional[int] = None,
+                 base_delay: Optional[float] = None, max_delay: Optional[float] = None,
+                 background_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        # Background calls never hold more than this many slots, so live requests always find one soon
+        self.background_concurrency = background_concurrency or int(os.getenv("LLM_BACKGROUND_CONCURRENCY", "1"))
+        self.request_bucket = TokenBucket(
+            requests_per_minute if requests_per_minute is not None else float(os.getenv("LLM_RPM", "60"))
+        )
+        self.token_bucket = TokenBucket(
+            tokens_per_minute if tokens_per_minute is not None else float(os.getenv("LLM_TPM", "250000"))
+        )
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "3"))
+        self.base_delay = base_delay if base_delay is not None else float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("LLM_RETRY_MAX_DELAY", "20.0"))
+        
+        self._semaphore: Optional[PrioritySemaphore] = None
+        self._background_semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.in_flight = 0
+        self.background_in_flight = 0
+        self.counters = {
+            "calls": 0, "retries": 0, "failures": 0, "throttled_seconds": 0.0, "background_calls": 0,
+            "duplicate_calls": 0, "duplicates_refused": 0
+        }
+    
+    def _get_semaphore(self) -> PrioritySemaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore, self._loop = PrioritySemaphore(self.max_concurrency), loop
+            self._background_semaphore = asyncio.Semaphore(self.background_concurrency)
+        return self._semaphore
+    
+    def backoff_delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Full-jitter exponential backoff, honouring a Retry-After hint if the error carries one"""
+        retry_after = getattr(error, "retry_after", None)
+        if isinstance(retry_after, (int, float)) and retry_after > 0:
+            return min(float(retry_after), self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    async def call(self, func: Callable[[], Awaitable[Any]], tokens: int = 0, background: bool = False) -> Any:
+        """
+        Run an LLM call under the concurrency and rate limits
+        
+        Args:
+            func: Zero-argument coroutine function performing one call
+            tokens: Estimated tokens the call consumes (prompt + completion)
+            background: Run below live traffic: the call only takes a slot no
+                live call is waiting for, and at most background_concurrency
+                background calls run at once
+        
+        Returns:
+            The call's result
+        
+        Raises:
+            The last error if it is not retryable or retries are exhausted
+        """
+        semaphore = self._get_semaphore()
+        if background:
+            async with self._background_semaphore:
+                self.counters["background_calls"] += 1
+                self.background_in_flight += 1
+                try:
+                    return await self._call(semaphore, func, tokens, BACKGROUND)
+                finally:
+                    self.background_in_flight -= 1
+        return await self._call(semaphore, func, tokens, LIVE)
+    
+    async def _call(self, semaphore: PrioritySemaphore, func: Callable[[], Awaitable[Any]],
+                    tokens: int, priority: int) -> Any:
+        attempt = 0
+        while True:
+            await semaphore.acquire(priority)
+            try:
+                waited = await self.request_bucket.acquire(1)
+                waited += await self.token_bucket.acquire(tokens)
+                self.counters["throttled_seconds"] += waited
+                self.counters["calls"] += 1
+                self.in_flight += 1
+                _call_tokens.set(tokens)
+                try:
+                    return await func()
+                except Exception as e:
+                    error = e
+                finally:
+                    self.in_flight -= 1
+            finally:
+                semaphore.release()
+            
+            if attempt >= self.max_retries or not is_retryable(error):
+                self.counters["failures"] += 1
+                raise error
+            
+            delay = self.backoff_delay(attempt, error)
+            attempt += 1
+            self.counters["retries"] += 1
+            logger.warning(f"LLM call failed ({error_status(error) or type(error).__name__}), "
+                           f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+    
+    def charge_duplicate(self) -> bool:
+        """
+        Take rate budget for a duplicate of the call running in this context, without waiting
+        
+        For hedged calls: a duplicate is only worth sending when the request
+        and token budgets have room for it now, and it must not push the
+        provider past its limits, where it would only earn 429s.
+        
+        Returns:
+            True if the budget was taken and the duplicate may be sent
+        """
+        tokens = _call_tokens.get()
+        if not (self.request_bucket.available(1) and self.token_bucket.available(tokens)):
+            self.counters["duplicates_refused"] += 1
+            return False
+        self.request_bucket.take(1)
+        self.token_bucket.take(tokens)
+        self.counters["duplicate_calls"] += 1
+        return True
+    
+    def stats(self) -> Dict[str, Any]:
+        """Scheduler counters"""
+        return {
+            **self.counters,
+            "throttled_seconds": round(self.counters["throttled_seconds"], 3),
+            "in_flight": self.in_flight,
+            "background_in_flight": self.background_in_flight,
+            "queued": self._semaphore.waiting(LIVE) if self._semaphore is not None else 0,
+            "background_queued": self._semaphore.waiting(BACKGROUND) if self._semaphore is not None else 0,
+            "max_concurrency": self.max_concurrency
+        }
@@ -7,6 +7,7 @@ import re
 from typing import List, Dict, Any, Optional
 from collections import Counter
 
+from app.services.chunk_registry import ChunkRegistry, DEFAULT_DOCUMENT_ID
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -18,14 +19,25 @@ class BasicTextSearch:
     """
     
     def __init__(self):
-        self.chunks = []
+        self.registry = ChunkRegistry()
+        # Per-chunk token postings, built once when a chunk is added
+        self.postings: Dict[int, tuple] = {}
         self.is_fitted = False
         
         logger.info("Initialized basic text search (no ML dependencies)")
     
+    def spawn(self) -> "BasicTextSearch":
+        """An empty index of the same kind"""
+        return BasicTextSearch()
+    
+    @property
+    def chunks(self) -> Dict[int, str]:
+        """Indexed chunk texts keyed by chunk id"""
+        return self.registry.texts
+    
     def create_index(self, chunks: List[str]) -> bool:
         """
-        Create a simple text index from chunks
+        Create a simple text index from chunks, replacing any indexed documents
         
         Args:
             chunks: List of text chunks
@@ -36,8 +48,8 @@ class BasicTextSearch:
         try:
             logger.info(f"Creating basic text index for {len(chunks)} chunks")
             
-            self.chunks = chunks
-            self.is_fitted = True
+            self.clear_index()
+            self.add_documents({DEFAULT_DOCUMENT_ID: chunks})
             
             logger.info(f"Basic text index created successfully")
             return True
@@ -46,6 +58,70 @@ class BasicTextSearch:
             logger.error(f"Error creating text index: {str(e)}")
             return False
     
+    def add_documents(self, documents: Dict[str, List[str]]) -> Dict[str, int]:
+        """
+        Tokenize and add documents without touching already indexed chunks
+        
+        Args:
+            documents: Mapping of document id to its text chunks. A document id
+                that is already indexed is replaced.
+            
+        Returns:
+            Mapping of document id to number of chunks added
+        """
+        added = {}
+        for document_id, chunks in documents.items():
+            if document_id in self.registry.document_chunks:
+                self.remove_document(document_id, compact=False)
+            ids = self.registry.add(document_id, chunks)
+            for chunk_id, chunk in zip(ids, chunks):
+                tokens = self._tokenize(chunk.lower())
+                self.postings[chunk_id] = (tokens, Counter(tokens))
+            added[document_id] = len(ids)
+        
+        self.is_fitted = True
+        if self.registry.needs_compaction():
+            self.compact()
+        return added
+    
+    def remove_document(self, document_id: str, compact: bool = True) -> bool:
+        """
+        Remove a document from the index
+        
+        Args:
+            document_id: Document identifier
+            compact: Whether to compact the index if it is due
+            
+        Returns:
+            bool: True if the document was indexed
+        """
+        ids = self.registry.remove(document_id)
+        if not ids:
+            return False
+        
+        logger.info(f"Removed document '{document_id}' ({len(ids)} chunks tombstoned)")
+        if compact and self.registry.needs_compaction():
+            self.compact()
+        return True
+    
+    def compact(self) -> int:
+        """
+        Drop postings of tombstoned chunks
+        
+        Returns:
+            Number of chunks removed
+        """
+        purged = self.registry.purge()
+        for chunk_id in purged:
+            self.postings.pop(chunk_id, None)
+        return len(purged)
+    
+    def clear_index(self):
+        """Clear the current index and chunks"""
+        self.registry.reset()
+        self.postings = {}
+        self.is_fitted = False
+    
     def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
         Search for relevant chunks using simple text matching
@@ -69,11 +145,12 @@ class BasicTextSearch:
             
             # Score each chunk
             chunk_scores = []
-            for idx, chunk in enumerate(self.chunks):
-                score = self._calculate_score(query_tokens, chunk.lower())
+            for idx in self.registry.live_ids():
+                chunk_tokens, chunk_counter = self.postings[idx]
+                score = self._score_tokens(query_tokens, chunk_tokens, chunk_counter)
                 if score > 0:
                     chunk_scores.append({
-                        'text': chunk,
+                        'text': self.chunks[idx],
                         'score': score,
                         'index': idx
                     })
@@ -98,8 +175,10 @@ class BasicTextSearch:
     def _calculate_score(self, query_tokens: List[str], chunk_text: str) -> float:
         """Calculate relevance score for a chunk"""
         chunk_tokens = self._tokenize(chunk_text)
-        chunk_counter = Counter(chunk_tokens)
-        
+        return self._score_tokens(query_tokens, chunk_tokens, Counter(chunk_tokens))
+    
+    def _score_tokens(self, query_tokens: List[str], chunk_tokens: List[str], chunk_counter: Counter) -> float:
+        """Calculate relevance score from a chunk's pre-tokenized postings"""
         score = 0.0
         total_query_words = len(query_tokens)
         
@@ -133,6 +212,8 @@ class BasicTextSearch:
         
         return {
             "status": "fitted",
-            "num_chunks": len(self.chunks),
+            "num_chunks": self.registry.num_live,
+            "num_documents": len(self.registry.document_chunks),
+            "tombstones": len(self.registry.tombstones),
             "search_type": "basic_text_matching"
         }
@@ -0,0 +1,270 @@
+"""
+Latency-aware guard for LLM calls
+
+Every call gets an overall deadline. A call still running after the recent
+p95 latency gets a hedged duplicate, and whichever finishes first wins while
+the other is cancelled. A circuit breaker counts provider failures (timeouts,
+dropped connections, 429 and 5xx) and, once tripped, fails calls immediately
+until a probe call succeeds.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.services.answer_scheduler import is_retryable
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit breaker is open"""
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(TimeoutError):
+    """An LLM call, including any hedge, did not finish within its deadline"""
+
+
+class LatencyTracker:
+    """
+    Rolling window of recent successful call latencies
+    """
+    
+    def __init__(self, window: int = 200):
+        self.samples: deque = deque(maxlen=window)
+    
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+    
+    def percentile(self, quantile: float) -> Optional[float]:
+        """Latency at the given quantile (0-1), or None without samples"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with a half-open probe
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: Consecutive provider failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe call is let through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.counters = {"opened": 0, "short_circuited": 0}
+    
+    def allow(self):
+        """
+        Admit a call or fail fast
+        
+        Raises:
+            CircuitOpenError: While open, or while a half-open probe is in flight
+        """
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.counters["short_circuited"] += 1
+                raise CircuitOpenError(f"LLM circuit open, retry in {remaining:.1f}s", retry_after=remaining)
+            self.state = HALF_OPEN
+            logger.info("LLM circuit half-open, sending probe call")
+        if self.state == HALF_OPEN:
+            if self.probe_in_flight:
+                self.counters["short_circuited"] += 1
+                raise CircuitOpenError("LLM circuit half-open, probe call in flight")
+            self.probe_in_flight = True
+    
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info("LLM circuit closed")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+    
+    def record_failure(self, error: Exception):
+        """Count a failed call; only provider-side failures move the breaker"""
+        self.probe_in_flight = False
+        if not is_retryable(error):
+            if self.state == HALF_OPEN:
+                # The provider answered, just not successfully for this prompt
+                self.record_success()
+            return
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.counters["opened"] += 1
+                logger.warning(f"LLM circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            **self.counters
+        }
+
+
+class CallGuard:
+    """
+    Runs LLM calls with a deadline, p95-based hedging and a circuit breaker
+    """
+    
+    def __init__(self, deadline: Optional[float] = None, hedging: Optional[bool] = None,
+                 hedge_quantile: Optional[float] = None, hedge_min_samples: Optional[int] = None,
+                 hedge_min_delay: Optional[float] = None, breaker: Optional[CircuitBreaker] = None,
+                 hedge_budget: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            deadline: Seconds allowed per call including its hedge, 0 for none
+            hedging: Whether slow calls get a hedged duplicate
+            hedge_quantile: Latency quantile after which a call is hedged
+            hedge_min_samples: Successful calls observed before hedging starts
+            hedge_min_delay: Lower bound on the hedge delay in seconds
+            breaker: Circuit breaker, configured from the environment by default
+            hedge_budget: Called before a hedge is sent to charge it to the rate
+                limiter (AnswerScheduler.charge_duplicate); returning False skips
+                the hedge. Without one, hedges are not rate limited.
+        """
+        self.deadline = deadline if deadline is not None else float(os.getenv("LLM_CALL_DEADLINE", "45"))
+        self.hedging = hedging if hedging is not None else (
+            os.getenv("LLM_HEDGING", "false").lower() == "true"
+        )
+        self.hedge_quantile = hedge_quantile if hedge_quantile is not None else float(
+            os.getenv("LLM_HEDGE_QUANTILE", "0.95")
+        )
+        self.hedge_min_samples = hedge_min_samples if hedge_min_samples is not None else int(
+            os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")
+        )
+        self.hedge_min_delay = hedge_min_delay if hedge_min_delay is not None else float(
+            os.getenv("LLM_HEDGE_MIN_DELAY", "0.5")
+        )
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30"))
+        )
+        self.hedge_budget = hedge_budget
+        self.latency = LatencyTracker()
+        self.in_flight = 0
+        self.counters = {
+            "calls": 0, "failures": 0, "deadline_exceeded": 0,
+            "hedged": 0, "hedges_skipped": 0, "hedge_wins": 0, "cancelled_attempts": 0
+        }
+    
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging is off or latencies are unknown"""
+        if not self.hedging or len(self.latency.samples) < self.hedge_min_samples:
+            return None
+        return max(self.latency.percentile(self.hedge_quantile), self.hedge_min_delay)
+    
+    async def call(self, func: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+        """
+        Run one LLM call
+        
+        Args:
+            func: Zero-argument coroutine function performing the call; invoked
+                again for the hedge, so it must be safe to run twice
+            hedge: Allow a hedged duplicate (off for calls with side effects such as streaming)
+        
+        Returns:
+            The result of whichever attempt succeeded first
+        
+        Raises:
+            CircuitOpenError: If the breaker is open
+            DeadlineExceededError: If no attempt finished within the deadline
+            The call's own error if every attempt failed
+        """
+        self.breaker.allow()
+        self.counters["calls"] += 1
+        self.in_flight += 1
+        # A half-open probe is sent alone so it cannot double the load on a recovering provider
+        hedge_delay = self.hedge_delay() if hedge and self.breaker.state == CLOSED else None
+        started = time.monotonic()
+        try:
+            if self.deadline > 0:
+                result = await asyncio.wait_for(self._race(func, hedge_delay), self.deadline)
+            else:
+                result = await self._race(func, hedge_delay)
+        except asyncio.TimeoutError:
+            self.counters["deadline_exceeded"] += 1
+            self.counters["failures"] += 1
+            error = DeadlineExceededError(f"LLM call exceeded its {self.deadline}s deadline")
+            self.breaker.record_failure(error)
+            raise error from None
+        except asyncio.CancelledError:
+            self.breaker.probe_in_flight = False
+            raise
+        except Exception as e:
+            self.counters["failures"] += 1
+            self.breaker.record_failure(e)
+            raise
+        finally:
+            self.in_flight -= 1
+        
+        self.latency.record(time.monotonic() - started)
+        self.breaker.record_success()
+        return result
+    
+    async def _race(self, func: Callable[[], Awaitable[Any]], hedge_delay: Optional[float]) -> Any:
+        """Run func, start a duplicate after hedge_delay, return the first success and cancel the rest"""
+        primary = asyncio.ensure_future(func())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                if self.hedge_budget is None or self.hedge_budget():
+                    self.counters["hedged"] += 1
+                    tasks.append(asyncio.ensure_future(func()))
+                else:
+                    # No rate budget to spare: an unbudgeted duplicate would only earn 429s
+                    self.counters["hedges_skipped"] += 1
+            
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    self.counters["cancelled_attempts"] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state, hedging and deadline counters, and recent latency percentiles"""
+        p50, p95 = self.latency.percentile(0.5), self.latency.percentile(0.95)
+        hedge_delay = self.hedge_delay()
+        return {
+            "circuit": self.breaker.stats(),
+            **self.counters,
+            "in_flight": self.in_flight,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+            "hedge_delay": round(hedge_delay, 3) if hedge_delay is not None else None,
+            "deadline": self.deadline
+        }
@@ -0,0 +1,105 @@
+"""
+Bookkeeping for incrementally updated search indexes
+
+Maps documents to stable chunk ids, tracks deleted chunks as tombstones and
+decides when an index should be compacted.
+"""
+import os
+from typing import Dict, List, Optional
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_DOCUMENT_ID = "default"
+
+
+class ChunkRegistry:
+    """
+    Stable chunk ids per document with tombstone-based deletion
+    
+    Chunk ids are never reused, so index backends can keep them as row or
+    vector ids. Removing a document only tombstones its chunks; the backend
+    physically drops them when compact() is due.
+    """
+    
+    def __init__(self, compaction_ratio: Optional[float] = None):
+        self.compaction_ratio = compaction_ratio if compaction_ratio is not None else float(
+            os.getenv("INDEX_COMPACTION_RATIO", "0.25")
+        )
+        self.reset()
+    
+    def reset(self):
+        """Forget all documents and chunks"""
+        self.texts: Dict[int, str] = {}
+        self.document_chunks: Dict[str, List[int]] = {}
+        self.tombstones = set()
+        self._next_id = 0
+    
+    def add(self, document_id: str, chunks: List[str]) -> List[int]:
+        """
+        Register chunks for a document
+        
+        Args:
+            document_id: Document identifier (must not be registered already)
+            chunks: Text chunks of the document
+        
+        Returns:
+            List of newly assigned chunk ids
+        """
+        if document_id in self.document_chunks:
+            raise ValueError(f"Document already indexed: {document_id}")
+        
+        ids = list(range(self._next_id, self._next_id + len(chunks)))
+        self._next_id += len(chunks)
+        for chunk_id, chunk in zip(ids, chunks):
+            self.texts[chunk_id] = chunk
+        self.document_chunks[document_id] = ids
+        return ids
+    
+    def remove(self, document_id: str) -> List[int]:
+        """
+        Tombstone all chunks of a document
+        
+        Args:
+            document_id: Document identifier
+        
+        Returns:
+            List of tombstoned chunk ids (empty if the document is unknown)
+        """
+        ids = self.document_chunks.pop(document_id, [])
+        self.tombstones.update(ids)
+        return ids
+    
+    def is_live(self, chunk_id: int) -> bool:
+        """Check whether a chunk id refers to a live chunk"""
+        return chunk_id in self.texts and chunk_id not in self.tombstones
+    
+    def live_ids(self) -> List[int]:
+        """Ids of all live chunks in insertion order"""
+        return [chunk_id for chunk_id in self.texts if chunk_id not in self.tombstones]
+    
+    def needs_compaction(self) -> bool:
+        """Whether tombstones make up enough of the index to be worth purging"""
+        if not self.tombstones or not self.texts:
+            return False
+        return len(self.tombstones) / len(self.texts) >= self.compaction_ratio
+    
+    def purge(self) -> List[int]:
+        """
+        Drop tombstoned chunks
+        
+        Returns:
+            List of purged chunk ids, which the backend must remove as well
+        """
+        purged = sorted(self.tombstones)
+        for chunk_id in purged:
+            self.texts.pop(chunk_id, None)
+        self.tombstones.clear()
+        logger.info(f"Purged {len(purged)} tombstoned chunks")
+        return purged
+    
+    @property
+    def num_live(self) -> int:
+        """Number of live chunks"""
+        return len(self.texts) - len(self.tombstones)
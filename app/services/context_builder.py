@@ -0,0 +1,150 @@
+"""
+Token-budgeted context assembly
+
+Retrieved chunks often overlap: sliding-window chunks share their edges and
+clause matches contain whole windows of the same text. The context builder
+drops weak matches, merges overlapping spans into one and packs the result
+up to a token budget instead of joining every retrieved chunk as-is.
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+from app.utils.metrics import timed
+from app.utils.text_processing import estimate_tokens
+
+SEPARATOR = "\n\n"
+
+
+def overlap_length(left: str, right: str, min_overlap: int) -> int:
+    """
+    Length of the longest suffix of left that is a prefix of right
+    
+    Args:
+        left: Text that may end with the start of right
+        right: Text that may start with the end of left
+        min_overlap: Shortest overlap worth merging
+    
+    Returns:
+        Overlap length in characters, or 0 if shorter than min_overlap
+    """
+    if min(len(left), len(right)) < min_overlap:
+        return 0
+    probe = right[:min_overlap]
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        length = len(left) - start
+        if right.startswith(left[start:]):
+            return length
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def merge_spans(texts: List[str], min_overlap: int) -> List[list]:
+    """
+    Merge texts that contain or overlap each other into single spans
+    
+    Args:
+        texts: Candidate texts, most relevant first
+        min_overlap: Shortest edge overlap that joins two texts
+    
+    Returns:
+        List of [text, member positions] spans in order of their most relevant member
+    """
+    spans: List[list] = []
+    for position, text in enumerate(texts):
+        for span in spans:
+            if text in span[0]:
+                span[1].append(position)
+                break
+            if span[0] in text:
+                span[0] = text
+                span[1].append(position)
+                break
+            overlap = overlap_length(span[0], text, min_overlap)
+            if overlap:
+                span[0] = span[0] + text[overlap:]
+                span[1].append(position)
+                break
+            overlap = overlap_length(text, span[0], min_overlap)
+            if overlap:
+                span[0] = text + span[0][overlap:]
+                span[1].append(position)
+                break
+        else:
+            spans.append([text, [position]])
+    return spans
+
+
+class ContextBuilder:
+    """
+    Builds LLM context from retrieved chunks within a token budget
+    """
+    
+    def __init__(self, token_budget: Optional[int] = None, min_relative_score: Optional[float] = None,
+                 min_overlap: Optional[int] = None):
+        """
+        Args:
+            token_budget: Maximum estimated context tokens, 0 for no limit
+            min_relative_score: Chunks scoring below this fraction of the best
+                chunk's score are dropped (scores are not comparable across
+                backends, so the threshold is relative to the top result)
+            min_overlap: Shortest shared edge, in characters, for merging two chunks
+        """
+        self.token_budget = token_budget if token_budget is not None else int(
+            os.getenv("CONTEXT_TOKEN_BUDGET", "0")
+        )
+        self.min_relative_score = min_relative_score if min_relative_score is not None else float(
+            os.getenv("CONTEXT_MIN_RELATIVE_SCORE", "0.3")
+        )
+        self.min_overlap = min_overlap if min_overlap is not None else int(
+            os.getenv("CONTEXT_MIN_OVERLAP_CHARS", "40")
+        )
+    
+    @timed("prompt")
+    def build(self, chunks: List[Dict[str, Any]], token_budget: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Assemble context from retrieved chunks
+        
+        Args:
+            chunks: Search results with 'text' and 'score', most relevant first
+            token_budget: Override of the configured budget (e.g. for packed prompts)
+        
+        Returns:
+            Dictionary with the context 'text', the 'chunks' it was built from,
+            and its estimated 'tokens' next to 'raw_tokens' of the plain join
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        raw_tokens = estimate_tokens(SEPARATOR.join(chunk['text'] for chunk in chunks))
+        
+        # Drop weak matches relative to the best one
+        scores = [chunk.get('score') for chunk in chunks]
+        best = max((score for score in scores if score is not None), default=None)
+        if best is not None and best > 0 and self.min_relative_score > 0:
+            chunks = [
+                chunk for chunk in chunks
+                if chunk.get('score') is None or chunk['score'] >= best * self.min_relative_score
+            ]
+        
+        spans = merge_spans([chunk['text'] for chunk in chunks], self.min_overlap)
+        
+        # Pack spans in relevance order up to the budget
+        parts, used, tokens = [], [], 0
+        for text, members in spans:
+            cost = estimate_tokens(text)
+            if budget and tokens + cost > budget:
+                if parts:
+                    continue
+                # Always keep the most relevant span, truncated to fit
+                text = text[:max(budget - 1, 1) * 4]
+                cost = estimate_tokens(text)
+            parts.append(text)
+            used.extend(chunks[position]['text'] for position in members)
+            tokens += cost
+        
+        text = SEPARATOR.join(parts)
+        return {
+            "text": text,
+            "chunks": used,
+            "tokens": estimate_tokens(text),
+            "raw_tokens": raw_tokens,
+        }
@@ -1,16 +1,14 @@
 import asyncio
 import httpx
-import pypdf
-import docx
 import io
 import os
 from typing import List, Dict, Any
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 
 from app.models.request_models import DocumentInput, DocumentType
 from app.utils.text_processing import clean_text, extract_clauses
 from app.utils.logger import setup_logger
+from app.utils.metrics import timed
 
 logger = setup_logger(__name__)
 
@@ -38,13 +36,14 @@ class DocumentProcessor:
             }
         )
     
+    @timed("parse")
     async def process_document(self, document: DocumentInput) -> List[str]:
         """
         Process a document and return extracted text chunks
         
         Args:
             document: Document input with type and content
-            
+        
         Returns:
             List of text chunks extracted from the document
         """
@@ -61,7 +60,7 @@ class DocumentProcessor:
                 return await self._process_docx_document(document.content)
             else:
                 raise ValueError(f"Unsupported document type: {document.type}")
-                
+        
         except Exception as e:
             logger.error(f"Error processing document: {str(e)}")
             raise
@@ -99,7 +98,7 @@ class DocumentProcessor:
                     # Try as text
                     text_content = content.decode('utf-8', errors='ignore')
                     return await self._process_text_document(text_content)
-                    
+        
         except Exception as e:
             logger.error(f"Error processing URL document: {str(e)}")
             raise
@@ -127,6 +126,8 @@ class DocumentProcessor:
     async def _process_pdf_content(self, content: bytes) -> List[str]:
         """Extract text from PDF content"""
         try:
+            # Parsers are imported on first use to keep them off the startup path
+            import pypdf
             pdf_file = io.BytesIO(content)
             pdf_reader = pypdf.PdfReader(pdf_file)
             
@@ -150,7 +151,7 @@ class DocumentProcessor:
             chunks = extract_clauses(cleaned_text)
             logger.info(f"Extracted {len(chunks)} chunks from PDF document")
             return chunks
-            
+        
         except Exception as e:
             logger.error(f"Error processing PDF content: {str(e)}")
             raise
@@ -158,6 +159,7 @@ class DocumentProcessor:
     async def _process_docx_content(self, content: bytes) -> List[str]:
         """Extract text from DOCX content"""
         try:
+            import docx
             docx_file = io.BytesIO(content)
             document = docx.Document(docx_file)
             
@@ -183,7 +185,7 @@ class DocumentProcessor:
             chunks = extract_clauses(cleaned_text)
             logger.info(f"Extracted {len(chunks)} chunks from DOCX document")
             return chunks
-            
+        
         except Exception as e:
             logger.error(f"Error processing DOCX content: {str(e)}")
             raise
@@ -191,6 +193,7 @@ class DocumentProcessor:
     async def _process_html_content(self, content: str) -> List[str]:
         """Extract text from HTML content"""
         try:
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(content, 'html.parser')
             
             # Remove script and style elements
@@ -208,7 +211,7 @@ class DocumentProcessor:
             chunks = extract_clauses(cleaned_text)
             logger.info(f"Extracted {len(chunks)} chunks from HTML document")
             return chunks
-            
+        
         except Exception as e:
             logger.error(f"Error processing HTML content: {str(e)}")
             raise
@@ -0,0 +1,210 @@
+"""
+Register-once document sessions
+
+A document registered once is processed and indexed into its own index, kept
+under a document id, so follow-up questions only pay for retrieval and the
+LLM call. Sessions expire after a TTL since their last use, and the least
+recently used ones are evicted when the indexes outgrow a memory budget.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils.logger import setup_logger
+from app.utils.text_processing import fingerprint_chunks
+
+logger = setup_logger(__name__)
+
+# Questions a registered document is expected to serve, for the backend choice
+EXPECTED_QUESTIONS = 20
+
+
+class UnknownDocumentError(KeyError):
+    """Raised for document ids that were never registered or have expired"""
+    
+    def __init__(self, document_ids: List[str]):
+        super().__init__(f"Unknown or expired document ids: {', '.join(document_ids)}")
+        self.document_ids = document_ids
+
+
+class DocumentSession:
+    """A registered document and the index built for it"""
+    
+    def __init__(self, document_id: str, router, num_chunks: int, retrieval: Dict[str, Any]):
+        self.document_id = document_id
+        self.router = router
+        self.num_chunks = num_chunks
+        self.retrieval = retrieval
+        self.size = router.index_bytes()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+    
+    def to_dict(self, ttl: float) -> Dict[str, Any]:
+        return {
+            "document_id": self.document_id,
+            "num_chunks": self.num_chunks,
+            "index_bytes": self.size,
+            "retrieval": self.retrieval,
+            "created_at": self.created_at,
+            "expires_at": self.last_used + ttl if ttl else None,
+        }
+
+
+class MultiDocumentRetriever:
+    """
+    Searches several sessions' indexes as one
+    
+    Each document's scores are scaled by its best match before the results
+    are merged, since backends chosen per document score on different scales.
+    """
+    
+    def __init__(self, routers: List[Any]):
+        self.routers = routers
+        self.fingerprint = fingerprint_chunks(sorted(router.fingerprint for router in routers))
+    
+    def embed_query(self, query: str):
+        return self.routers[0].embed_query(query)
+    
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.search_batch([query], top_k=top_k)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        merged = [[] for _ in queries]
+        for router in self.routers:
+            for query_merged, results in zip(merged, router.search_batch(queries, top_k=top_k)):
+                best = max((result["score"] for result in results), default=0.0)
+                for result in results:
+                    query_merged.append({**result, "score": result["score"] / best if best > 0 else result["score"]})
+        for query_merged in merged:
+            query_merged.sort(key=lambda result: result["score"], reverse=True)
+        return [query_merged[:top_k] for query_merged in merged]
+
+
+class DocumentSessionStore:
+    """
+    Registered documents with a TTL and a memory budget
+    """
+    
+    def __init__(self, router, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            router: RetrieverRouter whose loaded backends each session's index shares
+            ttl: Seconds a session lives after its last use, 0 for no expiry
+            max_bytes: Memory budget for all session indexes; least recently
+                used sessions are evicted beyond it
+        """
+        self.router = router
+        self.ttl = ttl if ttl is not None else float(os.getenv("SESSION_TTL", "3600"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024))
+        )
+        self.sessions: "OrderedDict[str, DocumentSession]" = OrderedDict()
+        self.counters = {"registered": 0, "reused": 0, "expired": 0, "evicted": 0, "deleted": 0}
+    
+    @property
+    def total_bytes(self) -> int:
+        return sum(session.size for session in self.sessions.values())
+    
+    def register(self, chunks: List[str], top_k: int = 5) -> Tuple[DocumentSession, bool]:
+        """
+        Index a document's chunks under a new session
+        
+        The document id is derived from the chunks, so registering the same
+        document again returns its live session instead of indexing it twice.
+        
+        Args:
+            chunks: Text chunks of the document
+            top_k: Number of results that will be requested per question
+        
+        Returns:
+            (session, created)
+        """
+        self._expire()
+        document_id = fingerprint_chunks(chunks)
+        session = self._touch(document_id)
+        if session is not None:
+            self.counters["reused"] += 1
+            return session, False
+        
+        router = self.router.spawn()
+        retrieval = router.create_index(chunks, num_queries=EXPECTED_QUESTIONS, top_k=top_k)
+        session = DocumentSession(document_id, router, len(chunks), retrieval)
+        self.sessions[document_id] = session
+        self.counters["registered"] += 1
+        logger.info(f"Registered document {document_id[:12]} ({len(chunks)} chunks, {session.size} bytes)")
+        self._enforce_budget()
+        return session, True
+    
+    def get(self, document_id: str) -> Optional[DocumentSession]:
+        """Return a live session and refresh its TTL, or None"""
+        self._expire()
+        return self._touch(document_id)
+    
+    def retriever(self, document_ids: List[str]):
+        """
+        Retriever over one or more registered documents
+        
+        Raises:
+            UnknownDocumentError: If any id is unknown or expired
+        """
+        self._expire()
+        document_ids = list(dict.fromkeys(document_ids))
+        sessions = [self._touch(document_id) for document_id in document_ids]
+        missing = [document_id for document_id, session in zip(document_ids, sessions) if session is None]
+        if missing:
+            raise UnknownDocumentError(missing)
+        if len(sessions) == 1:
+            return sessions[0].router
+        return MultiDocumentRetriever([session.router for session in sessions])
+    
+    def delete(self, document_id: str) -> bool:
+        """Drop a session; returns whether it existed"""
+        if document_id not in self.sessions:
+            return False
+        self._drop(document_id)
+        self.counters["deleted"] += 1
+        return True
+    
+    def _touch(self, document_id: str) -> Optional[DocumentSession]:
+        session = self.sessions.get(document_id)
+        if session is not None:
+            session.last_used = time.time()
+            self.sessions.move_to_end(document_id)
+        return session
+    
+    def _drop(self, document_id: str):
+        session = self.sessions.pop(document_id)
+        self.router.result_cache.invalidate(session.router.fingerprint)
+    
+    def _expire(self):
+        """Drop sessions unused for longer than the TTL (oldest are first in LRU order)"""
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        while self.sessions:
+            document_id, session = next(iter(self.sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            self._drop(document_id)
+            self.counters["expired"] += 1
+            logger.info(f"Document session {document_id[:12]} expired")
+    
+    def _enforce_budget(self):
+        """Evict least recently used sessions while over the memory budget, always keeping the newest"""
+        total = self.total_bytes
+        while total > self.max_bytes and len(self.sessions) > 1:
+            document_id, session = next(iter(self.sessions.items()))
+            self._drop(document_id)
+            total -= session.size
+            self.counters["evicted"] += 1
+            logger.info(f"Evicted document session {document_id[:12]} to stay within the memory budget")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            **self.counters
+        }
@@ -0,0 +1,276 @@
+"""
+Extractive answers for structured policy facts
+
+Questions such as the grace period or the room rent limit ask for a single
+value that the top retrieved clause usually states verbatim. Pattern
+extractors pull those values out of each chunk once, when the document is
+ingested, so answering such a question is a dictionary lookup over the
+retrieved chunks instead of an LLM call. Anything not matched with high
+confidence is left to the LLM.
+"""
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_WORD_NUMBERS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "eighteen": 18, "twenty": 20,
+    "twenty four": 24, "thirty": 30, "thirty six": 36, "forty five": 45, "forty eight": 48,
+    "sixty": 60, "ninety": 90,
+}
+_NUMBER = r"(?:\d+|" + "|".join(sorted((w.replace(" ", r"[\s-]") for w in _WORD_NUMBERS), key=len, reverse=True)) + r")"
+# A number optionally restated in brackets: "36 (thirty six)", "thirty (30)"
+_COUNT = rf"{_NUMBER}(?:\s*\(\s*{_NUMBER}\s*\))?"
+# PDF extraction often spaces out digit groups: "Rs. 10 ,000/-"
+_AMOUNT = r"(?:Rs\.?|INR|₹)\s?\d+(?:\s?,\s?\d+)*(?:\.\d+)?(?:\s?/\s?-)?(?:\s?(?:lakhs?|lacs?|crores?|L\b|Cr\b))?"
+_SUM_INSURED = r"(?:th\s?e\s+)?sum\s+insured"
+_LIMIT = (
+    rf"(?:\d+(?:\.\d+)?\s?%\s*of\s*{_SUM_INSURED}(?:,?\s*subject to (?:a\s+)?maximum of\s*{_AMOUNT}"
+    rf"(?:\s*per day)?)?|{_AMOUNT}(?:\s*per day)?)"
+)
+_PRE_EXISTING = r"pre\s?-\s?existing|pre\s?existing|\bPED\b"
+
+# Abbreviations whose period does not end a sentence
+_SENTENCE_BREAK = re.compile(r"(?<=[.;])(?<!Rs\.)(?<!No\.)(?<!viz\.)\s+(?=[A-Z0-9(])")
+
+# Ordered so that the more specific fact wins (ICU before room rent, PED before waiting period).
+# A clause pattern only runs on sentences containing one of the fact's lowercase triggers.
+FACTS: List[Dict[str, Any]] = [
+    {
+        "kind": "icu_room_rent_limit",
+        "label": "The ICU room rent limit",
+        "question": r"\bicu\b|\biccu\b|intensive care",
+        "triggers": ("icu", "iccu", "intensive care"),
+        "clauses": [rf"(?:\bICU\b|\bICCU\b|intensive care).{{0,160}}?\b(?:up ?to|limit(?:ed)? (?:to|of)|maximum of)\s*({_LIMIT})"],
+    },
+    {
+        "kind": "room_rent_limit",
+        "label": "The room rent limit",
+        "question": r"room rent",
+        "triggers": ("room rent",),
+        "clauses": [rf"room rent.{{0,160}}?\b(?:up ?to|limit(?:ed)? (?:to|of)|maximum of)\s*({_LIMIT})"],
+        "exclude_clause": r"\bICU\b|\bICCU\b|intensive care",
+    },
+    {
+        "kind": "grace_period",
+        "label": "The grace period for premium payment",
+        "question": r"grace period",
+        "triggers": ("grace period",),
+        "clauses": [rf"grace period.{{0,80}}?\b({_COUNT}\s*days)"],
+    },
+    {
+        "kind": "pre_existing_waiting_period",
+        "label": "The waiting period for pre-existing diseases",
+        "question": rf"waiting period.*(?:{_PRE_EXISTING})|(?:{_PRE_EXISTING}).*waiting period",
+        "triggers": ("existing", "(ped", " ped"),
+        "clauses": [rf"(?:{_PRE_EXISTING}).{{0,200}}?\b({_COUNT}\s*(?:months|years))"],
+    },
+    {
+        "kind": "initial_waiting_period",
+        "label": "The initial waiting period",
+        "question": r"\bwaiting period\b",
+        # Only the generic question; "the waiting period for hernia surgery" or "for accidents"
+        # asks for a specific waiting period (or an exception) this clause does not state
+        "generic_words": {
+            "what", "is", "are", "the", "a", "an", "there", "any", "how", "long", "many", "days", "does",
+            "do", "it", "its", "this", "my", "of", "for", "under", "in", "to", "on", "apply", "applies",
+            "applicable", "policy", "policies", "plan", "waiting", "period", "initial", "first", "general", "standard",
+            "new", "claim", "claims", "illness", "illnesses", "disease", "diseases", "all", "cover", "coverage",
+        },
+        "triggers": ("first", "initial"),
+        "clauses": [
+            rf"\b(?:first|initial)\s+({_COUNT}\s*days)\s+waiting period",
+            rf"\b(?:first|initial)\s+waiting period.{{0,40}}?\b({_COUNT}\s*days)",
+        ],
+    },
+    {
+        "kind": "sum_insured",
+        "label": "The sum insured",
+        "question": r"\bsum insured\b",
+        "triggers": ("sum insured",),
+        "clauses": [
+            rf"sum insured(?:\s+(?:is|of|options?|available|ranging|from|up ?to|:|-))*\s*:?\s*"
+            rf"({_AMOUNT}(?:\s*(?:to|-)\s*{_AMOUNT})?)"
+        ],
+    },
+    {
+        "kind": "claim_intimation_limit",
+        "label": "The claim intimation time limit",
+        "question": r"intimat",
+        "triggers": ("intimat",),
+        "clauses": [rf"intimat.{{0,160}}?\bwithin\s+({_COUNT}\s*(?:hours|hrs|days))"],
+    },
+]
+
+for _fact in FACTS:
+    _fact["question_re"] = re.compile(_fact["question"], re.IGNORECASE)
+    _fact["clause_res"] = [re.compile(pattern, re.IGNORECASE) for pattern in _fact["clauses"]]
+    _fact["exclude_re"] = re.compile(_fact["exclude_clause"], re.IGNORECASE) if "exclude_clause" in _fact else None
+
+
+def normalize_value(value: str) -> str:
+    """Canonical form of an extracted value, so "thirty days" and "30 days" or "3 years" and "36 months" compare equal"""
+    value = re.sub(r"\(\s*[^)]*\)", "", value.lower().replace("-", " "))
+    value = re.sub(r"\s+", " ", value).strip()
+    for word in sorted(_WORD_NUMBERS, key=len, reverse=True):
+        value = re.sub(rf"\b{word}\b", str(_WORD_NUMBERS[word]), value)
+    value = re.sub(r"\b(\d+)\s*years?\b", lambda match: f"{int(match.group(1)) * 12} months", value)
+    return re.sub(r"[\s,/]|per ?day", "", value)
+
+
+def _excerpt(sentence: str, match: re.Match, limit: int = 300) -> str:
+    """The sentence, or the part of it around the match if it is long (e.g. a flattened table row)"""
+    sentence = sentence.strip()
+    if len(sentence) <= limit:
+        return sentence
+    start = sentence.rfind(" ", 0, max(0, match.start() - 40)) + 1
+    end = sentence.find(" ", min(len(sentence), start + limit))
+    end = len(sentence) if end < 0 else end
+    return ("..." if start > 0 else "") + sentence[start:end].strip() + ("..." if end < len(sentence) else "")
+
+
+def extract_facts(text: str) -> List[Dict[str, str]]:
+    """
+    Extract structured facts from one chunk
+    
+    Args:
+        text: Chunk text
+    
+    Returns:
+        List of {"kind", "value", "sentence"} dictionaries
+    """
+    lowered = text.lower()
+    candidates = [fact for fact in FACTS if any(trigger in lowered for trigger in fact["triggers"])]
+    if not candidates:
+        return []
+    
+    facts = []
+    for sentence in _SENTENCE_BREAK.split(text):
+        lowered = sentence.lower()
+        for fact in candidates:
+            if not any(trigger in lowered for trigger in fact["triggers"]):
+                continue
+            if fact["exclude_re"] is not None and fact["exclude_re"].search(sentence):
+                continue
+            for pattern in fact["clause_res"]:
+                match = pattern.search(sentence)
+                if match:
+                    facts.append({
+                        "kind": fact["kind"],
+                        "value": re.sub(r"\s+", " ", match.group(1)).strip(),
+                        "sentence": _excerpt(sentence, match),
+                    })
+                    break
+    return facts
+
+
+def classify_question(question: str) -> Optional[Dict[str, Any]]:
+    """The fact a question asks for, or None if it is not a single-value question"""
+    for fact in FACTS:
+        if not fact["question_re"].search(question):
+            continue
+        if "generic_words" in fact and set(re.findall(r"[a-z]+", question.lower())) - fact["generic_words"]:
+            continue
+        return fact
+    return None
+
+
+class ExtractiveAnswerer:
+    """
+    Answers single-value questions from facts extracted at ingest time
+    """
+    
+    def __init__(self, min_confidence: Optional[float] = None, max_chunks: Optional[int] = None):
+        """
+        Args:
+            min_confidence: Confidence an extracted answer needs to bypass the LLM
+            max_chunks: Chunks whose extracted facts are kept (least recently used are dropped)
+        """
+        self.min_confidence = min_confidence if min_confidence is not None else float(
+            os.getenv("EXTRACTIVE_MIN_CONFIDENCE", "0.8")
+        )
+        self.max_chunks = max_chunks or int(os.getenv("EXTRACTIVE_MAX_CHUNKS", "20000"))
+        self._facts: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+    
+    def index(self, chunks: List[str]) -> int:
+        """
+        Extract facts from newly ingested chunks
+        
+        Args:
+            chunks: Chunk texts of a document
+        
+        Returns:
+            Number of facts extracted
+        """
+        found = 0
+        for chunk in chunks:
+            found += len(self._chunk_facts(chunk))
+        logger.info(f"Extracted {found} facts from {len(chunks)} chunks")
+        return found
+    
+    def _chunk_facts(self, chunk: str) -> List[Dict[str, str]]:
+        facts = self._facts.get(chunk)
+        if facts is None:
+            # Chunks ingested without index() are extracted on first use
+            facts = extract_facts(chunk)
+            self._facts[chunk] = facts
+            if len(self._facts) > self.max_chunks:
+                self._facts.popitem(last=False)
+        else:
+            self._facts.move_to_end(chunk)
+        return facts
+    
+    def answer(self, question: str, chunks: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Answer a question from the facts of its retrieved chunks
+        
+        The answer is taken from the highest-ranked chunk stating the fact.
+        Confidence drops with that chunk's rank and when the retrieved chunks
+        state conflicting values, and rises when several chunks agree.
+        
+        Args:
+            question: Question text
+            chunks: Retrieved chunks with 'text', most relevant first
+        
+        Returns:
+            Dictionary with 'answer', 'value', 'kind', 'sentence' and
+            'confidence', or None if the LLM should answer instead
+        """
+        fact = classify_question(question)
+        if fact is None:
+            return None
+        
+        found = []
+        for rank, chunk in enumerate(chunks):
+            for candidate in self._chunk_facts(chunk['text']):
+                if candidate["kind"] == fact["kind"]:
+                    found.append((rank, candidate))
+        if not found:
+            return None
+        
+        rank, best = found[0]
+        confidence = 0.9 if rank == 0 else 0.85 if rank <= 2 else 0.7
+        values = {normalize_value(candidate["value"]) for _, candidate in found}
+        if len(values) > 1:
+            confidence -= 0.2
+        elif len({chunk_rank for chunk_rank, _ in found}) > 1:
+            # Corroborated by more than one retrieved chunk
+            confidence += 0.05
+        if confidence < self.min_confidence:
+            return None
+        
+        return {
+            "kind": fact["kind"],
+            "value": best["value"],
+            "sentence": best["sentence"],
+            "answer": f"{fact['label']} is {best['value']}, as stated in the policy: \"{best['sentence']}\"",
+            "confidence": round(confidence, 2),
+        }
+    
+    def stats(self) -> Dict[str, int]:
+        return {"indexed_chunks": len(self._facts)}
@@ -0,0 +1,232 @@
+"""
+Native async Gemini client over the REST API
+
+Calls generateContent with a pooled httpx.AsyncClient instead of pushing the
+blocking SDK call onto the default thread pool, so concurrent questions do not
+queue behind a handful of executor threads. Every call has its own timeout
+and the number of in-flight calls is capped.
+"""
+import asyncio
+import os
+import json
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+
+class GeminiAPIError(Exception):
+    """Error response from the Gemini API"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class GeminiTimeoutError(GeminiAPIError, TimeoutError):
+    """A Gemini call did not complete within its timeout"""
+
+
+class GeminiConnectionError(GeminiAPIError, ConnectionError):
+    """A Gemini call failed before a response was received"""
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Parse a Retry-After header given in seconds"""
+    try:
+        return float(response.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+def _api_error(response: httpx.Response) -> GeminiAPIError:
+    """Build the error for a non-200 response whose body has been read"""
+    try:
+        message = response.json().get("error", {}).get("message", response.text)
+    except ValueError:
+        message = response.text
+    return GeminiAPIError(
+        f"Gemini API error {response.status_code}: {message}",
+        status_code=response.status_code,
+        retry_after=_retry_after(response)
+    )
+
+
+def _candidate_text(data: Dict[str, Any]) -> str:
+    """Text of the first candidate with any, or an empty string"""
+    for candidate in data.get("candidates", []):
+        parts = candidate.get("content", {}).get("parts", [])
+        text = "".join(part.get("text", "") for part in parts)
+        if text:
+            return text
+    return ""
+
+
+class GeminiRestClient:
+    """
+    Async generateContent client with a connection pool, per-call timeout and concurrency limit
+    """
+    
+    def __init__(self, api_key: str, model_name: str, timeout: Optional[float] = None,
+                 max_connections: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 base_url: Optional[str] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Args:
+            api_key: Gemini API key
+            model_name: Model to call, e.g. "gemini-1.5-flash"
+            timeout: Seconds allowed per call
+            max_connections: Size of the HTTP connection pool
+            max_concurrency: Maximum calls in flight at once
+            base_url: API root, overridable for proxies
+            transport: Custom httpx transport (used by tests)
+        """
+        self.api_key = api_key
+        self.model_name = model_name[len("models/"):] if model_name.startswith("models/") else model_name
+        self.timeout = timeout or float(os.getenv("LLM_HTTP_TIMEOUT", "30"))
+        self.max_connections = max_connections or int(os.getenv("LLM_HTTP_POOL_SIZE", "16"))
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_HTTP_CONCURRENCY", "8"))
+        self.base_url = (base_url or os.getenv("GEMINI_API_BASE", DEFAULT_BASE_URL)).rstrip("/")
+        self._transport = transport
+        
+        # The client and semaphore belong to the event loop they were created on
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self._closing: set = set()
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._retire_client(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 10.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                headers={"x-goog-api-key": self.api_key, "Content-Type": "application/json"},
+                transport=self._transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+    
+    def _retire_client(self, client: httpx.AsyncClient, loop):
+        """Close the pool of a client created on another event loop"""
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            # Still serving another thread: close it there
+            asyncio.run_coroutine_threadsafe(self._close_quietly(client), loop)
+            return
+        task = asyncio.ensure_future(self._close_quietly(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+    
+    @staticmethod
+    async def _close_quietly(client: httpx.AsyncClient):
+        try:
+            await client.aclose()
+        except Exception as e:
+            # Connections bound to a closed loop may fail to shut down cleanly
+            logger.debug(f"Error closing a retired HTTP client: {e}")
+    
+    async def generate(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Generate text for a prompt
+        
+        Args:
+            prompt: Prompt text
+            generation_config: generationConfig fields (maxOutputTokens, temperature, ...)
+        
+        Returns:
+            Text of the first candidate
+        
+        Raises:
+            GeminiAPIError: On an error response, a timeout, a connection failure
+                or a response without text
+        """
+        client = self._get_client()
+        payload = self._payload(prompt, generation_config)
+        
+        async with self._semaphore:
+            try:
+                response = await client.post(f"/models/{self.model_name}:generateContent", json=payload)
+            except httpx.TimeoutException as e:
+                raise GeminiTimeoutError(f"Gemini call timed out after {self.timeout}s") from e
+            except httpx.TransportError as e:
+                raise GeminiConnectionError(f"Gemini connection failed: {e}") from e
+        
+        if response.status_code != 200:
+            raise _api_error(response)
+        
+        data = response.json()
+        text = _candidate_text(data)
+        if text:
+            return text
+        feedback = data.get("promptFeedback", {}).get("blockReason", "no candidates")
+        raise GeminiAPIError(f"Gemini returned no text ({feedback})")
+    
+    async def stream_generate(self, prompt: str,
+                              generation_config: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        Generate text for a prompt, yielding it piece by piece as the model produces it
+        
+        Args:
+            prompt: Prompt text
+            generation_config: generationConfig fields (maxOutputTokens, temperature, ...)
+        
+        Yields:
+            Text deltas of the first candidate
+        
+        Raises:
+            GeminiAPIError: As for generate()
+        """
+        client = self._get_client()
+        payload = self._payload(prompt, generation_config)
+        
+        async with self._semaphore:
+            received = False
+            try:
+                async with client.stream(
+                    "POST", f"/models/{self.model_name}:streamGenerateContent", params={"alt": "sse"}, json=payload
+                ) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise _api_error(response)
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        text = _candidate_text(json.loads(line[len("data:"):]))
+                        if text:
+                            received = True
+                            yield text
+            except httpx.TimeoutException as e:
+                raise GeminiTimeoutError(f"Gemini call timed out after {self.timeout}s") from e
+            except httpx.TransportError as e:
+                raise GeminiConnectionError(f"Gemini connection failed: {e}") from e
+        
+        if not received:
+            raise GeminiAPIError("Gemini returned no text (empty stream)")
+    
+    @staticmethod
+    def _payload(prompt: str, generation_config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Request body for a single-turn prompt"""
+        payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return payload
+    
+    async def aclose(self):
+        """Close the connection pool, and finish closing retired ones"""
+        if self._closing:
+            await asyncio.gather(*list(self._closing), return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
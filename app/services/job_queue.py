@@ -0,0 +1,409 @@
+"""
+Asynchronous Q&A jobs
+
+Long question batches can be submitted as jobs instead of holding an HTTP
+connection open for the whole ingest and answer pipeline. Jobs are kept in a
+SQLite table, so their status and results survive a restart, and run on a
+pool of in-process workers. Answers are recorded as each question completes,
+so clients polling a running job see partial results. A client-supplied
+idempotency key maps retries of the same submission onto the existing job.
+Worker processes sharing the store claim a job before running it, so a job
+is run by one process at a time.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.utils.logger import bind_request_id, setup_logger
+from app.utils.metrics import start_breakdown
+
+logger = setup_logger(__name__)
+
+# Request header carrying the client's idempotency key
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Runs one job: handler(request, options, on_answer) -> final result.
+# on_answer(position, answer) records an answer as soon as it is ready.
+JobHandler = Callable[[Dict[str, Any], Dict[str, Any], Callable[[int, Dict[str, Any]], None]],
+                      Awaitable[Dict[str, Any]]]
+
+
+class IdempotencyConflictError(Exception):
+    """An idempotency key was reused with a different request body"""
+
+
+def request_hash(request: Dict[str, Any]) -> str:
+    """Stable hash of a request body, to tell a retry from a different request under the same key"""
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """
+    SQLite table of jobs with their request, progress and result
+    """
+    
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            path: SQLite database file (":memory:" for a process-local store)
+            ttl: Seconds finished jobs (and their idempotency keys) are kept, 0 to keep them forever
+        """
+        self.path = path or os.getenv("JOB_STORE_PATH", "data/jobs.sqlite3")
+        self.ttl = ttl if ttl is not None else float(os.getenv("JOB_TTL", "86400"))
+        
+        if self.path != ":memory:":
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._db = self._connect()
+        
+        logger.info(f"Initialized job store at {self.path}")
+    
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # A connection must not be used across fork(), so each worker process opens its own
+        if self._pid != os.getpid():
+            self._db = self._connect()
+            self._pid = os.getpid()
+        return self._db
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                idempotency_key TEXT UNIQUE,
+                request_hash TEXT NOT NULL,
+                request TEXT NOT NULL,
+                options TEXT NOT NULL,
+                status TEXT NOT NULL,
+                answers TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner INTEGER,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        # Stores created before jobs were claimed by process
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        return conn
+    
+    def create(self, request: Dict[str, Any], idempotency_key: Optional[str] = None,
+               options: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Record a new job, or find the one already submitted under the idempotency key
+        
+        Args:
+            request: Request body; its "questions" list sizes the answer slots
+            idempotency_key: Optional client key identifying retries of one submission
+            options: Request options that are not part of the body (e.g. cache bypass)
+        
+        Returns:
+            (job, created) where created is False if an existing job was returned
+        
+        Raises:
+            IdempotencyConflictError: If the key was used for a different request
+        """
+        now = time.time()
+        digest = request_hash(request)
+        with self._lock:
+            self._purge(now)
+            if idempotency_key is not None:
+                row = self._conn.execute(
+                    "SELECT id, request_hash FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                if row is not None:
+                    if row[1] != digest:
+                        raise IdempotencyConflictError(
+                            f"Idempotency key '{idempotency_key}' was already used for a different request"
+                        )
+                    return self._get(row[0]), False
+            
+            job_id = uuid.uuid4().hex
+            answers = [None] * len(request.get("questions", []))
+            self._conn.execute(
+                """INSERT INTO jobs (id, idempotency_key, request_hash, request, options, status, answers,
+                   created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, idempotency_key, digest, json.dumps(request), json.dumps(options or {}),
+                 QUEUED, json.dumps(answers), now, now)
+            )
+            return self._get(job_id), True
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job, or None if it does not exist or has expired"""
+        with self._lock:
+            return self._get(job_id)
+    
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            """SELECT id, idempotency_key, request, options, status, answers, result, error, attempts,
+               created_at, updated_at FROM jobs WHERE id = ?""", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "idempotency_key": row[1],
+            "request": json.loads(row[2]),
+            "options": json.loads(row[3]),
+            "status": row[4],
+            "answers": json.loads(row[5]),
+            "result": json.loads(row[6]) if row[6] is not None else None,
+            "error": row[7],
+            "attempts": row[8],
+            "created_at": row[9],
+            "updated_at": row[10],
+        }
+    
+    def claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Mark a job as running in this process, clearing answers from any interrupted attempt
+        
+        Several worker processes share the store and all requeue its
+        unfinished jobs on start, so the claim is a compare-and-set: a job
+        running in another live process is left alone.
+        
+        Returns:
+            The claimed job, or None if it is finished, unknown or owned elsewhere
+        """
+        pid = os.getpid()
+        with self._lock:
+            row = self._conn.execute("SELECT status, owner, answers FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            status, owner, answers = row
+            if status not in (QUEUED, RUNNING):
+                return None
+            if status == RUNNING and owner not in (None, pid) and _process_alive(owner):
+                return None
+            cursor = self._conn.execute(
+                """UPDATE jobs SET status = ?, owner = ?, answers = ?, attempts = attempts + 1, updated_at = ?
+                   WHERE id = ? AND status = ? AND owner IS ?""",
+                (RUNNING, pid, json.dumps([None] * len(json.loads(answers))), time.time(), job_id, status, owner)
+            )
+            if cursor.rowcount != 1:
+                return None
+            return self._get(job_id)
+    
+    def record_answer(self, job_id: str, position: int, answer: Dict[str, Any]):
+        """Store the answer to one question of a running job"""
+        with self._lock:
+            row = self._conn.execute("SELECT answers FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            answers = json.loads(row[0])
+            answers[position] = answer
+            self._conn.execute(
+                "UPDATE jobs SET answers = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(answers), time.time(), job_id)
+            )
+    
+    def finish(self, job_id: str, result: Dict[str, Any]):
+        """Store a job's final result"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                (SUCCEEDED, json.dumps(result), time.time(), job_id)
+            )
+    
+    def fail(self, job_id: str, error: str):
+        """Mark a job as failed; answers recorded so far are kept"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), job_id)
+            )
+    
+    def unfinished(self) -> List[str]:
+        """Ids of queued or running jobs, oldest first (to resume after a restart)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
+    
+    def _purge(self, now: float):
+        """Drop finished jobs past their TTL"""
+        if self.ttl:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (SUCCEEDED, FAILED, now - self.ttl)
+            )
+    
+    def stats(self) -> Dict[str, int]:
+        """Number of stored jobs by status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+
+class JobQueue:
+    """
+    Pool of in-process workers running jobs from a JobStore
+    """
+    
+    def __init__(self, store: JobStore, handler: JobHandler, workers: Optional[int] = None,
+                 max_attempts: Optional[int] = None):
+        """
+        Args:
+            store: Where jobs are recorded
+            handler: Coroutine function running one job
+            workers: Jobs run at the same time. Each job builds its own
+                retrieval index; ingestion is still bounded by admission
+                control and LLM calls by the shared scheduler
+            max_attempts: Times a job interrupted by a restart is started before it is failed
+        """
+        self.store = store
+        self.handler = handler
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.counters = {"submitted": 0, "deduplicated": 0, "resumed": 0, "succeeded": 0, "failed": 0}
+    
+    async def start(self):
+        """Start the workers and requeue jobs left unfinished by a previous process"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        for job_id in self.store.unfinished():
+            self._queue.put_nowait(job_id)
+            self.counters["resumed"] += 1
+        if self.counters["resumed"]:
+            logger.info(f"Resuming {self.counters['resumed']} unfinished jobs")
+        self._tasks = [asyncio.ensure_future(self._work(worker)) for worker in range(self.workers)]
+    
+    async def stop(self):
+        """Cancel the workers; running jobs stay marked running and are resumed on the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    async def submit(self, request: Dict[str, Any], idempotency_key: Optional[str] = None,
+                     options: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a job, or return the existing one for a repeated idempotency key
+        
+        Returns:
+            (job, created)
+        
+        Raises:
+            IdempotencyConflictError: If the key was used for a different request
+        """
+        await self.start()
+        job, created = self.store.create(request, idempotency_key, options)
+        if created:
+            self.counters["submitted"] += 1
+            self._queue.put_nowait(job["id"])
+            logger.info(f"Queued job {job['id']} with {len(job['answers'])} questions")
+        else:
+            self.counters["deduplicated"] += 1
+            logger.info(f"Idempotency key matched existing job {job['id']} ({job['status']})")
+        return job, created
+    
+    async def _work(self, worker: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job_id: str):
+        # The job's log records are correlated by its id, and its stage times collected like a request's
+        bind_request_id(job_id)
+        start_breakdown()
+        job = self.store.claim(job_id)
+        if job is None:
+            return
+        if job["attempts"] > self.max_attempts:
+            self.store.fail(job_id, f"Job interrupted {job['attempts'] - 1} times")
+            self.counters["failed"] += 1
+            return
+        
+        started = time.perf_counter()
+        try:
+            result = await self.handler(
+                job["request"], job["options"],
+                lambda position, answer: self.store.record_answer(job_id, position, answer)
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # HTTPException carries its message in .detail
+            detail = getattr(e, "detail", None) or str(e)
+            logger.error(f"Job {job_id} failed: {detail}")
+            self.store.fail(job_id, detail)
+            self.counters["failed"] += 1
+            return
+        self.store.finish(job_id, result)
+        self.counters["succeeded"] += 1
+        logger.info(f"Job {job_id} finished in {time.perf_counter() - started:.2f}s")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": self.store.stats(),
+            **self.counters
+        }
+
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Client view of a job
+    
+    Answers recorded so far are listed with their question index while the
+    job runs; once it succeeds the full result is included.
+    """
+    answered = [
+        {"index": position, **answer} for position, answer in enumerate(job["answers"]) if answer is not None
+    ]
+    status = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "total_questions": len(job["answers"]),
+        "answered": len(answered),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["status"] == SUCCEEDED:
+        status["result"] = job["result"]
+    else:
+        status["answers"] = answered
+    if job["error"] is not None:
+        status["error"] = job["error"]
+    return status
@@ -1,63 +1,395 @@
 """
 Lightweight vector search service using scikit-learn instead of FAISS
 For deployment environments where FAISS compilation fails
+
+Two modes are supported:
+- "fit": a TfidfVectorizer fitted on every create_index call (original behaviour)
+- "hashing": a stateless HashingVectorizer with IDF statistics persisted to disk,
+  so indexing needs no fit and all questions can be scored in one sparse product
 """
+import atexit
 import logging
+import os
+import threading
+from contextlib import contextmanager
 import numpy as np
+import scipy.sparse as sp
 from typing import List, Dict, Any, Optional
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not locked across processes
+    fcntl = None
 
+from app.services.chunk_registry import ChunkRegistry, DEFAULT_DOCUMENT_ID
 from app.utils.logger import setup_logger
+from app.utils.metrics import stage, timed
+from app.utils.text_processing import fingerprint_chunks
 
 logger = setup_logger(__name__)
 
+HASHING_N_FEATURES = 2 ** 18
+
+
+class IdfStatistics:
+    """
+    Document-frequency counts over hashed features, persisted between runs
+    
+    Each distinct corpus (identified by a fingerprint of its chunks) is counted
+    once, so re-indexing the same policy does not skew the statistics.
+    
+    New corpora are saved in the background, batched over TFIDF_IDF_SAVE_DELAY
+    seconds, so indexing never waits on disk. A save merges this process's new
+    corpora into the counts on disk under a file lock, so workers sharing the
+    file add to each other's statistics instead of overwriting them.
+    """
+    
+    def __init__(self, path: str, n_features: int = HASHING_N_FEATURES, save_delay: float = None):
+        self.path = path
+        self.n_features = n_features
+        self.save_delay = save_delay if save_delay is not None else float(os.getenv("TFIDF_IDF_SAVE_DELAY", "5"))
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        self.n_docs = 0
+        self.seen_corpora = set()
+        # Corpora counted in memory but not yet saved: fingerprint -> (features, counts, chunks)
+        self._pending: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._load()
+        atexit.register(self.save)
+    
+    def _load(self):
+        """Load statistics from disk if a compatible file exists"""
+        loaded = self._read()
+        if loaded is None:
+            return
+        self.doc_freq, self.n_docs, self.seen_corpora = loaded
+        logger.info(f"Loaded IDF statistics for {self.n_docs} chunks from {self.path}")
+    
+    def _read(self) -> Optional[tuple]:
+        """(doc_freq, n_docs, seen_corpora) from disk, or None if there is no compatible file"""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                doc_freq = data["doc_freq"]
+                if doc_freq.shape[0] != self.n_features:
+                    logger.warning(f"Ignoring IDF statistics at {self.path}: feature size mismatch")
+                    return None
+                return doc_freq.astype(np.int64), int(data["n_docs"]), set(data["seen_corpora"].tolist())
+        except Exception as e:
+            logger.warning(f"Could not load IDF statistics from {self.path}: {e}")
+            return None
+    
+    def _write(self, doc_freq: np.ndarray, n_docs: int, seen_corpora: set):
+        # Written beside the target and renamed over it, so readers never see a partial file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            doc_freq=doc_freq,
+            n_docs=np.array(n_docs),
+            seen_corpora=np.array(sorted(seen_corpora), dtype=str)
+        )
+        os.replace(tmp_path, self.path)
+    
+    def schedule_save(self):
+        """Save pending corpora in the background after save_delay seconds, batching later updates into the same save"""
+        if not self.path:
+            return
+        with self._lock:
+            # A timer started before a fork does not run in the child
+            if self._timer is not None and self._timer.is_alive():
+                return
+            self._timer = threading.Timer(self.save_delay, self.save)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def save(self):
+        """Merge pending corpora into the statistics on disk and adopt the merged counts"""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with _file_lock(f"{self.path}.lock"):
+                    loaded = self._read()
+                    if loaded is None:
+                        loaded = (np.zeros(self.n_features, dtype=np.int64), 0, set())
+                    doc_freq, n_docs, seen_corpora = loaded
+                    for fingerprint, (features, counts, chunks) in pending.items():
+                        # Another worker may have counted the same corpus since we last read
+                        if fingerprint in seen_corpora:
+                            continue
+                        doc_freq[features] += counts
+                        n_docs += chunks
+                        seen_corpora.add(fingerprint)
+                    self._write(doc_freq, n_docs, seen_corpora)
+            except Exception as e:
+                logger.warning(f"Could not save IDF statistics to {self.path}: {e}")
+                with self._lock:
+                    self._pending = {**pending, **self._pending}
+                return
+            
+            with self._lock:
+                # Corpora added while saving stay pending, on top of the merged counts
+                for fingerprint, (features, counts, chunks) in self._pending.items():
+                    if fingerprint not in seen_corpora:
+                        doc_freq[features] += counts
+                        n_docs += chunks
+                        seen_corpora.add(fingerprint)
+                self.doc_freq, self.n_docs, self.seen_corpora = doc_freq, n_docs, seen_corpora
+    
+    def update(self, term_counts, corpus_fingerprint: str) -> bool:
+        """
+        Add document frequencies of a new corpus
+        
+        Args:
+            term_counts: Sparse chunk-by-feature count matrix
+            corpus_fingerprint: Stable identifier of the corpus
+        
+        Returns:
+            bool: True if the statistics changed
+        """
+        present = term_counts.copy()
+        present.data = np.ones_like(present.data)
+        counts = np.asarray(present.sum(axis=0)).ravel().astype(np.int64)
+        features = np.flatnonzero(counts)
+        with self._lock:
+            if corpus_fingerprint in self.seen_corpora:
+                return False
+            doc_freq = self.doc_freq.copy()
+            doc_freq[features] += counts[features]
+            self.doc_freq = doc_freq
+            self.n_docs += term_counts.shape[0]
+            self.seen_corpora.add(corpus_fingerprint)
+            self._pending[corpus_fingerprint] = (features, counts[features], term_counts.shape[0])
+        return True
+    
+    def idf(self) -> np.ndarray:
+        """Smoothed IDF weights, matching TfidfVectorizer(smooth_idf=True)"""
+        return np.log((1.0 + self.n_docs) / (1.0 + self.doc_freq)) + 1.0
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock across processes, where the platform supports it"""
+    with open(path, "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
 class LightweightVectorSearch:
     """
     Lightweight vector search using TF-IDF and cosine similarity
     Alternative to FAISS for deployment environments
     """
     
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            max_features=5000,
-            stop_words='english',
-            ngram_range=(1, 2),
-            max_df=0.8,
-            min_df=2
-        )
+    def __init__(self, mode: Optional[str] = None, idf_path: Optional[str] = None,
+                 idf_stats: Optional[IdfStatistics] = None):
+        self.mode = (mode or os.getenv("TFIDF_MODE", "fit")).lower()
+        if self.mode not in ("fit", "hashing"):
+            raise ValueError(f"Unsupported TF-IDF mode: {self.mode}")
+        
+        if self.mode == "hashing":
+            self.vectorizer = HashingVectorizer(
+                n_features=HASHING_N_FEATURES,
+                stop_words='english',
+                ngram_range=(1, 2),
+                alternate_sign=False,
+                norm=None
+            )
+            # Indexes spawned from one another share a single copy of the statistics
+            self.idf_stats = idf_stats or IdfStatistics(
+                idf_path or os.getenv("TFIDF_IDF_PATH", "data/tfidf_idf_stats.npz")
+            )
+        else:
+            self.vectorizer = TfidfVectorizer(
+                max_features=5000,
+                stop_words='english',
+                ngram_range=(1, 2),
+                max_df=0.8,
+                min_df=2
+            )
+            self.idf_stats = None
+        self.idf = None
+        self.term_counts = None
         self.chunk_vectors = None
-        self.chunks = []
+        self.row_ids = np.zeros(0, dtype=np.int64)
+        self.row_live = np.zeros(0, dtype=bool)
+        self.registry = ChunkRegistry()
         self.is_fitted = False
         
-        logger.info("Initialized lightweight vector search with TF-IDF")
+        logger.info(f"Initialized lightweight vector search with TF-IDF ({self.mode} mode)")
+    
+    def spawn(self) -> "LightweightVectorSearch":
+        """An empty index in the same mode, sharing this one's persisted IDF statistics"""
+        return LightweightVectorSearch(mode=self.mode, idf_stats=self.idf_stats)
+    
+    @property
+    def chunks(self) -> Dict[int, str]:
+        """Indexed chunk texts keyed by chunk id"""
+        return self.registry.texts
     
     def create_index(self, chunks: List[str]) -> bool:
         """
-        Create TF-IDF index from text chunks
+        Create TF-IDF index from text chunks, replacing any indexed documents
         
         Args:
             chunks: List of text chunks
-            
+        
         Returns:
             bool: True if successful
         """
         try:
             logger.info(f"Creating TF-IDF index for {len(chunks)} chunks")
             
-            self.chunks = chunks
-            
-            # Create TF-IDF vectors
-            self.chunk_vectors = self.vectorizer.fit_transform(chunks)
-            self.is_fitted = True
+            self.clear_index()
+            self.add_documents({DEFAULT_DOCUMENT_ID: chunks})
             
             logger.info(f"TF-IDF index created successfully with {self.chunk_vectors.shape[1]} features")
             return True
-            
+        
         except Exception as e:
             logger.error(f"Error creating TF-IDF index: {str(e)}")
             return False
     
+    def add_documents(self, documents: Dict[str, List[str]]) -> Dict[str, int]:
+        """
+        Add documents to the index
+        
+        In hashing mode only the new chunks are vectorized; existing rows are
+        re-weighted with the updated IDF. Fit mode has a corpus-dependent
+        vocabulary, so it refits over all live chunks.
+        
+        Args:
+            documents: Mapping of document id to its text chunks. A document id
+                that is already indexed is replaced.
+        
+        Returns:
+            Mapping of document id to number of chunks added
+        """
+        added = {}
+        new_rows = []
+        new_ids = []
+        for document_id, chunks in documents.items():
+            if document_id in self.registry.document_chunks:
+                self.remove_document(document_id, compact=False)
+            ids = self.registry.add(document_id, chunks)
+            added[document_id] = len(ids)
+            if self.mode == "hashing" and chunks:
+                new_rows.append(self._hash_document(chunks))
+                new_ids.extend(ids)
+        
+        if self.mode == "hashing":
+            if new_rows:
+                blocks = ([self.term_counts] if self.term_counts is not None else []) + new_rows
+                self.term_counts = sp.vstack(blocks).tocsr()
+                self.row_ids = np.concatenate([self.row_ids, np.array(new_ids, dtype=np.int64)])
+                self.row_live = np.concatenate([self.row_live, np.ones(len(new_ids), dtype=bool)])
+                self._reweight()
+        else:
+            self._refit()
+        
+        if self.registry.needs_compaction():
+            self.compact()
+        return added
+    
+    def remove_document(self, document_id: str, compact: bool = True) -> bool:
+        """
+        Remove a document from the index
+        
+        Its rows are tombstoned and skipped by searches until compaction.
+        
+        Args:
+            document_id: Document identifier
+            compact: Whether to compact the index if it is due
+        
+        Returns:
+            bool: True if the document was indexed
+        """
+        ids = self.registry.remove(document_id)
+        if not ids:
+            return False
+        
+        self.row_live &= ~np.isin(self.row_ids, ids)
+        logger.info(f"Removed document '{document_id}' ({len(ids)} chunks tombstoned)")
+        if compact and self.registry.needs_compaction():
+            self.compact()
+        return True
+    
+    def compact(self) -> int:
+        """
+        Drop tombstoned rows from the index
+        
+        Returns:
+            Number of rows removed
+        """
+        purged = self.registry.purge()
+        keep = self.row_live
+        if self.mode == "hashing" and self.term_counts is not None:
+            self.term_counts = self.term_counts[keep]
+        if self.chunk_vectors is not None:
+            self.chunk_vectors = self.chunk_vectors[keep]
+        self.row_ids = self.row_ids[keep]
+        self.row_live = self.row_live[keep]
+        return len(purged)
+    
+    def clear_index(self):
+        """Clear the current index and chunks"""
+        self.registry.reset()
+        self.term_counts = None
+        self.chunk_vectors = None
+        self.row_ids = np.zeros(0, dtype=np.int64)
+        self.row_live = np.zeros(0, dtype=bool)
+        self.is_fitted = False
+    
+    def _hash_document(self, chunks: List[str]):
+        """Hash a document's chunks and fold them into the persisted IDF statistics"""
+        with stage("embed"):
+            term_counts = self.vectorizer.transform(chunks)
+        
+        if self.idf_stats.update(term_counts, fingerprint_chunks(chunks)):
+            self.idf_stats.schedule_save()
+        return term_counts
+    
+    def _reweight(self):
+        """Apply current IDF weights to the stored term counts"""
+        self.idf = self.idf_stats.idf()
+        self.chunk_vectors = normalize(self.term_counts.multiply(self.idf).tocsr())
+        self.is_fitted = True
+    
+    @timed("embed")
+    def _refit(self):
+        """Refit the TF-IDF vectorizer over all live chunks (fit mode)"""
+        live_ids = self.registry.live_ids()
+        if not live_ids:
+            self.clear_index()
+            return
+        self.chunk_vectors = self.vectorizer.fit_transform([self.chunks[i] for i in live_ids])
+        self.row_ids = np.array(live_ids, dtype=np.int64)
+        self.row_live = np.ones(len(live_ids), dtype=bool)
+        self.is_fitted = True
+    
+    @timed("embed")
+    def _vectorize_queries(self, queries: List[str]):
+        """Vectorize queries in the same space as the indexed chunks"""
+        if self.mode == "hashing":
+            return normalize(self.vectorizer.transform(queries).multiply(self.idf).tocsr())
+        return self.vectorizer.transform(queries)
+    
     def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """
         Search for relevant chunks using cosine similarity
@@ -65,10 +397,14 @@ class LightweightVectorSearch:
         Args:
             query: Search query
             top_k: Number of results to return
-            
+        
         Returns:
             List of relevant chunks with scores
         """
+        if self.mode == "hashing":
+            results = self.search_batch([query], top_k=top_k)
+            return results[0] if results else []
+        
         try:
             if not self.is_fitted:
                 logger.warning("TF-IDF index not fitted")
@@ -77,10 +413,12 @@ class LightweightVectorSearch:
             logger.info(f"Searching for query: '{query[:50]}...' with top_k={top_k}")
             
             # Transform query to TF-IDF vector
-            query_vector = self.vectorizer.transform([query])
+            with stage("embed"):
+                query_vector = self.vectorizer.transform([query])
             
             # Calculate cosine similarities
             similarities = cosine_similarity(query_vector, self.chunk_vectors).flatten()
+            similarities[~self.row_live] = 0.0
             
             # Get top-k indices
             top_indices = np.argsort(similarities)[::-1][:top_k]
@@ -89,27 +427,86 @@ class LightweightVectorSearch:
             results = []
             for idx in top_indices:
                 if similarities[idx] > 0:  # Only include chunks with positive similarity
+                    chunk_id = int(self.row_ids[idx])
                     results.append({
-                        'text': self.chunks[idx],
+                        'text': self.chunks[chunk_id],
                         'score': float(similarities[idx]),
-                        'index': int(idx)
+                        'index': chunk_id
                     })
             
             logger.info(f"Found {len(results)} relevant chunks")
             return results
-            
+        
         except Exception as e:
             logger.error(f"Error during search: {str(e)}")
             return []
     
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries with a single sparse matrix product
+        
+        Args:
+            queries: Search queries
+            top_k: Number of results to return per query
+        
+        Returns:
+            One list of relevant chunks with scores per query, in query order
+        """
+        try:
+            if not self.is_fitted:
+                logger.warning("TF-IDF index not fitted")
+                return [[] for _ in queries]
+            
+            if not queries:
+                return []
+            
+            logger.info(f"Batch searching {len(queries)} queries with top_k={top_k}")
+            
+            # Both sides are L2-normalized, so the product is the cosine similarity
+            query_vectors = self._vectorize_queries(queries)
+            similarities = (query_vectors @ self.chunk_vectors.T).toarray()
+            similarities[:, ~self.row_live] = 0.0
+            
+            k = min(top_k, similarities.shape[1])
+            if k <= 0:
+                return [[] for _ in queries]
+            
+            # Partial selection of the top-k per row, then sort only those k
+            candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            
+            all_results = []
+            for row, row_candidates in zip(similarities, candidates):
+                ordered = row_candidates[np.argsort(-row[row_candidates], kind="stable")]
+                all_results.append([
+                    {
+                        'text': self.chunks[int(self.row_ids[idx])],
+                        'score': float(row[idx]),
+                        'index': int(self.row_ids[idx])
+                    }
+                    for idx in ordered
+                    if row[idx] > 0  # Only include chunks with positive similarity
+                ])
+            
+            return all_results
+        
+        except Exception as e:
+            logger.error(f"Error during batch search: {str(e)}")
+            return [[] for _ in queries]
+    
     def get_stats(self) -> Dict[str, Any]:
         """Get index statistics"""
         if not self.is_fitted:
             return {"status": "not_fitted"}
         
-        return {
+        stats = {
             "status": "fitted",
-            "num_chunks": len(self.chunks),
+            "num_chunks": self.registry.num_live,
+            "num_documents": len(self.registry.document_chunks),
+            "tombstones": len(self.registry.tombstones),
             "num_features": self.chunk_vectors.shape[1],
-            "vectorizer_type": "TF-IDF"
+            "vectorizer_type": "TF-IDF",
+            "mode": self.mode
         }
+        if self.idf_stats is not None:
+            stats["idf_corpus_chunks"] = self.idf_stats.n_docs
+        return stats
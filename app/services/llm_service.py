@@ -1,16 +1,38 @@
 import os
 import asyncio
-from typing import Dict, Any, Optional
-import google.generativeai as genai
+import hashlib
+from typing import Callable, Dict, Any, List, Optional
 
 # Simple result class without Pydantic
 class SimpleAnswerResult:
-    def __init__(self, answer: str, confidence: float, reasoning: str = ""):
+    def __init__(self, answer: str, confidence: float, reasoning: str = "",
+                 question: str = "", source_chunks: Optional[list] = None):
         self.answer = answer
         self.confidence = confidence
         self.reasoning = reasoning
+        self.question = question
+        self.source_chunks = source_chunks or []
+        # Retrieved chunks and which stage produced the answer, set by the Q&A pipeline
+        self.retrieved_chunks: list = []
+        self.served_by = "llm"
+        # Estimated prompt tokens (context plus question) before and after context assembly
+        self.prompt_tokens: Optional[Dict[str, int]] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Fields of the AnswerResult response model"""
+        return {
+            "question": self.question,
+            "answer": self.answer,
+            "confidence": self.confidence,
+            "source_chunks": self.source_chunks,
+            "reasoning": self.reasoning
+        }
 
+from app.services.call_guard import CallGuard
+from app.services.gemini_client import GeminiRestClient
+from app.services.prompt_packing import format_questions, parse_packed_answers
 from app.utils.logger import setup_logger
+from app.utils.metrics import stage, timed
 
 logger = setup_logger(__name__)
 
@@ -26,12 +48,25 @@ class LLMService:
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable must be set with your Gemini API key")
         
-        genai.configure(api_key=api_key)
         self.model_name = os.getenv("MODEL_NAME", "gemini-1.5-flash")
-        self.model = genai.GenerativeModel(self.model_name)
         self.max_tokens = 500
         self.temperature = 0.1  # Low temperature for factual answers
         
+        # "rest" calls Gemini natively async over a pooled HTTP client;
+        # "thread" runs the blocking SDK call in the default executor
+        self.transport = os.getenv("LLM_TRANSPORT", "rest").lower()
+        if self.transport not in ("rest", "thread"):
+            raise ValueError(f"Unknown LLM_TRANSPORT: {self.transport}")
+        self.client = GeminiRestClient(api_key, self.model_name) if self.transport == "rest" else None
+        self.model = None
+        if self.transport == "thread":
+            # The SDK is slow to import, so only the transport that uses it pays for it
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(self.model_name)
+        # Per-call deadline, hedging of slow calls and a circuit breaker around every model call
+        self.guard = CallGuard()
+        
         # Specialized prompt template for insurance/legal documents
         self.prompt_template = """You are a domain expert in insurance policies and legal document analysis.
 
@@ -52,15 +87,44 @@ Question:
 {question}
 
 Answer:"""
+        
+        # Several questions sharing one context, answered as a JSON array
+        self.packed_prompt_template = """You are a domain expert in insurance policies and legal document analysis.
+
+Given a document and a numbered list of questions, extract an accurate, concise, and contextually matched answer to each question directly from the document.
+
+Instructions:
+- Do not infer or assume facts not present in the document.
+- Focus on clauses that best match each question's intent.
+- Answer each question in 1-2 sentences with clarity and precision.
+- If no direct answer exists, answer: "The document does not provide a specific answer to this question."
+- Always cite the specific section or clause where you found the information.
+- Be precise with numbers, dates, and specific terms.
+- Respond with only a JSON array, one object per question: [{{"id": 1, "answer": "..."}}, ...]
 
-    async def generate_answer(self, question: str, context: str) -> SimpleAnswerResult:
+Context Document (Extracted):
+{context}
+
+Questions:
+{questions}
+
+JSON:"""
+        # Identify the prompts in answer cache keys, so editing a template invalidates cached answers
+        self.prompt_version = hashlib.sha256(self.prompt_template.encode("utf-8")).hexdigest()[:12]
+        self.packed_prompt_version = hashlib.sha256(self.packed_prompt_template.encode("utf-8")).hexdigest()[:12]
+    
+    async def generate_answer(self, question: str, context: str, raise_on_error: bool = False,
+                              on_token: Optional[Callable[[str], None]] = None) -> SimpleAnswerResult:
         """
         Generate an answer for a question using the provided context
         
         Args:
             question: The question to answer
             context: Relevant document context
-            
+            raise_on_error: Re-raise model errors instead of returning a fallback
+                answer, so a caller can retry them
+            on_token: Optional callback receiving the answer text as it streams in
+        
         Returns:
             SimpleAnswerResult with the generated answer and metadata
         """
@@ -68,49 +132,24 @@ Answer:"""
             logger.info(f"Generating answer for question: {question[:50]}...")
             
             # Format the prompt
-            formatted_prompt = self.prompt_template.format(
-                context=context,
-                question=question
-            )
-            
-            # Generate answer using Gemini
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: self.model.generate_content(
-                    formatted_prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        max_output_tokens=self.max_tokens,
-                        temperature=self.temperature,
-                        top_p=0.9,
-                        top_k=40
-                    )
+            with stage("prompt"):
+                formatted_prompt = self.prompt_template.format(
+                    context=context,
+                    question=question
                 )
-            )
-            
-            answer_text = response.text.strip()
             
-            # Calculate confidence based on answer characteristics
-            confidence = self._calculate_confidence(answer_text, context, question)
-            
-            # Extract source chunks (first 3 sentences of context for brevity)
-            source_chunks = self._extract_source_chunks(context)
-            
-            # Generate reasoning
-            reasoning = self._generate_reasoning(answer_text, question)
-            
-            result = SimpleAnswerResult(
-                question=question,
-                answer=answer_text,
-                confidence=confidence,
-                source_chunks=source_chunks,
-                reasoning=reasoning
-            )
+            # Generate answer using Gemini
+            answer_text = await self._generate(formatted_prompt, self.max_tokens, on_token)
+            result = self._build_result(question, answer_text, context)
+            confidence = result.confidence
             
             logger.info(f"Generated answer with confidence: {confidence:.2f}")
             return result
-            
+        
         except Exception as e:
             logger.error(f"Error generating answer: {str(e)}")
+            if raise_on_error:
+                raise
             
             # Return a fallback answer
             return SimpleAnswerResult(
@@ -121,6 +160,106 @@ Answer:"""
                 reasoning=f"Error: {str(e)}"
             )
     
+    async def generate_answers_packed(self, questions: List[str], context: str) -> List[SimpleAnswerResult]:
+        """
+        Answer several questions sharing one context with a single prompt
+        
+        Args:
+            questions: Questions to answer
+            context: Merged context for all questions
+        
+        Returns:
+            One SimpleAnswerResult per question, in question order
+        
+        Raises:
+            PackedAnswerError: If the response cannot be parsed into one answer per question
+        """
+        logger.info(f"Generating packed answers for {len(questions)} questions")
+        with stage("prompt"):
+            formatted_prompt = self.packed_prompt_template.format(
+                context=context,
+                questions=format_questions(questions)
+            )
+        response_text = await self._generate(formatted_prompt, self.max_tokens * len(questions))
+        answers = parse_packed_answers(response_text, len(questions))
+        return [
+            self._build_result(question, answer_text, context)
+            for question, answer_text in zip(questions, answers)
+        ]
+    
+    @timed("llm")
+    async def _generate(self, prompt: str, max_output_tokens: int,
+                        on_token: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Send a prompt to Gemini through the call guard and return the response text
+        
+        Streamed calls are not hedged, since a duplicate would repeat tokens to on_token.
+        
+        Raises:
+            CircuitOpenError: If the provider is marked unhealthy
+            DeadlineExceededError: If the call does not finish within its deadline
+        """
+        return await self.guard.call(
+            lambda: self._call_model(prompt, max_output_tokens, on_token),
+            hedge=on_token is None
+        )
+    
+    def call_stats(self) -> Dict[str, Any]:
+        """Circuit breaker state and hedging, deadline and latency counters"""
+        return self.guard.stats()
+    
+    async def _call_model(self, prompt: str, max_output_tokens: int,
+                          on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Send a prompt to Gemini and return the response text, streaming it to on_token if given"""
+        if self.client is not None:
+            config = {
+                "maxOutputTokens": max_output_tokens,
+                "temperature": self.temperature,
+                "topP": 0.9,
+                "topK": 40
+            }
+            if on_token is None:
+                text = await self.client.generate(prompt, config)
+            else:
+                pieces = []
+                async for piece in self.client.stream_generate(prompt, config):
+                    pieces.append(piece)
+                    on_token(piece)
+                text = "".join(pieces)
+            return text.strip()
+        
+        import google.generativeai as genai
+        response = await asyncio.get_event_loop().run_in_executor(
+            None,
+            lambda: self.model.generate_content(
+                prompt,
+                generation_config=genai.types.GenerationConfig(
+                    max_output_tokens=max_output_tokens,
+                    temperature=self.temperature,
+                    top_p=0.9,
+                    top_k=40
+                )
+            )
+        )
+        if on_token is not None:
+            on_token(response.text)
+        return response.text.strip()
+    
+    async def aclose(self):
+        """Release the HTTP connection pool"""
+        if self.client is not None:
+            await self.client.aclose()
+    
+    def _build_result(self, question: str, answer_text: str, context: str) -> SimpleAnswerResult:
+        """Score an answer and attach its sources and reasoning"""
+        return SimpleAnswerResult(
+            question=question,
+            answer=answer_text,
+            confidence=self._calculate_confidence(answer_text, context, question),
+            source_chunks=self._extract_source_chunks(context),
+            reasoning=self._generate_reasoning(answer_text, question)
+        )
+    
     def _calculate_confidence(self, answer: str, context: str, question: str) -> float:
         """
         Calculate confidence score for the answer
@@ -129,7 +268,7 @@ Answer:"""
             answer: Generated answer
             context: Source context
             question: Original question
-            
+        
         Returns:
             Confidence score between 0.0 and 1.0
         """
@@ -164,7 +303,7 @@ Answer:"""
                     confidence += 0.1
             
             return min(max(confidence, 0.0), 1.0)  # Clamp between 0 and 1
-            
+        
         except Exception:
             return 0.5  # Default confidence
     
@@ -175,7 +314,7 @@ Answer:"""
         Args:
             context: Full context text
             max_chunks: Maximum number of chunks to return
-            
+        
         Returns:
             List of source text chunks
         """
@@ -185,7 +324,7 @@ Answer:"""
             
             # Return first few sentences as source chunks
             return sentences[:max_chunks] if sentences else [context[:200] + "..."]
-            
+        
         except Exception:
             return [context[:200] + "..."]
     
@@ -196,7 +335,7 @@ Answer:"""
         Args:
             answer: Generated answer
             question: Original question
-            
+        
         Returns:
             Reasoning string
         """
@@ -218,7 +357,7 @@ Answer:"""
         
         Args:
             questions_and_contexts: List of (question, context) tuples
-            
+        
         Returns:
             List of SimpleAnswerResult objects
         """
@@ -249,7 +388,7 @@ Answer:"""
                     final_results.append(result)
             
             return final_results
-            
+        
         except Exception as e:
             logger.error(f"Error in batch answer generation: {str(e)}")
             raise
@@ -0,0 +1,104 @@
+"""
+Multi-question prompt packing
+
+Questions in a request often retrieve overlapping chunks. Grouping them by
+context overlap and answering each group with one prompt sends the shared
+context once instead of once per question. The model is asked for a JSON
+array of answers, which is parsed back into one answer per question.
+"""
+import json
+import re
+from typing import Hashable, List, Sequence
+
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+
+class PackedAnswerError(ValueError):
+    """Raised when a packed response cannot be mapped back to its questions"""
+
+
+def group_by_overlap(chunk_keys: Sequence[Sequence[Hashable]], min_overlap: float = 0.5,
+                     max_group_size: int = 4) -> List[List[int]]:
+    """
+    Greedily group questions whose retrieved chunks overlap
+    
+    A question joins the first group with room whose chunks cover at least
+    min_overlap of its own retrieved chunks; otherwise it starts a new group.
+    
+    Args:
+        chunk_keys: Retrieved chunk identifiers per question
+        min_overlap: Fraction of a question's chunks that must already be in the group
+        max_group_size: Maximum questions per group
+    
+    Returns:
+        Groups of question positions, in order of first question
+    """
+    groups: List[List[int]] = []
+    group_chunks: List[set] = []
+    for position, keys in enumerate(chunk_keys):
+        keys = set(keys)
+        for group, chunks in zip(groups, group_chunks):
+            if len(group) >= max_group_size:
+                continue
+            if keys and len(keys & chunks) / len(keys) >= min_overlap:
+                group.append(position)
+                chunks.update(keys)
+                break
+        else:
+            groups.append([position])
+            group_chunks.append(set(keys))
+    return groups
+
+
+def format_questions(questions: Sequence[str]) -> str:
+    """Number questions for a packed prompt"""
+    return "\n".join(f"{number}. {question}" for number, question in enumerate(questions, start=1))
+
+
+def parse_packed_answers(text: str, num_questions: int) -> List[str]:
+    """
+    Parse a packed JSON response into one answer per question
+    
+    Accepts a JSON array of {"id": n, "answer": "..."} objects (ids numbered
+    from 1), optionally wrapped in a code fence or an {"answers": [...]} object.
+    
+    Args:
+        text: Raw model output
+        num_questions: Number of questions in the prompt
+    
+    Returns:
+        Answers in question order
+    
+    Raises:
+        PackedAnswerError: If the output is not valid JSON or an answer is missing
+    """
+    cleaned = _CODE_FENCE.sub("", text.strip())
+    start = min((i for i in (cleaned.find("["), cleaned.find("{")) if i >= 0), default=-1)
+    if start < 0:
+        raise PackedAnswerError("No JSON found in packed response")
+    try:
+        payload, _ = json.JSONDecoder().raw_decode(cleaned[start:])
+    except json.JSONDecodeError as e:
+        raise PackedAnswerError(f"Invalid JSON in packed response: {e}") from e
+    
+    if isinstance(payload, dict):
+        payload = payload.get("answers")
+    if not isinstance(payload, list):
+        raise PackedAnswerError("Packed response is not a list of answers")
+    
+    answers = {}
+    for item in payload:
+        if not isinstance(item, dict):
+            raise PackedAnswerError("Packed answer is not an object")
+        try:
+            number = int(item.get("id"))
+        except (TypeError, ValueError):
+            raise PackedAnswerError(f"Packed answer has an invalid id: {item.get('id')!r}")
+        answer = item.get("answer")
+        if isinstance(answer, str) and answer.strip() and 1 <= number <= num_questions:
+            answers[number] = answer.strip()
+    
+    missing = [number for number in range(1, num_questions + 1) if number not in answers]
+    if missing:
+        raise PackedAnswerError(f"Packed response is missing answers for questions {missing}")
+    return [answers[number] for number in range(1, num_questions + 1)]
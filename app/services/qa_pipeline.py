@@ -0,0 +1,537 @@
+"""
+Question answering pipeline shared by the API endpoints
+
+Takes questions against an already built retrieval index through the
+answer caches, retrieval and the LLM, and returns one SimpleAnswerResult per
+question in question order.
+"""
+import asyncio
+import copy
+import os
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.services.answer_cache import AnswerCache
+from app.services.answer_scheduler import AnswerScheduler
+from app.services.llm_service import SimpleAnswerResult
+from app.services.context_builder import ContextBuilder
+from app.services.extractive_answerer import ExtractiveAnswerer
+from app.services.prompt_packing import group_by_overlap
+from app.utils.logger import setup_logger
+from app.utils.single_flight import SingleFlight
+from app.utils.text_processing import estimate_tokens
+
+logger = setup_logger(__name__)
+
+
+def create_semantic_cache():
+    """Create the semantic answer cache if it is enabled and numpy is installed"""
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    try:
+        from app.services.semantic_cache import SemanticAnswerCache
+    except ImportError:
+        logger.info("Semantic answer cache unavailable (numpy not installed)")
+        return None
+    return SemanticAnswerCache()
+
+
+def create_answer_cache():
+    """Create the persistent answer cache if it is enabled and its store can be opened"""
+    if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    from app.services.answer_cache import AnswerCache
+    try:
+        return AnswerCache()
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Answer cache unavailable: {e}")
+        return None
+
+
+def create_extractive_answerer():
+    """Create the extractive fast path if it is enabled"""
+    if os.getenv("EXTRACTIVE_ANSWERS", "true").lower() != "true":
+        return None
+    return ExtractiveAnswerer()
+
+
+class _QuestionState:
+    """A question's retrieval results and answer as it moves through the pipeline"""
+    
+    def __init__(self, question: str, position: int = 0):
+        self.question = question
+        self.position = position
+        # Index the question was retrieved from; the shared index may be rebuilt while the LLM answers
+        self.fingerprint: Optional[str] = None
+        self.embedding = None
+        self.chunks: List[Dict[str, Any]] = []
+        self.context = ""
+        self.prompt_tokens: Optional[Dict[str, int]] = None
+        self.cache_key: Optional[str] = None
+        self.result: Optional[SimpleAnswerResult] = None
+
+
+class QAPipeline:
+    """
+    Answers questions from the current retrieval index
+    
+    With prompt packing enabled, questions whose retrieved chunks overlap are
+    answered together with one prompt over their merged context; groups whose
+    packed response cannot be parsed fall back to one prompt per question.
+    
+    With an extractive answerer, single-value questions (grace period, room
+    rent limit, ...) whose retrieved clauses state the value are answered
+    from facts extracted at ingest time without calling the LLM.
+    """
+    
+    def __init__(self, retriever, get_llm: Callable[[], Any], semantic_cache=None, top_k: int = 5,
+                 scheduler: Optional[AnswerScheduler] = None, answer_cache=None, packing: Optional[bool] = None,
+                 pack_max_questions: Optional[int] = None, pack_min_overlap: Optional[float] = None,
+                 context_builder: Optional[ContextBuilder] = None,
+                 extractor: Optional[ExtractiveAnswerer] = None):
+        """
+        Args:
+            retriever: RetrieverRouter with an index already created
+            get_llm: Callable returning the LLMService (allows lazy initialization)
+            semantic_cache: Optional SemanticAnswerCache
+            top_k: Number of chunks retrieved per question
+            scheduler: Scheduler for LLM calls, shared across requests so its
+                rate limits apply globally
+            answer_cache: Optional persistent AnswerCache for exact repeats
+            packing: Answer questions with overlapping context in one prompt
+            pack_max_questions: Maximum questions per packed prompt
+            pack_min_overlap: Fraction of a question's chunks a group must share to take it
+            context_builder: Assembles the LLM context from retrieved chunks
+            extractor: Optional ExtractiveAnswerer for the LLM-free fast path
+        """
+        self.retriever = retriever
+        self.get_llm = get_llm
+        self.semantic_cache = semantic_cache
+        self.top_k = top_k
+        self.scheduler = scheduler or AnswerScheduler()
+        self.answer_cache = answer_cache
+        self.context_builder = context_builder or ContextBuilder()
+        self.extractor = extractor
+        self.packing = packing if packing is not None else os.getenv("PROMPT_PACKING", "false").lower() == "true"
+        self.pack_max_questions = pack_max_questions or int(os.getenv("PROMPT_PACK_MAX_QUESTIONS", "4"))
+        self.pack_min_overlap = pack_min_overlap if pack_min_overlap is not None else float(
+            os.getenv("PROMPT_PACK_MIN_OVERLAP", "0.4")
+        )
+        self.packing_stats = {
+            "packed_prompts": 0,
+            "packed_questions": 0,
+            "fallbacks": 0,
+            "context_tokens_sent": 0,
+            "context_tokens_saved": 0,
+        }
+        self.extractive_stats = {"questions": 0, "answered": 0, "extract_ms": 0.0}
+        # Concurrent identical question+context prompts share one LLM call
+        self.llm_flights = SingleFlight()
+    
+    def for_retriever(self, retriever) -> "QAPipeline":
+        """A pipeline answering from another index that shares this one's caches, scheduler and statistics"""
+        pipeline = copy.copy(self)
+        pipeline.retriever = retriever
+        return pipeline
+    
+    def index_facts(self, chunks: List[str]):
+        """Run the extractive answerer's extractors over newly ingested chunks"""
+        if self.extractor is not None:
+            self.extractor.index(chunks)
+    
+    async def answer_questions(self, questions: List[str], use_cache: bool = True) -> List[SimpleAnswerResult]:
+        """
+        Answer questions against the current index
+        
+        Args:
+            questions: Questions to answer
+            use_cache: Whether cached answers may be served (fresh answers are cached either way)
+        
+        Returns:
+            Answers in question order
+        """
+        results: List[Optional[SimpleAnswerResult]] = [None] * len(questions)
+        async for position, result in self.iter_answers(questions, use_cache):
+            results[position] = result
+        return results
+    
+    async def iter_answers(self, questions: List[str], use_cache: bool = True,
+                           on_token: Optional[Callable[[int, str], None]] = None
+                           ) -> AsyncIterator[Tuple[int, SimpleAnswerResult]]:
+        """
+        Answer questions concurrently, yielding each answer as soon as it is ready
+        
+        Args:
+            questions: Questions to answer
+            use_cache: Whether cached answers may be served
+            on_token: Optional callback(position, text) receiving answer text
+                while the LLM streams it (single-question prompts only)
+        
+        Yields:
+            (question position, answer) tuples in completion order
+        """
+        states = self._prepare_all(questions, use_cache)
+        # Answered from the caches or extractively; the rest are still being answered when these are yielded
+        ready = [state for state in states if state.result is not None]
+        pending = [state for state in states if state.result is None]
+        if not self.packing or len(pending) < 2:
+            tasks = [
+                asyncio.ensure_future(self._answer_group_at([state], use_cache, on_token))
+                for state in pending
+            ]
+        else:
+            groups = group_by_overlap(
+                [[chunk['text'] for chunk in state.chunks] for state in pending],
+                min_overlap=self.pack_min_overlap,
+                max_group_size=self.pack_max_questions
+            )
+            logger.info(f"Packed {len(pending)} questions into {len(groups)} prompts")
+            tasks = [
+                asyncio.ensure_future(self._answer_group_at([pending[i] for i in group], use_cache, on_token))
+                for group in groups
+            ]
+        
+        try:
+            for state in ready:
+                yield state.position, self._finish(state)
+            for future in asyncio.as_completed(tasks):
+                for position, result in await future:
+                    yield position, result
+        finally:
+            # Stop outstanding LLM calls if the consumer goes away
+            for task in tasks:
+                task.cancel()
+    
+    async def _answer_at(self, position: int, question: str, use_cache: bool,
+                         on_token: Optional[Callable[[int, str], None]]) -> List[Tuple[int, SimpleAnswerResult]]:
+        """Answer the question at a position with its own prompt"""
+        state = self._prepare(question, use_cache)
+        state.position = position
+        if state.result is None:
+            await self._answer_single(state, use_cache, on_token)
+        return [(position, self._finish(state))]
+    
+    async def _answer_group_at(self, states: List[_QuestionState], use_cache: bool,
+                               on_token: Optional[Callable[[int, str], None]]) -> List[Tuple[int, SimpleAnswerResult]]:
+        """Answer a packing group and return its answers with their positions"""
+        await self._answer_group(states, use_cache, on_token)
+        return [(state.position, self._finish(state)) for state in states]
+    
+    async def answer_question(self, question: str, use_cache: bool = True) -> SimpleAnswerResult:
+        """
+        Answer a single question against the current index
+        
+        Args:
+            question: Question to answer
+            use_cache: Whether cached answers may be served
+        
+        Returns:
+            SimpleAnswerResult with retrieved_chunks and served_by set
+        """
+        [(_, result)] = await self._answer_at(0, question, use_cache, None)
+        return result
+    
+    def _prepare(self, question: str, use_cache: bool, background: bool = False) -> _QuestionState:
+        """Check the semantic cache, then retrieve context for a question (kept out of the stats if background)"""
+        return self._prepare_all([question], use_cache, background)[0]
+    
+    def _prepare_all(self, questions: List[str], use_cache: bool, background: bool = False) -> List[_QuestionState]:
+        """
+        Check the semantic cache, then retrieve context for the questions it did not answer
+        
+        The remaining questions are retrieved with one batched search, which
+        backends with a batched path (hashing TF-IDF) score in a single sparse
+        product; the retrieval cache still applies per question.
+        """
+        states = []
+        for position, question in enumerate(questions):
+            logger.info(f"Processing question: {question[:50]}...")
+            state = _QuestionState(question, position)
+            state.fingerprint = self.retriever.fingerprint
+            states.append(state)
+            
+            # Reuse the answer to a semantically equivalent question about the same document
+            if self.semantic_cache is not None:
+                state.embedding = self.retriever.embed_query(question)
+                if state.embedding is not None and use_cache:
+                    hit = self.semantic_cache.lookup(state.fingerprint, state.embedding)
+                    if hit is not None:
+                        logger.info(f"Semantic cache hit (similarity {hit['similarity']:.3f})")
+                        state.result = self._from_cache(question, hit["answer"], "semantic_cache")
+                        state.result.retrieved_chunks = list(hit["answer"].get("retrieved_chunks", []))
+        
+        pending = [state for state in states if state.result is None]
+        if pending:
+            retrieved = self.retriever.search_batch([state.question for state in pending], top_k=self.top_k)
+            for state, chunks in zip(pending, retrieved):
+                self._use_context(state, chunks, use_cache, background)
+        return states
+    
+    def _use_context(self, state: _QuestionState, chunks: List[Dict[str, Any]], use_cache: bool, background: bool):
+        """Assemble a question's retrieved chunks into its context, answering it extractively when possible"""
+        question = state.question
+        state.chunks = chunks
+        
+        # Assemble the retrieved context within the token budget
+        built = self.context_builder.build(state.chunks)
+        state.context = built["text"]
+        question_tokens = estimate_tokens(question)
+        state.prompt_tokens = {
+            "before": built["raw_tokens"] + question_tokens,
+            "after": built["tokens"] + question_tokens
+        }
+        
+        # Answer single-value questions stated verbatim in the retrieved clauses without the LLM,
+        # unless the caller asked for a fresh answer
+        if self.extractor is not None and use_cache:
+            start = time.perf_counter()
+            extracted = self.extractor.answer(question, state.chunks)
+            if not background:
+                self.extractive_stats["questions"] += 1
+                self.extractive_stats["extract_ms"] += (time.perf_counter() - start) * 1000
+            if extracted is not None:
+                logger.info(f"Extractive answer ({extracted['kind']}, confidence {extracted['confidence']:.2f})")
+                if not background:
+                    self.extractive_stats["answered"] += 1
+                state.result = SimpleAnswerResult(
+                    question=question,
+                    answer=extracted["answer"],
+                    confidence=extracted["confidence"],
+                    source_chunks=[extracted["sentence"]],
+                    reasoning="Value extracted verbatim from the top retrieved clause"
+                )
+                state.result.served_by = "extractive"
+                state.prompt_tokens["after"] = 0
+    
+    async def _cached_answer(self, state: _QuestionState, llm, prompt_version: str,
+                             use_cache: bool) -> Optional[SimpleAnswerResult]:
+        """Look up an exact repeat of a question over the same context (SQLite is read off the event loop)"""
+        if self.answer_cache is None:
+            return None
+        state.cache_key = self.answer_cache.make_key(llm.model_name, prompt_version, state.question, state.context)
+        cached = await asyncio.to_thread(self.answer_cache.get, state.cache_key) if use_cache else None
+        if cached is None:
+            return None
+        logger.info("Answer cache hit")
+        return self._from_cache(state.question, cached, "answer_cache")
+    
+    async def _store_answer(self, state: _QuestionState, result: SimpleAnswerResult):
+        """Persist a successful LLM answer in the answer cache, off the event loop"""
+        if state.cache_key is not None and result.confidence > 0:
+            await asyncio.to_thread(self.answer_cache.set, state.cache_key, result.to_dict())
+    
+    async def precompute(self, questions: List[str], fingerprint: str) -> Dict[str, int]:
+        """
+        Answer questions ahead of time at background priority, filling the answer caches
+        
+        Retrieval runs one question at a time, yielding to live requests in
+        between, and stops if the index is no longer the one for fingerprint.
+        
+        Args:
+            questions: Questions to pre-answer
+            fingerprint: Index fingerprint the answers are for
+        
+        Returns:
+            Counts of questions 'answered' by the LLM, already 'cached' or
+            'extracted', and 'failed'
+        """
+        states = []
+        for question in questions:
+            if self.retriever.fingerprint != fingerprint:
+                logger.info("Index replaced, stopping pre-answering")
+                break
+            states.append(self._prepare(question, use_cache=True, background=True))
+            await asyncio.sleep(0)
+        
+        pending = [state for state in states if state.result is None]
+        await asyncio.gather(*(self._answer_single(state, use_cache=True, background=True) for state in pending))
+        
+        counts = {"answered": 0, "cached": 0, "extracted": 0, "failed": 0}
+        for state in states:
+            served_by = state.result.served_by
+            if served_by == "llm":
+                counts["answered"] += 1
+            elif served_by == "extractive":
+                counts["extracted"] += 1
+            elif served_by == "error":
+                counts["failed"] += 1
+            else:
+                counts["cached"] += 1
+            if self.retriever.fingerprint == fingerprint:
+                self._finish(state)
+        return counts
+    
+    async def _answer_single(self, state: _QuestionState, use_cache: bool,
+                             on_token: Optional[Callable[[int, str], None]] = None, background: bool = False):
+        """Answer one question with its own prompt (below live traffic if background)"""
+        try:
+            llm = self.get_llm()
+            state.result = await self._cached_answer(state, llm, llm.prompt_version, use_cache)
+            if state.result is None:
+                streaming = {"on_token": lambda text: on_token(state.position, text)} if on_token else {}
+                call = lambda: self.scheduler.call(
+                    lambda: llm.generate_answer(state.question, state.context, raise_on_error=True, **streaming),
+                    tokens=estimate_tokens(state.context) + estimate_tokens(state.question)
+                    + getattr(llm, "max_tokens", 0),
+                    background=background
+                )
+                if on_token is None:
+                    # Join an identical prompt already in flight (live and background calls kept apart)
+                    key = (state.cache_key or AnswerCache.make_key(
+                        llm.model_name, llm.prompt_version, state.question, state.context
+                    ), background)
+                    state.result = copy.copy(await self.llm_flights.do(key, call))
+                else:
+                    state.result = await call()
+                await self._store_answer(state, state.result)
+        except Exception as e:
+            logger.error(f"Error generating answer: {str(e)}")
+            state.result = self._error_result(state.question, e)
+    
+    async def _answer_group(self, states: List[_QuestionState], use_cache: bool,
+                            on_token: Optional[Callable[[int, str], None]] = None):
+        """Answer a group of questions with one packed prompt over their merged context"""
+        if len(states) == 1:
+            await self._answer_single(states[0], use_cache, on_token)
+            return
+        
+        try:
+            llm = self.get_llm()
+            pending = []
+            for state in states:
+                state.result = await self._cached_answer(state, llm, llm.packed_prompt_version, use_cache)
+                if state.result is None:
+                    pending.append(state)
+        except Exception as e:
+            logger.error(f"Error generating answer: {str(e)}")
+            for state in states:
+                state.result = self._error_result(state.question, e)
+            return
+        
+        if len(pending) <= 1:
+            for state in pending:
+                await self._answer_single(state, use_cache, on_token)
+            return
+        
+        # Merged context for the group, deduplicated across questions, with a budget per question
+        merged = {}
+        for state in pending:
+            for chunk in state.chunks:
+                merged.setdefault(chunk['text'], chunk)
+        built = self.context_builder.build(
+            list(merged.values()), token_budget=self.context_builder.token_budget * len(pending)
+        )
+        context = built["text"]
+        questions = [state.question for state in pending]
+        try:
+            results = await self.scheduler.call(
+                lambda: llm.generate_answers_packed(questions, context),
+                tokens=estimate_tokens(context) + sum(estimate_tokens(question) for question in questions)
+                + getattr(llm, "max_tokens", 0) * len(questions)
+            )
+        except Exception as e:
+            logger.warning(f"Packed prompt failed ({e}), answering {len(pending)} questions individually")
+            self.packing_stats["fallbacks"] += 1
+            await asyncio.gather(*(self._answer_single(state, use_cache, on_token) for state in pending))
+            return
+        
+        unpacked_tokens = sum(estimate_tokens(state.context) for state in pending)
+        sent_tokens = estimate_tokens(context)
+        self.packing_stats["packed_prompts"] += 1
+        self.packing_stats["packed_questions"] += len(pending)
+        self.packing_stats["context_tokens_sent"] += sent_tokens
+        self.packing_stats["context_tokens_saved"] += unpacked_tokens - sent_tokens
+        
+        for state, result in zip(pending, results):
+            result.served_by = "llm_packed"
+            state.result = result
+            state.prompt_tokens["after"] = sent_tokens // len(pending) + estimate_tokens(state.question)
+            await self._store_answer(state, result)
+    
+    def _finish(self, state: _QuestionState) -> SimpleAnswerResult:
+        """Attach retrieved chunks and remember successful answers in the semantic cache"""
+        result = state.result
+        if result.served_by == "semantic_cache":
+            return result
+        result.retrieved_chunks = [chunk['text'] for chunk in state.chunks]
+        result.prompt_tokens = state.prompt_tokens
+        
+        # Only successful answers are worth reusing
+        if state.embedding is not None and result.confidence > 0:
+            self.semantic_cache.store(
+                state.fingerprint,
+                state.embedding,
+                state.question,
+                {**result.to_dict(), "retrieved_chunks": result.retrieved_chunks}
+            )
+        return result
+    
+    @staticmethod
+    def prompt_token_report(results: List[SimpleAnswerResult]) -> Dict[str, Any]:
+        """
+        Summarize estimated prompt tokens before and after context assembly
+        
+        Args:
+            results: Answers returned by answer_questions
+        
+        Returns:
+            Totals and per-question 'before'/'after' counts (None for cached semantic answers)
+        """
+        per_question = [result.prompt_tokens for result in results]
+        counted = [tokens for tokens in per_question if tokens]
+        return {
+            "before": sum(tokens["before"] for tokens in counted),
+            "after": sum(tokens["after"] for tokens in counted),
+            "per_question": per_question
+        }
+    
+    def extractive_report(self, results: List[SimpleAnswerResult],
+                          llm_latency: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Summarize how many answers bypassed the LLM
+        
+        Args:
+            results: Answers returned by answer_questions
+            llm_latency: Typical seconds per LLM call, to estimate the time saved
+        
+        Returns:
+            Extractive answers, bypass rate, estimated LLM seconds saved and
+            the pipeline's cumulative counters
+        """
+        answered = sum(1 for result in results if result.served_by == "extractive")
+        stats = self.extractive_stats
+        return {
+            "answered": answered,
+            "bypass_rate": round(answered / len(results), 3) if results else 0.0,
+            "estimated_seconds_saved": round(answered * llm_latency, 3) if llm_latency is not None else None,
+            "total_answered": stats["answered"],
+            "total_bypass_rate": round(stats["answered"] / stats["questions"], 3) if stats["questions"] else 0.0,
+            "avg_extract_ms": round(stats["extract_ms"] / stats["questions"], 3) if stats["questions"] else 0.0
+        }
+    
+    @staticmethod
+    def _error_result(question: str, error: Exception) -> SimpleAnswerResult:
+        """Fallback answer for a question whose LLM call failed"""
+        result = SimpleAnswerResult(
+            question=question,
+            answer="An error occurred while processing this question. Please try again.",
+            confidence=0.0,
+            source_chunks=[],
+            reasoning=f"Error: {str(error)}"
+        )
+        result.served_by = "error"
+        return result
+    
+    @staticmethod
+    def _from_cache(question: str, answer: Dict[str, Any], served_by: str) -> SimpleAnswerResult:
+        """Rebuild an answer from a serialized cache entry"""
+        result = SimpleAnswerResult(
+            question=question,
+            answer=answer["answer"],
+            confidence=answer["confidence"],
+            source_chunks=list(answer.get("source_chunks", [])),
+            reasoning=answer.get("reasoning") or ""
+        )
+        result.served_by = served_by
+        return result
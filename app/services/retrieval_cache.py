@@ -0,0 +1,60 @@
+"""
+Cache of retrieval results keyed by index fingerprint
+"""
+import copy
+import os
+from typing import Any, Dict, List, Optional
+
+from app.utils.cache import LRUCache
+from app.utils.logger import setup_logger
+from app.utils.text_processing import normalize_question
+
+logger = setup_logger(__name__)
+
+
+class RetrievalCache:
+    """
+    LRU/TTL cache of search results
+    
+    For a given index fingerprint, question, top_k and backend the retrieved
+    chunks are deterministic, so they can be reused across requests for the
+    same document.
+    """
+    
+    def __init__(self, maxsize: Optional[int] = None, ttl: Optional[float] = None):
+        maxsize = maxsize if maxsize is not None else int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+        ttl = ttl if ttl is not None else float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl or None)
+    
+    @staticmethod
+    def make_key(fingerprint: str, question: str, top_k: int, backend: str) -> tuple:
+        """Build the cache key for a search"""
+        return (fingerprint, normalize_question(question), top_k, backend)
+    
+    def get(self, fingerprint: str, question: str, top_k: int, backend: str) -> Optional[List[Dict[str, Any]]]:
+        """Return a copy of the cached results, or None on a miss"""
+        results = self.cache.get(self.make_key(fingerprint, question, top_k, backend))
+        return copy.deepcopy(results) if results is not None else None
+    
+    def set(self, fingerprint: str, question: str, top_k: int, backend: str, results: List[Dict[str, Any]]):
+        """Store search results"""
+        self.cache.set(self.make_key(fingerprint, question, top_k, backend), copy.deepcopy(results))
+    
+    def invalidate(self, fingerprint: str) -> int:
+        """
+        Drop all results computed against an index fingerprint
+        
+        Args:
+            fingerprint: Index fingerprint that is no longer valid
+        
+        Returns:
+            Number of entries removed
+        """
+        removed = self.cache.invalidate(lambda key: key[0] == fingerprint)
+        if removed:
+            logger.info(f"Invalidated {removed} cached retrieval results")
+        return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        """Cache hit/miss statistics"""
+        return self.cache.stats()
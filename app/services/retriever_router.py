@@ -0,0 +1,468 @@
+"""
+Retriever router that picks a search backend per request
+
+Backends (FAISS, TF-IDF, basic text matching) are discovered from the
+installed packages instead of from whichever import happens to fail, and the
+router chooses one per request from the corpus size, the number of questions
+and a configurable latency budget. Backends are imported and loaded on first
+use, or ahead of time by warm_up().
+"""
+import importlib
+import importlib.util
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.chunk_registry import DEFAULT_DOCUMENT_ID
+from app.services.retrieval_cache import RetrievalCache
+from app.utils.logger import setup_logger
+from app.utils.metrics import stage, timed
+from app.utils.text_processing import fingerprint_chunks
+
+logger = setup_logger(__name__)
+
+# Backends in order of retrieval quality, best first
+BACKENDS = {
+    "faiss": {
+        "module": "app.services.vector_search",
+        "class": "VectorSearchService",
+        "requires": ["numpy", "faiss", "sentence_transformers"],
+        "label": "FAISS",
+    },
+    "tfidf": {
+        "module": "app.services.lightweight_vector_search",
+        "class": "LightweightVectorSearch",
+        "requires": ["numpy", "scipy", "sklearn"],
+        "label": "Lightweight",
+    },
+    "basic": {
+        "module": "app.services.basic_text_search",
+        "class": "BasicTextSearch",
+        "requires": [],
+        "label": "Basic",
+    },
+}
+
+# Initial cost estimates in milliseconds, refined from observed timings
+DEFAULT_COSTS = {
+    "faiss": {"index_per_chunk": 20.0, "query": 25.0, "query_per_chunk": 0.0},
+    "tfidf": {"index_per_chunk": 0.5, "query": 1.0, "query_per_chunk": 0.001},
+    "basic": {"index_per_chunk": 0.2, "query": 0.0, "query_per_chunk": 0.05},
+}
+
+# Weight of a new observation in the exponentially weighted cost estimates
+COST_SMOOTHING = 0.3
+
+# Memory of the basic backend's postings relative to the chunk text they are built from
+BASIC_POSTINGS_OVERHEAD = 12
+
+
+def installed_backends() -> List[str]:
+    """Names of backends whose dependencies are importable, best first"""
+    available = []
+    for name, spec in BACKENDS.items():
+        if all(importlib.util.find_spec(module) is not None for module in spec["requires"]):
+            available.append(name)
+    return available
+
+
+class RetrieverRouter:
+    """
+    Common retrieval interface over the available search backends
+    
+    Every backend is wrapped so that search results are always dictionaries
+    with 'text', 'score' and 'index' keys. The backend that served the last
+    index build is recorded in last_selection, and per-backend counts in served.
+    
+    Search results are cached by index fingerprint, which is derived from the
+    content of the indexed documents and changes whenever they do. Listeners
+    added with add_eviction_listener() are told when a fingerprint's index is
+    replaced, so work tied to it can be dropped.
+    """
+    
+    def __init__(self, latency_budget_ms: Optional[float] = None, backend: Optional[str] = None,
+                 min_semantic_chunks: Optional[int] = None, preload: bool = True):
+        self.latency_budget_ms = latency_budget_ms if latency_budget_ms is not None else float(
+            os.getenv("RETRIEVAL_LATENCY_BUDGET_MS", "10000")
+        )
+        self.forced_backend = (backend or os.getenv("RETRIEVAL_BACKEND", "auto")).lower()
+        self.min_semantic_chunks = min_semantic_chunks if min_semantic_chunks is not None else int(
+            os.getenv("RETRIEVAL_MIN_SEMANTIC_CHUNKS", "20")
+        )
+        if self.forced_backend != "auto" and self.forced_backend not in BACKENDS:
+            raise ValueError(f"Unknown retrieval backend: {self.forced_backend}")
+        
+        self.installed = installed_backends()
+        self.engines: Dict[str, Any] = {}
+        self.costs = {name: dict(cost) for name, cost in DEFAULT_COSTS.items()}
+        self.active: Optional[str] = None
+        self.last_selection: Dict[str, Any] = {}
+        self.served = Counter()
+        self.document_fingerprints: Dict[str, str] = {}
+        self.fingerprint: Optional[str] = None
+        self.result_cache = RetrievalCache()
+        self.eviction_listeners: List[Callable[[str], None]] = []
+        # Set while warm_up() loads backends in the background
+        self.warming = False
+        # The router this one was spawned from, whose loaded backends it shares
+        self.parent: Optional["RetrieverRouter"] = None
+        self._load_lock = threading.Lock()
+        
+        if preload:
+            self.warm_up()
+        
+        logger.info(f"Retriever router initialized with backends: {', '.join(self.installed)}")
+    
+    @property
+    def available(self) -> List[str]:
+        """Backends that are installed and loaded successfully"""
+        return [name for name in self.installed if name in self.engines]
+    
+    @property
+    def loading(self) -> bool:
+        """Whether a warm-up is still loading backends for this router"""
+        return self.warming or (self.parent is not None and self.parent.warming)
+    
+    def candidates(self) -> List[str]:
+        """
+        Backends a request may be routed to, best first
+        
+        Every installed backend, loaded on first use, except while a warm-up
+        is loading them: then only those already loaded, so requests do not
+        wait for a model load.
+        """
+        if not self.loading:
+            return list(self.installed)
+        loaded = [
+            name for name in self.installed
+            if name in self.engines or (self.parent is not None and name in self.parent.engines)
+        ]
+        # The cheapest backend loads instantly if the warm-up has not reached it yet
+        return loaded or self.installed[-1:]
+    
+    def _get_engine(self, name: str):
+        """Instantiate a backend on first use, or share the one already loaded by the router this was spawned from"""
+        if name not in self.engines:
+            with self._load_lock:
+                if name not in self.engines:
+                    self._load_engine(name)
+        return self.engines.get(name)
+    
+    def _load_engine(self, name: str):
+        spec = BACKENDS[name]
+        try:
+            if self.parent is not None and self.parent._get_engine(name) is not None:
+                self.engines[name] = self.parent.engines[name].spawn()
+            else:
+                module = importlib.import_module(spec["module"])
+                self.engines[name] = getattr(module, spec["class"])()
+        except Exception as e:
+            logger.warning(f"Retrieval backend '{name}' unavailable: {e}")
+            if name in self.installed:
+                self.installed.remove(name)
+    
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Load every installed backend that is not loaded yet, cheapest first
+        
+        Run it in a background thread to keep model loading off the startup
+        path; requests are meanwhile routed to the backends loaded so far.
+        
+        Returns:
+            Seconds taken to load each backend
+        """
+        self.warming = True
+        timings = {}
+        try:
+            for name in reversed(list(self.installed)):
+                if name in self.engines:
+                    continue
+                start = time.perf_counter()
+                if self._get_engine(name) is not None:
+                    timings[name] = round(time.perf_counter() - start, 3)
+        finally:
+            self.warming = False
+        logger.info(f"Loaded retrieval backends: {', '.join(f'{name} ({seconds}s)' for name, seconds in timings.items())}")
+        return timings
+    
+    def spawn(self) -> "RetrieverRouter":
+        """
+        An empty router for an index held alongside this one
+        
+        Its backends share this router's loaded models, cost estimates and
+        search result cache, but index their own documents, so building its
+        index leaves this router's index untouched.
+        """
+        router = RetrieverRouter(self.latency_budget_ms, self.forced_backend, self.min_semantic_chunks, preload=False)
+        router.installed = list(self.installed)
+        router.engines = {name: engine.spawn() for name, engine in list(self.engines.items())}
+        router.parent = self
+        router.costs = self.costs
+        router.result_cache = self.result_cache
+        return router
+    
+    def estimate_ms(self, name: str, num_chunks: int, num_queries: int) -> float:
+        """Estimated index build plus search time for a request"""
+        cost = self.costs[name]
+        per_query = cost["query"] + cost["query_per_chunk"] * num_chunks
+        return cost["index_per_chunk"] * num_chunks + per_query * num_queries
+    
+    def select_backend(self, num_chunks: int, num_queries: int = 1, top_k: int = 5) -> Dict[str, Any]:
+        """
+        Choose a backend for a request
+        
+        Args:
+            num_chunks: Number of chunks to index
+            num_queries: Number of questions that will be searched
+            top_k: Number of results requested per question
+        
+        Returns:
+            Dictionary with the chosen backend, the reason and the cost estimate
+        """
+        candidates = self.candidates()
+        if not candidates:
+            raise RuntimeError("No retrieval backend is available")
+        
+        if self.forced_backend != "auto" and self.forced_backend in candidates:
+            backend, reason = self.forced_backend, "configured"
+        elif num_chunks <= top_k:
+            # Every chunk is returned anyway, so ranking quality does not matter
+            backend, reason = candidates[-1], "corpus_within_top_k"
+        else:
+            lexical = [name for name in candidates if name != "faiss"]
+            if num_chunks < self.min_semantic_chunks and lexical:
+                candidates = lexical
+            
+            backend, reason = None, "within_budget"
+            for name in candidates:
+                if self.estimate_ms(name, num_chunks, num_queries) <= self.latency_budget_ms:
+                    backend = name
+                    break
+            if backend is None:
+                backend = min(candidates, key=lambda name: self.estimate_ms(name, num_chunks, num_queries))
+                reason = "cheapest_over_budget"
+            elif num_chunks < self.min_semantic_chunks:
+                reason = "small_corpus"
+        
+        return {
+            "backend": backend,
+            "engine": BACKENDS[backend]["label"],
+            "reason": reason,
+            "num_chunks": num_chunks,
+            "estimated_ms": round(self.estimate_ms(backend, num_chunks, num_queries), 1),
+        }
+    
+    def _observe(self, name: str, key: str, value: float):
+        """Fold an observed timing into the cost estimate"""
+        self.costs[name][key] = (1 - COST_SMOOTHING) * self.costs[name][key] + COST_SMOOTHING * value
+    
+    @timed("index")
+    def create_index(self, chunks: List[str], num_queries: int = 1, top_k: int = 5) -> Dict[str, Any]:
+        """
+        Select a backend for this corpus and build its index
+        
+        Args:
+            chunks: List of text chunks
+            num_queries: Number of questions the index will serve
+            top_k: Number of results requested per question
+        
+        Returns:
+            The backend selection record, also stored in last_selection
+        """
+        selection = self.select_backend(len(chunks), num_queries, top_k)
+        backend = selection["backend"]
+        
+        # The same document on the same backend, e.g. from concurrent identical requests: keep the index
+        document_fingerprint = fingerprint_chunks(chunks)
+        if self.active == backend and self.document_fingerprints == {DEFAULT_DOCUMENT_ID: document_fingerprint}:
+            selection.update(index_ms=0.0, reused=True, fingerprint=self.fingerprint)
+            self.last_selection = selection
+            self.served[backend] += 1
+            logger.info(f"Reusing {selection['engine']} index already built for these {len(chunks)} chunks")
+            return selection
+        
+        # Fall back to the next backend down if the chosen one cannot index this corpus
+        candidates = self.candidates()
+        fallbacks = candidates[candidates.index(backend):]
+        for backend in fallbacks:
+            engine = self._get_engine(backend)
+            start = time.perf_counter()
+            try:
+                result = engine.create_index(chunks)
+            except Exception as e:
+                logger.warning(f"{BACKENDS[backend]['label']} index creation raised: {e}")
+                result = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if result is not False:
+                break
+        else:
+            raise RuntimeError("Index creation failed on every retrieval backend")
+        
+        if backend != selection["backend"]:
+            selection.update(backend=backend, engine=BACKENDS[backend]["label"], reason="fallback")
+        if chunks:
+            self._observe(backend, "index_per_chunk", elapsed_ms / len(chunks))
+        
+        selection["index_ms"] = round(elapsed_ms, 1)
+        self.active = backend
+        self.document_fingerprints = {DEFAULT_DOCUMENT_ID: document_fingerprint}
+        self._index_changed()
+        selection["fingerprint"] = self.fingerprint
+        self.last_selection = selection
+        self.served[backend] += 1
+        logger.info(f"Routed {len(chunks)} chunks to {selection['engine']} backend ({selection['reason']})")
+        return selection
+    
+    def _update_fingerprint(self):
+        """Recompute the index fingerprint from the indexed documents"""
+        self.fingerprint = fingerprint_chunks(
+            [f"{doc_id}:{digest}" for doc_id, digest in sorted(self.document_fingerprints.items())]
+        )
+    
+    def _index_changed(self):
+        """Refresh the fingerprint after the index is built or changed, and drop results for the old one"""
+        previous = self.fingerprint
+        self._update_fingerprint()
+        if previous is not None and previous != self.fingerprint:
+            self.result_cache.invalidate(previous)
+            self._evicted(previous)
+    
+    def add_eviction_listener(self, listener: Callable[[str], None]):
+        """Call listener(fingerprint) whenever the index for that fingerprint is replaced"""
+        self.eviction_listeners.append(listener)
+    
+    def _evicted(self, fingerprint: str):
+        for listener in self.eviction_listeners:
+            try:
+                listener(fingerprint)
+            except Exception as e:
+                logger.warning(f"Eviction listener failed for index {fingerprint[:12]}: {e}")
+    
+    def embed_query(self, query: str):
+        """
+        Embed a question with the semantic backend's model
+        
+        Args:
+            query: Question text
+        
+        Returns:
+            1-D normalized embedding, or None when no embedding model is loaded
+        """
+        engine = self.engines.get("faiss")
+        if engine is None:
+            return None
+        return engine.embed_query(query)[0]
+    
+    @property
+    def engine(self):
+        """The backend serving the current index"""
+        if self.active is None:
+            raise ValueError("Index not created. Call create_index() first.")
+        return self.engines[self.active]
+    
+    @timed("search")
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Search the current index
+        
+        Args:
+            query: Search query
+            top_k: Number of results to return
+        
+        Returns:
+            List of dictionaries with 'text', 'score' and 'index'
+        """
+        engine = self.engine
+        cached = self.result_cache.get(self.fingerprint, query, top_k, self.active)
+        if cached is not None:
+            return cached
+        
+        start = time.perf_counter()
+        if self.active == "faiss":
+            results = [
+                {"text": text, "score": score, "index": None}
+                for text, score in engine.search_with_scores(query, top_k=top_k)
+            ]
+        else:
+            results = engine.search(query, top_k=top_k)
+        
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        num_chunks = self.last_selection.get("num_chunks", 0)
+        if self.active == "basic" and num_chunks:
+            self._observe("basic", "query_per_chunk", elapsed_ms / num_chunks)
+        else:
+            self._observe(self.active, "query", elapsed_ms)
+        self.result_cache.set(self.fingerprint, query, top_k, self.active, results)
+        return results
+    
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """Search several queries, using the backend's batched path when it has one"""
+        engine = self.engine
+        if not hasattr(engine, "search_batch"):
+            return [self.search(query, top_k=top_k) for query in queries]
+        
+        results = [self.result_cache.get(self.fingerprint, query, top_k, self.active) for query in queries]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            start = time.perf_counter()
+            with stage("search"):
+                fresh = engine.search_batch([queries[i] for i in missing], top_k=top_k)
+            self._observe(self.active, "query", (time.perf_counter() - start) * 1000 / len(missing))
+            for i, result in zip(missing, fresh):
+                self.result_cache.set(self.fingerprint, queries[i], top_k, self.active, result)
+                results[i] = result
+        return results
+    
+    @timed("index")
+    def add_documents(self, documents: Dict[str, List[str]]) -> Dict[str, int]:
+        """Add documents to the active backend's index"""
+        added = self.engine.add_documents(documents)
+        for document_id, chunks in documents.items():
+            self.document_fingerprints[document_id] = fingerprint_chunks(chunks)
+        self._index_changed()
+        return added
+    
+    def remove_document(self, document_id: str) -> bool:
+        """Remove a document from the active backend's index"""
+        removed = self.engine.remove_document(document_id)
+        if removed:
+            self.document_fingerprints.pop(document_id, None)
+            self._index_changed()
+        return removed
+    
+    def index_bytes(self) -> int:
+        """Approximate memory held by the current index: chunk texts plus vectors or postings"""
+        if self.active is None:
+            return 0
+        engine = self.engine
+        size = sum(len(text) for text in engine.chunks.values())
+        if self.active == "faiss":
+            if engine.index is not None:
+                size += engine.index.ntotal * engine.index.d * 4
+        elif self.active == "tfidf":
+            for matrix in (engine.chunk_vectors, engine.term_counts):
+                if matrix is not None:
+                    size += matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        else:
+            # Token lists and counters of Python strings
+            size *= BASIC_POSTINGS_OVERHEAD
+        return size
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Router and active index statistics"""
+        stats = {
+            "installed_backends": self.installed,
+            "loaded_backends": self.available,
+            "latency_budget_ms": self.latency_budget_ms,
+            "served": dict(self.served),
+            "last_selection": self.last_selection,
+            "fingerprint": self.fingerprint,
+            "result_cache": self.result_cache.stats(),
+        }
+        if self.active is not None:
+            engine = self.engines[self.active]
+            info = engine.get_index_info() if hasattr(engine, "get_index_info") else engine.get_stats()
+            stats["index"] = info
+        return stats
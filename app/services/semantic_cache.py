@@ -0,0 +1,170 @@
+"""
+Semantic answer cache for near-duplicate questions
+
+Answers are stored per document fingerprint together with the embedding of
+the question that produced them. A new question whose embedding is within a
+cosine-similarity threshold of a cached one reuses the stored answer instead
+of going through retrieval and the LLM again.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class _DocumentScope:
+    """Cached questions and answers for one document fingerprint"""
+    
+    def __init__(self, dimension: int, capacity: int):
+        # Dense index of L2-normalized question embeddings, one row per slot
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.entries: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+    
+    def search(self, embedding: np.ndarray) -> tuple:
+        """Return (slot, similarity) of the closest cached question"""
+        occupied = np.array([entry is not None for entry in self.entries])
+        if not occupied.any():
+            return -1, -1.0
+        similarities = self.vectors @ embedding
+        similarities[~occupied] = -1.0
+        slot = int(np.argmax(similarities))
+        return slot, float(similarities[slot])
+    
+    def free_slot(self) -> tuple:
+        """Return (slot, evicted) for a new entry, evicting the least recently used if full"""
+        for slot, entry in enumerate(self.entries):
+            if entry is None:
+                return slot, False
+        return int(np.argmin(self.last_used)), True
+    
+    @property
+    def size(self) -> int:
+        return sum(1 for entry in self.entries if entry is not None)
+
+
+class SemanticAnswerCache:
+    """
+    Per-document cache of answers looked up by question-embedding similarity
+    """
+    
+    def __init__(self, threshold: Optional[float] = None, max_entries_per_document: Optional[int] = None,
+                 max_documents: Optional[int] = None, ttl: Optional[float] = None):
+        self.threshold = threshold if threshold is not None else float(
+            os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")
+        )
+        self.max_entries_per_document = max_entries_per_document or int(
+            os.getenv("SEMANTIC_CACHE_MAX_PER_DOCUMENT", "256")
+        )
+        self.max_documents = max_documents or int(os.getenv("SEMANTIC_CACHE_MAX_DOCUMENTS", "32"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+        
+        self._scopes: "OrderedDict[str, _DocumentScope]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        self.evictions = 0
+        
+        logger.info(f"Initialized semantic answer cache (threshold={self.threshold})")
+    
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+    
+    def lookup(self, fingerprint: str, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a semantically equivalent question
+        
+        Args:
+            fingerprint: Document fingerprint the answer must belong to
+            embedding: Embedding of the new question
+        
+        Returns:
+            Cached entry with 'question', 'answer', 'similarity', or None on a miss
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            scope = self._scopes.get(fingerprint)
+            if scope is None or scope.vectors.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+            
+            self._scopes.move_to_end(fingerprint)
+            slot, similarity = scope.search(vector)
+            if slot < 0 or similarity < self.threshold:
+                self.misses += 1
+                return None
+            
+            entry = scope.entries[slot]
+            now = time.time()
+            if self.ttl and now - entry["created_at"] > self.ttl:
+                scope.entries[slot] = None
+                self.misses += 1
+                return None
+            
+            scope.last_used[slot] = now
+            self.hits += 1
+            return {**entry, "similarity": similarity}
+    
+    def store(self, fingerprint: str, embedding: np.ndarray, question: str, answer: Dict[str, Any]):
+        """
+        Cache an answer for a question about a document
+        
+        Args:
+            fingerprint: Document fingerprint
+            embedding: Embedding of the question
+            question: Question text
+            answer: Serialized answer (as returned by SimpleAnswerResult.to_dict)
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            scope = self._scopes.get(fingerprint)
+            if scope is None or scope.vectors.shape[1] != vector.shape[0]:
+                scope = _DocumentScope(vector.shape[0], self.max_entries_per_document)
+                self._scopes[fingerprint] = scope
+                while len(self._scopes) > self.max_documents:
+                    _, evicted = self._scopes.popitem(last=False)
+                    self.evictions += evicted.size
+            self._scopes.move_to_end(fingerprint)
+            
+            slot, evicted = scope.free_slot()
+            if evicted:
+                self.evictions += 1
+            now = time.time()
+            scope.vectors[slot] = vector
+            scope.entries[slot] = {"question": question, "answer": answer, "created_at": now}
+            scope.last_used[slot] = now
+            self.inserts += 1
+    
+    def invalidate(self, fingerprint: str) -> int:
+        """Drop all cached answers for a document fingerprint"""
+        with self._lock:
+            scope = self._scopes.pop(fingerprint, None)
+            return scope.size if scope is not None else 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss metrics and current size"""
+        lookups = self.hits + self.misses
+        with self._lock:
+            size = sum(scope.size for scope in self._scopes.values())
+            documents = len(self._scopes)
+        return {
+            "documents": documents,
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "inserts": self.inserts,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "threshold": self.threshold
+        }
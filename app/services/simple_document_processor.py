@@ -1,10 +1,11 @@
 import asyncio
-import pypdf
 import io
 import os
 from typing import List, Dict, Any
 from urllib.parse import urljoin, urlparse
 
+from app.utils.metrics import timed
+
 class SimpleDocumentProcessor:
     """
     Minimal document processor without Pydantic dependencies
@@ -16,6 +17,7 @@ class SimpleDocumentProcessor:
             'txt': self._process_text
         }
     
+    @timed("parse")
     async def process_document(self, doc_type: str, content: str, filename: str = "") -> List[str]:
         """
         Process a document and return extracted text chunks
@@ -24,7 +26,7 @@ class SimpleDocumentProcessor:
             doc_type: Type of document ('pdf', 'text', 'url')
             content: Document content (base64 for files, URL for web, text for text)
             filename: Optional filename for context
-            
+        
         Returns:
             List of text chunks extracted from the document
         """
@@ -37,7 +39,7 @@ class SimpleDocumentProcessor:
                 return await self._process_url(content)
             else:
                 raise ValueError(f"Unsupported document type: {doc_type}")
-                
+        
         except Exception as e:
             print(f"Error processing document: {str(e)}")
             # Return the content as-is if processing fails
@@ -47,6 +49,7 @@ class SimpleDocumentProcessor:
         """Process PDF content from base64 string"""
         try:
             import base64
+            import pypdf
             # Decode base64 content
             pdf_bytes = base64.b64decode(base64_content)
             
@@ -68,7 +71,7 @@ class SimpleDocumentProcessor:
                     continue
             
             return chunks if chunks else ["No text could be extracted from the PDF"]
-            
+        
         except Exception as e:
             print(f"Error processing PDF: {str(e)}")
             return ["Error processing PDF file"]
@@ -91,6 +94,7 @@ class SimpleDocumentProcessor:
             print(f"Error processing URL: {str(e)}")
             return ["Error processing URL"]
     
+    @timed("chunk")
     def _split_text_into_chunks(self, text: str, max_length: int = 2000, overlap: int = 200) -> List[str]:
         """Split text into overlapping chunks"""
         if len(text) <= max_length:
@@ -126,7 +130,8 @@ class SimpleDocumentProcessor:
                 break
         
         return chunks
-
+    
+    @timed("chunk")
     def _clean_text(self, text: str) -> str:
         """Basic text cleaning"""
         if not text:
@@ -1,10 +1,16 @@
 import os
 import numpy as np
 import faiss
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 
+from app.services.chunk_registry import ChunkRegistry, DEFAULT_DOCUMENT_ID
+from app.utils.cache import LRUCache
 from app.utils.logger import setup_logger
+from app.utils.metrics import stage, timed
+from app.utils.model_artifacts import load_packaged_model, packaged_model_path
+from app.utils.question_sets import load_question_set
+from app.utils.text_processing import normalize_question
 
 logger = setup_logger(__name__)
 
@@ -13,29 +19,106 @@ class VectorSearchService:
     FAISS-based vector search service for semantic document retrieval
     """
     
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, model: Optional[SentenceTransformer] = None,
+                 query_cache: Optional[LRUCache] = None):
         self.model_name = model_name or os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
-        self.model = None
+        self.model = model
         self.index = None
-        self.chunks = []
-        self.embeddings = None
+        self.registry = ChunkRegistry()
         
-        # Load the embedding model
-        self._load_model()
+        # Question embeddings do not depend on the indexed document, so they
+        # are cached across requests keyed by normalized question text
+        # (an empty cache is falsy, so test for None: spawned indexes must share it from the start)
+        self.query_cache = query_cache if query_cache is not None else LRUCache(
+            maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+        )
+        
+        # Load the embedding model unless an already loaded one was passed in
+        if self.model is None:
+            self._load_model()
+            self.warm_up_query_cache(os.getenv("QUERY_EMBEDDING_WARMUP", ""))
+    
+    def spawn(self) -> "VectorSearchService":
+        """An empty index sharing this one's embedding model and question embedding cache"""
+        return VectorSearchService(self.model_name, model=self.model, query_cache=self.query_cache)
     
     def _load_model(self):
-        """Load the sentence transformer model"""
+        """Load the sentence transformer model, from its packaged artifact if there is one"""
         try:
-            logger.info(f"Loading embedding model: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name)
+            path = packaged_model_path(self.model_name)
+            if path is not None:
+                logger.info(f"Loading packaged embedding model {self.model_name} from {path}")
+                self.model = load_packaged_model(path)
+            else:
+                logger.info(f"Loading embedding model: {self.model_name}")
+                self.model = SentenceTransformer(self.model_name)
             logger.info("Embedding model loaded successfully")
         except Exception as e:
             logger.error(f"Error loading embedding model: {str(e)}")
             raise
     
+    def warm_up_query_cache(self, question_set: str) -> int:
+        """
+        Pre-compute embeddings for a configured question set
+        
+        Args:
+            question_set: "standard", a path to a question file, or "" to skip
+        
+        Returns:
+            Number of questions embedded
+        """
+        try:
+            questions = load_question_set(question_set)
+        except Exception as e:
+            logger.warning(f"Could not load query warm-up set '{question_set}': {e}")
+            return 0
+        
+        keys = list(dict.fromkeys(normalize_question(q) for q in questions if q.strip()))
+        if not keys:
+            return 0
+        
+        embeddings = self._encode_queries(keys)
+        for key, embedding in zip(keys, embeddings):
+            self.query_cache.set(key, embedding[np.newaxis, :])
+        logger.info(f"Warmed query embedding cache with {len(keys)} questions")
+        return len(keys)
+    
+    @timed("embed")
+    def _encode_queries(self, texts: List[str]) -> np.ndarray:
+        """Encode and L2-normalize query texts"""
+        embeddings = self.model.encode(
+            texts,
+            convert_to_numpy=True
+        ).astype(np.float32)
+        faiss.normalize_L2(embeddings)
+        embeddings.flags.writeable = False
+        return embeddings
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Get the normalized embedding of a question, using the cache when possible
+        
+        Args:
+            query: Question text
+        
+        Returns:
+            Array of shape (1, dimension)
+        """
+        key = normalize_question(query)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self._encode_queries([key])
+            self.query_cache.set(key, embedding)
+        return embedding
+    
+    @property
+    def chunks(self) -> Dict[int, str]:
+        """Indexed chunk texts keyed by chunk id"""
+        return self.registry.texts
+    
     def create_index(self, text_chunks: List[str]) -> None:
         """
-        Create FAISS index from text chunks
+        Create FAISS index from text chunks, replacing any indexed documents
         
         Args:
             text_chunks: List of text chunks to index
@@ -46,29 +129,8 @@ class VectorSearchService:
             
             logger.info(f"Creating FAISS index for {len(text_chunks)} chunks")
             
-            # Store chunks
-            self.chunks = text_chunks
-            
-            # Generate embeddings
-            logger.info("Generating embeddings...")
-            self.embeddings = self.model.encode(
-                text_chunks,
-                convert_to_numpy=True,
-                show_progress_bar=True
-            )
-            
-            # Create FAISS index
-            dimension = self.embeddings.shape[1]
-            logger.info(f"Creating FAISS index with dimension: {dimension}")
-            
-            # Use IndexFlatIP for cosine similarity (inner product after normalization)
-            self.index = faiss.IndexFlatIP(dimension)
-            
-            # Normalize embeddings for cosine similarity
-            faiss.normalize_L2(self.embeddings)
-            
-            # Add embeddings to index
-            self.index.add(self.embeddings)
+            self.clear_index()
+            self.add_documents({DEFAULT_DOCUMENT_ID: text_chunks})
             
             logger.info(f"FAISS index created successfully with {self.index.ntotal} vectors")
             
@@ -76,6 +138,115 @@ class VectorSearchService:
             logger.error(f"Error creating FAISS index: {str(e)}")
             raise
     
+    def add_documents(self, documents: Dict[str, List[str]]) -> Dict[str, int]:
+        """
+        Embed and add documents without re-embedding the existing corpus
+        
+        Args:
+            documents: Mapping of document id to its text chunks. A document id
+                that is already indexed is replaced.
+        
+        Returns:
+            Mapping of document id to number of chunks added
+        """
+        try:
+            added = {}
+            for document_id, text_chunks in documents.items():
+                if document_id in self.registry.document_chunks:
+                    self.remove_document(document_id, compact=False)
+                if not text_chunks:
+                    added[document_id] = 0
+                    continue
+                
+                logger.info(f"Adding document '{document_id}' with {len(text_chunks)} chunks")
+                
+                # Generate embeddings
+                with stage("embed"):
+                    embeddings = self.model.encode(
+                        text_chunks,
+                        convert_to_numpy=True,
+                        show_progress_bar=True
+                    ).astype(np.float32)
+                
+                # Normalize embeddings for cosine similarity
+                faiss.normalize_L2(embeddings)
+                
+                if self.index is None:
+                    # IndexFlatIP gives cosine similarity after normalization; the
+                    # ID map lets us address vectors by stable chunk id
+                    dimension = embeddings.shape[1]
+                    logger.info(f"Creating FAISS index with dimension: {dimension}")
+                    self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+                
+                ids = self.registry.add(document_id, text_chunks)
+                self.index.add_with_ids(embeddings, np.array(ids, dtype=np.int64))
+                added[document_id] = len(ids)
+            
+            self._maybe_compact()
+            return added
+        
+        except Exception as e:
+            logger.error(f"Error adding documents to FAISS index: {str(e)}")
+            raise
+    
+    def remove_document(self, document_id: str, compact: bool = True) -> bool:
+        """
+        Remove a document from the index
+        
+        The document's vectors are tombstoned and skipped by searches; they are
+        physically removed once enough tombstones accumulate.
+        
+        Args:
+            document_id: Document identifier
+            compact: Whether to compact the index if it is due
+        
+        Returns:
+            bool: True if the document was indexed
+        """
+        ids = self.registry.remove(document_id)
+        if not ids:
+            return False
+        
+        logger.info(f"Removed document '{document_id}' ({len(ids)} chunks tombstoned)")
+        if compact:
+            self._maybe_compact()
+        return True
+    
+    def compact(self) -> int:
+        """
+        Physically remove tombstoned vectors from the FAISS index
+        
+        Returns:
+            Number of vectors removed
+        """
+        purged = self.registry.purge()
+        if purged and self.index is not None:
+            self.index.remove_ids(np.array(purged, dtype=np.int64))
+        return len(purged)
+    
+    def _maybe_compact(self):
+        """Compact when tombstones exceed the configured ratio"""
+        if self.registry.needs_compaction():
+            self.compact()
+    
+    def _search_ids(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """Embed a query and return live (chunk_id, score) pairs"""
+        query_embedding = self.embed_query(query)
+        
+        # Over-fetch so tombstoned vectors can be skipped
+        fetch_k = min(top_k + len(self.registry.tombstones), self.index.ntotal)
+        if fetch_k <= 0:
+            return []
+        scores, indices = self.index.search(query_embedding, fetch_k)
+        
+        results = []
+        for score, idx in zip(scores[0], indices[0]):
+            if idx >= 0 and self.registry.is_live(int(idx)):
+                results.append((int(idx), float(score)))
+                if len(results) == top_k:
+                    break
+        return results
+    
     def search(self, query: str, top_k: int = 5) -> List[str]:
         """
         Search for relevant text chunks using semantic similarity
@@ -96,25 +267,12 @@ class VectorSearchService:
             
             logger.info(f"Searching for query: '{query[:50]}...' with top_k={top_k}")
             
-            # Generate query embedding
-            query_embedding = self.model.encode(
-                [query.strip()],
-                convert_to_numpy=True
-            )
-            
-            # Normalize query embedding
-            faiss.normalize_L2(query_embedding)
-            
-            # Search
-            scores, indices = self.index.search(query_embedding, min(top_k, len(self.chunks)))
-            
             # Extract relevant chunks
             relevant_chunks = []
-            for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                if idx >= 0 and idx < len(self.chunks):  # Valid index
-                    chunk = self.chunks[idx]
-                    relevant_chunks.append(chunk)
-                    logger.debug(f"Result {i+1}: Score={score:.4f}, Chunk length={len(chunk)}")
+            for i, (idx, score) in enumerate(self._search_ids(query, top_k)):
+                chunk = self.chunks[idx]
+                relevant_chunks.append(chunk)
+                logger.debug(f"Result {i+1}: Score={score:.4f}, Chunk length={len(chunk)}")
             
             logger.info(f"Found {len(relevant_chunks)} relevant chunks")
             return relevant_chunks
@@ -143,24 +301,11 @@ class VectorSearchService:
             
             logger.info(f"Searching for query with scores: '{query[:50]}...' with top_k={top_k}")
             
-            # Generate query embedding
-            query_embedding = self.model.encode(
-                [query.strip()],
-                convert_to_numpy=True
-            )
-            
-            # Normalize query embedding
-            faiss.normalize_L2(query_embedding)
-            
-            # Search
-            scores, indices = self.index.search(query_embedding, min(top_k, len(self.chunks)))
-            
             # Extract relevant chunks with scores
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx >= 0 and idx < len(self.chunks):  # Valid index
-                    chunk = self.chunks[idx]
-                    results.append((chunk, float(score)))
+            results = [
+                (self.chunks[idx], score)
+                for idx, score in self._search_ids(query, top_k)
+            ]
             
             logger.info(f"Found {len(results)} relevant chunks with scores")
             return results
@@ -177,19 +322,21 @@ class VectorSearchService:
             Dictionary with index information
         """
         if self.index is None:
-            return {"status": "not_created"}
+            return {"status": "not_created", "query_cache": self.query_cache.stats()}
         
         return {
             "status": "created",
             "total_vectors": self.index.ntotal,
             "dimension": self.index.d,
-            "total_chunks": len(self.chunks),
-            "model_name": self.model_name
+            "total_chunks": self.registry.num_live,
+            "total_documents": len(self.registry.document_chunks),
+            "tombstones": len(self.registry.tombstones),
+            "model_name": self.model_name,
+            "query_cache": self.query_cache.stats()
         }
     
     def clear_index(self):
         """Clear the current index and chunks"""
         self.index = None
-        self.chunks = []
-        self.embeddings = None
+        self.registry.reset()
         logger.info("Index cleared")
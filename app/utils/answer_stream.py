@@ -0,0 +1,116 @@
+"""
+Streaming of answers as Server-Sent Events or newline-delimited JSON
+
+Answers are emitted as soon as each question completes, optionally preceded
+by the answer text as the LLM streams it, and followed by a summary event
+with timings.
+"""
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping, Optional
+
+STREAM_MEDIA_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# Keep proxies from buffering the stream
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def stream_format(query_params: Mapping[str, str], headers: Mapping[str, str]) -> str:
+    """Pick "ndjson" or "sse" from a ?format= parameter or the Accept header"""
+    requested = query_params.get("format", "").lower()
+    if requested in STREAM_MEDIA_TYPES:
+        return requested
+    return "ndjson" if "application/x-ndjson" in headers.get("accept", "") else "sse"
+
+
+def encode_event(event: str, data: Dict[str, Any], fmt: str) -> str:
+    """Encode one event in the chosen stream format"""
+    if fmt == "ndjson":
+        return json.dumps({"event": event, **data}) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_answers(pipeline, questions: List[str], serialize: Callable[[Any], Dict[str, Any]],
+                         fmt: str = "sse", use_cache: bool = True, stream_tokens: bool = False,
+                         started_at: Optional[float] = None,
+                         summarize: Optional[Callable[[List[Any]], Dict[str, Any]]] = None) -> AsyncIterator[str]:
+    """
+    Answer questions through a QAPipeline and stream the events
+    
+    Events:
+        token: {"index", "text"} answer text as the LLM produces it (stream_tokens only)
+        answer: {"index", "elapsed_ms", "served_by", ...serialize(result)} when a question completes
+        error: {"detail"} if answering fails part-way
+        summary: {"total_questions", "answered", "time_to_first_answer", "processing_time", ...summarize(results)}
+    
+    Args:
+        pipeline: QAPipeline with an index already built
+        questions: Questions to answer
+        serialize: Converts an answer into the endpoint's response fields
+        fmt: "sse" or "ndjson"
+        use_cache: Whether cached answers may be served
+        stream_tokens: Also emit token events while answers are generated
+        started_at: perf_counter() at the start of the request, for the timings
+        summarize: Builds extra summary fields from the answers in question order
+    
+    Yields:
+        Encoded events
+    """
+    started_at = started_at if started_at is not None else time.perf_counter()
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    def on_token(position: int, text: str):
+        queue.put_nowait(("token", {"index": position, "text": text}))
+    
+    async def produce():
+        try:
+            async for position, result in pipeline.iter_answers(
+                questions, use_cache, on_token if stream_tokens else None
+            ):
+                queue.put_nowait(("answer", position, result))
+        except Exception as e:
+            queue.put_nowait(("error", {"detail": f"Answering failed: {str(e)}"}))
+        finally:
+            queue.put_nowait(None)
+    
+    producer = asyncio.ensure_future(produce())
+    results: List[Any] = [None] * len(questions)
+    first_answer_ms = None
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if item[0] != "answer":
+                yield encode_event(item[0], item[1], fmt)
+                continue
+            
+            _, position, result = item
+            results[position] = result
+            elapsed_ms = round((time.perf_counter() - started_at) * 1000, 1)
+            if first_answer_ms is None:
+                first_answer_ms = elapsed_ms
+            yield encode_event("answer", {
+                "index": position,
+                "elapsed_ms": elapsed_ms,
+                "served_by": result.served_by,
+                **serialize(result)
+            }, fmt)
+        
+        answered = [result for result in results if result is not None]
+        summary = {
+            "total_questions": len(questions),
+            "answered": len(answered),
+            "time_to_first_answer": first_answer_ms / 1000 if first_answer_ms is not None else None,
+            "processing_time": round(time.perf_counter() - started_at, 3),
+        }
+        if summarize is not None and len(answered) == len(questions):
+            summary.update(summarize(results))
+        yield encode_event("summary", summary, fmt)
+    finally:
+        # Client disconnected or stream finished: stop outstanding work
+        producer.cancel()
@@ -1,59 +1,217 @@
+"""
+Logging pipeline
+
+Every module logger hands its records to one queue, and a single background
+listener formats them and writes them to the console and the rotating log
+file, so a log call on the event loop never waits on disk and only one
+handler rotates logs/app.log. Workers forked from the process (gunicorn
+with preload_app) each write and rotate their own logs/app.<pid>.log.
+Records are JSON lines by default and carry the correlation id of the
+request (or job) that produced them. Debug records are sampled per request,
+so a sampled request keeps all of its debug lines.
+"""
+import atexit
+import contextvars
+import copy
+import json
 import logging
-import sys
 import os
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
 
-def setup_logger(name: str, level: str = None) -> logging.Logger:
+# Request header carrying the correlation id; generated when absent and echoed in the response
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Longest client-supplied correlation id that is kept
+MAX_REQUEST_ID_LENGTH = 128
+
+# Attributes every LogRecord has; anything else was passed through extra= and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_debug_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar("debug_sampled", default=True)
+
+_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+def bind_request_id(request_id: Optional[str] = None) -> str:
     """
-    Set up a logger with both file and console handlers
+    Set the correlation id for the current request or job
+    
+    Also decides, at LOG_DEBUG_SAMPLE_RATE, whether the request's debug
+    records are kept.
     
     Args:
-        name: Logger name
-        level: Log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        request_id: Client-supplied id, or None to generate one
     
     Returns:
-        Configured logger instance
+        The id in effect
     """
-    if level is None:
-        level = os.getenv("LOG_LEVEL", "INFO").upper()
-    
-    logger = logging.getLogger(name)
-    
-    # Avoid duplicate handlers
-    if logger.handlers:
-        return logger
+    request_id = (request_id or "").strip()[:MAX_REQUEST_ID_LENGTH] or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    _debug_sampled.set(random.random() < float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1")))
+    return request_id
+
+def debug_sampled(logger: logging.Logger) -> bool:
+    """Whether a debug record would be kept; guards building expensive debug messages on hot paths"""
+    return _debug_sampled.get() and logger.isEnabledFor(logging.DEBUG)
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the correlation id and drops debug records of unsampled requests"""
     
-    logger.setLevel(getattr(logging, level))
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and not _debug_sampled.get():
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields and any traceback as keys"""
     
-    # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class _RecordQueueHandler(QueueHandler):
+    """Queues records with the message and traceback rendered, but left for the listener to format"""
     
-    # Console handler
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments and exceptions may change or be freed before the listener gets to them
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _formatter() -> logging.Formatter:
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        return logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+    return JsonFormatter()
+
+def _output_handlers() -> list:
+    """Console and rotating file handlers, owned by the listener thread"""
+    formatter = _formatter()
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(getattr(logging, level))
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
-    # File handler (rotating)
+    # File handler (rotating); LOG_FILE= logs to the console only
+    log_file = os.getenv("LOG_FILE", "logs/app.log")
+    if log_file:
+        file_handler = _file_handler(log_file, formatter)
+        if file_handler is not None:
+            handlers.append(file_handler)
+    return handlers
+
+def _file_handler(log_file: str, formatter: logging.Formatter) -> Optional[RotatingFileHandler]:
     try:
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
-        
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
         file_handler = RotatingFileHandler(
-            'logs/app.log',
+            log_file,
             maxBytes=10*1024*1024,  # 10MB
             backupCount=5
         )
-        file_handler.setLevel(getattr(logging, level))
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        return file_handler
     except Exception as e:
         # If file logging fails, continue with console only
-        logger.warning(f"Could not set up file logging: {e}")
+        sys.stderr.write(f"Could not set up file logging: {e}\n")
+        return None
+
+def worker_log_file(log_file: str, pid: int) -> str:
+    """A forked worker's own log file: logs/app.log becomes logs/app.<pid>.log"""
+    root, extension = os.path.splitext(log_file)
+    return f"{root}.{pid}{extension}"
+
+def _start_listener(handlers: list):
+    global _listener
+    log_queue = queue.SimpleQueue()
+    _handler.queue = log_queue
+    _listener = QueueListener(log_queue, *handlers)
+    _listener.start()
+
+def _restart_after_fork():
+    # The listener thread does not survive fork(); each worker runs its own.
+    # Workers write their own file: several processes rotating one file would
+    # each rename it from under the others.
+    if _listener is None:
+        return
+    handlers = []
+    for handler in _listener.handlers:
+        if isinstance(handler, RotatingFileHandler):
+            handler.close()
+            handler = _file_handler(worker_log_file(handler.baseFilename, os.getpid()), handler.formatter)
+            if handler is None:
+                continue
+        handlers.append(handler)
+    _start_listener(handlers)
+
+def _queue_handler() -> QueueHandler:
+    """The process-wide handler feeding the background writer, created on first use"""
+    global _handler
+    if _handler is None:
+        _handler = _RecordQueueHandler(None)
+        _handler.addFilter(ContextFilter())
+        _start_listener(_output_handlers())
+        atexit.register(stop_logging)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+    return _handler
+
+def stop_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logger(name: str, level: str = None) -> logging.Logger:
+    """
+    Set up a logger that writes through the shared background pipeline
+    
+    Args:
+        name: Logger name
+        level: Log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+    
+    Returns:
+        Configured logger instance
+    """
+    if level is None:
+        level = os.getenv("LOG_LEVEL", "INFO").upper()
+    
+    logger = logging.getLogger(name)
+    
+    # Avoid duplicate handlers
+    if logger.handlers:
+        return logger
+    
+    logger.setLevel(getattr(logging, level))
+    logger.addHandler(_queue_handler())
     
     return logger
 
@@ -0,0 +1,377 @@
+"""
+Per-stage latency metrics
+
+Pipeline stages (parse, chunk, embed, index, search, prompt, llm) are timed
+with stage() or @timed(). A stage nested in another is only counted in the
+inner one, so a request's stage times add up to at most its wall time
+(concurrent LLM calls are summed). Each timing feeds a process-wide
+histogram, exported with the service gauges in the Prometheus text format,
+and the breakdown of the request it belongs to, which is returned in the
+response metadata.
+
+With several worker processes, set METRICS_DIR to a directory shared by
+them (gunicorn.conf.py does): each worker publishes a snapshot of its
+metrics there every METRICS_SNAPSHOT_INTERVAL seconds, and /metrics, served
+by any one worker, sums the counters and histograms of all workers, exited
+ones included so totals never go back, and reports the gauges of live
+workers with a pid label.
+"""
+import asyncio
+import contextvars
+import functools
+import glob
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+STAGES = ("parse", "chunk", "embed", "index", "search", "prompt", "llm")
+
+# Histogram bucket upper bounds in seconds, from an in-memory search to a slow LLM call
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Starlette appends "; charset=utf-8" to text responses
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# (name, type, help, [(labels, value)]) for one exported metric family
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        with self._lock:
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[position] += 1
+                    break
+            self.sum += value
+            self.count += 1
+    
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+    
+    def add(self, state: Dict[str, Any]):
+        """Add the counts of another process's histogram, from state()"""
+        with self._lock:
+            self.counts = [mine + theirs for mine, theirs in zip(self.counts, state["counts"])]
+            self.sum += state["sum"]
+            self.count += state["count"]
+    
+    def samples(self, name: str, labels: Dict[str, str]) -> List[Tuple[str, Dict[str, str], float]]:
+        """Prometheus samples: cumulative _bucket series, then _sum and _count"""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append((f"{name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+        samples.append((f"{name}_bucket", {**labels, "le": "+Inf"}, count))
+        samples.append((f"{name}_sum", labels, total))
+        samples.append((f"{name}_count", labels, count))
+        return samples
+
+
+class _Frame:
+    __slots__ = ("nested", "nested_cpu")
+    
+    def __init__(self):
+        self.nested = 0.0
+        self.nested_cpu = 0.0
+
+
+stage_seconds: Dict[str, Histogram] = {name: Histogram() for name in STAGES}
+requests_in_flight = 0
+
+_frame: contextvars.ContextVar[Optional[_Frame]] = contextvars.ContextVar("stage_frame", default=None)
+_breakdown: contextvars.ContextVar[Optional[Dict[str, List[float]]]] = contextvars.ContextVar(
+    "stage_breakdown", default=None
+)
+# CPU time is only measured for profiled requests
+_track_cpu: contextvars.ContextVar[bool] = contextvars.ContextVar("stage_track_cpu", default=False)
+
+
+def start_breakdown():
+    """Collect the stage times of the current request (or job) from here on"""
+    _breakdown.set({})
+
+
+def track_cpu_time():
+    """Also measure the CPU time of the current request's stages"""
+    _track_cpu.set(True)
+
+
+def detach_breakdown():
+    """Stop counting this task's stages towards the request that started it (for background work)"""
+    _breakdown.set(None)
+
+
+def stage_breakdown() -> Dict[str, Dict[str, float]]:
+    """Milliseconds (wall, and CPU if tracked) and number of timings per stage for the current request"""
+    breakdown = _breakdown.get() or {}
+    report = {}
+    for name in STAGES:
+        if name in breakdown:
+            wall, count, cpu = breakdown[name]
+            report[name] = {"ms": round(wall * 1000, 2), "count": int(count)}
+            if _track_cpu.get():
+                report[name]["cpu_ms"] = round(cpu * 1000, 2)
+    return report
+
+
+def record(name: str, seconds: float, cpu_seconds: float = 0.0):
+    """Add a stage timing to its histogram and to the current request's breakdown"""
+    stage_seconds[name].observe(seconds)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        entry = breakdown.setdefault(name, [0.0, 0, 0.0])
+        entry[0] += seconds
+        entry[1] += 1
+        entry[2] += cpu_seconds
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a pipeline stage, excluding stages nested in it"""
+    parent = _frame.get()
+    frame = _Frame()
+    token = _frame.set(frame)
+    track_cpu = _track_cpu.get()
+    cpu_started = time.thread_time() if track_cpu else 0.0
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        # CPU time of this thread, including other tasks interleaved at awaits
+        cpu = time.thread_time() - cpu_started if track_cpu else 0.0
+        _frame.reset(token)
+        if parent is not None:
+            parent.nested += elapsed
+            parent.nested_cpu += cpu
+        record(name, max(0.0, elapsed - frame.nested), max(0.0, cpu - frame.nested_cpu))
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of a function or coroutine function as a stage"""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def timed_coroutine(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return timed_coroutine
+        
+        @functools.wraps(func)
+        def timed_function(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return timed_function
+    return decorate
+
+
+@contextmanager
+def track_in_flight():
+    """Count a request as in flight for the duration of the block"""
+    global requests_in_flight
+    requests_in_flight += 1
+    try:
+        yield
+    finally:
+        requests_in_flight -= 1
+
+
+def cache_families(caches: Dict[str, Optional[Dict[str, Any]]]) -> List[MetricFamily]:
+    """Hit, miss and hit-ratio families from cache stats() dicts with "hits" and "misses" (None: disabled)"""
+    hits, misses, ratios = [], [], []
+    for cache, stats in caches.items():
+        if stats is None:
+            continue
+        labels = {"cache": cache}
+        lookups = stats["hits"] + stats["misses"]
+        hits.append((labels, stats["hits"]))
+        misses.append((labels, stats["misses"]))
+        ratios.append((labels, stats["hits"] / lookups if lookups else 0.0))
+    return [
+        ("qa_cache_hits_total", "counter", "Cache lookups that hit", hits),
+        ("qa_cache_misses_total", "counter", "Cache lookups that missed", misses),
+        ("qa_cache_hit_ratio", "gauge", "Hits over lookups since start", ratios),
+    ]
+
+
+def service_families(pipeline, job_queue, prefetcher, ingestions, sessions, admission) -> List[MetricFamily]:
+    """Cache hit rates, queue depths, work in progress and admission state of an app's services"""
+    scheduler = pipeline.scheduler.stats()
+    admitted = admission.stats()
+    query_engine = pipeline.retriever.engines.get("faiss")
+    caches = {
+        "answer": pipeline.answer_cache.stats() if pipeline.answer_cache is not None else None,
+        "semantic": pipeline.semantic_cache.stats() if pipeline.semantic_cache is not None else None,
+        "retrieval": pipeline.retriever.result_cache.stats(),
+        "query_embedding": query_engine.query_cache.stats() if query_engine is not None else None,
+    }
+    return cache_families(caches) + [
+        ("qa_queue_depth", "gauge", "Work waiting to start", [
+            ({"queue": "llm"}, scheduler["queued"]),
+            ({"queue": "llm_background"}, scheduler["background_queued"]),
+            ({"queue": "jobs"}, job_queue.stats()["queued"]),
+            ({"queue": "ingestion"}, admitted["queued"]),
+        ]),
+        ("qa_in_progress", "gauge", "Work running", [
+            ({"work": "llm"}, scheduler["in_flight"]),
+            ({"work": "llm_background"}, scheduler["background_in_flight"]),
+            ({"work": "ingestion"}, ingestions.in_flight),
+            ({"work": "prefetch"}, len(prefetcher.jobs)),
+        ]),
+        ("qa_document_sessions", "gauge", "Registered document sessions", [({}, len(sessions.sessions))]),
+        ("qa_admission_reserved_bytes", "gauge", "Estimated memory of running ingestions",
+         [({}, admitted["reserved_bytes"])]),
+        ("qa_admission_rejected_total", "counter", "Requests turned away with 429", [({}, admitted["rejected"])]),
+    ]
+
+
+def render(families: Iterable[MetricFamily] = ()) -> str:
+    """
+    Prometheus text exposition of the stage histograms, in-flight requests and the given families
+    
+    Aggregated over every worker's snapshot when METRICS_DIR is set.
+    """
+    families = _with_in_flight(families)
+    stages = stage_seconds
+    directory = os.getenv("METRICS_DIR", "")
+    if directory:
+        write_snapshot(directory, families)
+        stages, families = aggregate(read_snapshots(directory))
+    
+    lines = [
+        "# HELP qa_stage_seconds Time spent in each pipeline stage, excluding nested stages",
+        "# TYPE qa_stage_seconds histogram",
+    ]
+    for name in STAGES:
+        for sample, labels, value in stages[name].samples("qa_stage_seconds", {"stage": name}):
+            lines.append(_sample_line(sample, labels, value))
+    
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(_sample_line(name, labels, value))
+    return "\n".join(lines) + "\n"
+
+
+def _with_in_flight(families: Iterable[MetricFamily]) -> List[MetricFamily]:
+    return [("qa_requests_in_flight", "gauge", "HTTP requests being handled", [({}, requests_in_flight)]), *families]
+
+
+def write_snapshot(directory: str, families: List[MetricFamily]):
+    """Publish this process's stage histograms and families for the other workers' /metrics"""
+    snapshot = {
+        "pid": os.getpid(),
+        "stages": {name: stage_seconds[name].state() for name in STAGES},
+        "families": families,
+    }
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    # Written aside and renamed, so readers never see a partial snapshot
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_snapshots(directory: str) -> List[Dict[str, Any]]:
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def aggregate(snapshots: List[Dict[str, Any]]) -> Tuple[Dict[str, Histogram], List[MetricFamily]]:
+    """
+    Combine worker snapshots: counters and histograms summed over all of
+    them, gauges kept per live worker under a pid label
+    """
+    stages = {name: Histogram() for name in STAGES}
+    merged: Dict[str, Tuple[str, str, Dict[tuple, list]]] = {}
+    for snapshot in snapshots:
+        for name, state in snapshot["stages"].items():
+            if name in stages:
+                stages[name].add(state)
+        alive = _alive(snapshot["pid"])
+        for name, kind, help_text, samples in snapshot["families"]:
+            if kind == "gauge":
+                if not alive:
+                    continue
+                samples = [({**labels, "pid": str(snapshot["pid"])}, value) for labels, value in samples]
+            series = merged.setdefault(name, (kind, help_text, {}))[2]
+            for labels, value in samples:
+                entry = series.setdefault(tuple(sorted(labels.items())), [labels, 0])
+                entry[1] += value
+    families = [
+        (name, kind, help_text, [(labels, value) for labels, value in series.values()])
+        for name, (kind, help_text, series) in merged.items()
+    ]
+    return stages, families
+
+
+def _alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+async def publish_snapshots(collect: Callable[[], List[MetricFamily]], interval: Optional[float] = None):
+    """
+    Keep this worker's snapshot in METRICS_DIR fresh, for /metrics served by the other workers
+    
+    Args:
+        collect: Returns the app's service families (as passed to render())
+        interval: Seconds between snapshots (METRICS_SNAPSHOT_INTERVAL)
+    """
+    directory = os.getenv("METRICS_DIR", "")
+    if not directory:
+        return
+    interval = interval if interval is not None else float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5"))
+    while True:
+        families = _with_in_flight(collect())
+        await asyncio.to_thread(write_snapshot, directory, families)
+        await asyncio.sleep(interval)
+
+
+def _sample_line(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+        name = f"{name}{{{rendered}}}"
+    return f"{name} {_format_value(value)}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,199 @@
+"""
+Packaged, memory-mapped embedding model artifacts
+
+package_model() writes a SentenceTransformer to a local directory with its
+weights in safetensors files and a manifest naming the model. A process
+that finds the artifact for its EMBEDDING_MODEL loads it from disk with the
+HuggingFace hub in offline mode, so nothing is resolved or downloaded, and
+then points the transformer's weights at a read-only memory map of the
+safetensors files. The weights are then page cache backed by the file
+rather than private memory: every worker (and every restart) maps the same
+pages instead of holding its own copy.
+"""
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Written next to the model files; its presence marks a packaged model
+MANIFEST_FILE = "embedding_artifact.json"
+
+# safetensors dtype names and the torch dtypes they map to
+SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def artifact_dir() -> str:
+    """Where the packaged embedding model lives (EMBEDDING_MODEL_PATH)"""
+    return os.getenv("EMBEDDING_MODEL_PATH", "models/embedding")
+
+
+def read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    """The manifest of a packaged model directory, or None if there is none"""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def packaged_model_path(model_name: str, directory: Optional[str] = None) -> Optional[str]:
+    """The packaged artifact's directory if it holds model_name, else None"""
+    directory = directory or artifact_dir()
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    if manifest.get("model_name") != model_name:
+        logger.warning(
+            f"Packaged model in {directory} is {manifest.get('model_name')}, not {model_name}; ignoring it"
+        )
+        return None
+    return directory
+
+
+def hub_offline():
+    """Stop the HuggingFace libraries from contacting the hub; read when they are imported"""
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+
+def read_safetensors_header(path: str) -> Tuple[int, Dict[str, Any]]:
+    """
+    Parse a safetensors file's header
+    
+    Returns:
+        Offset of the tensor data in the file, and the tensor entries by name
+        (dtype, shape and data_offsets relative to the data)
+    """
+    with open(path, "rb") as f:
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+    header.pop("__metadata__", None)
+    return 8 + length, header
+
+
+def mmap_safetensors(path: str) -> Dict[str, Any]:
+    """
+    Tensors of a safetensors file, backed by a private memory map of it
+    
+    Pages are read from the page cache on first access and stay shared with
+    every other process mapping the file as long as nobody writes to them.
+    """
+    import torch
+    
+    data_start, header = read_safetensors_header(path)
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    tensors = {}
+    for name, entry in header.items():
+        dtype = getattr(torch, SAFETENSORS_DTYPES[entry["dtype"]])
+        begin, end = entry["data_offsets"]
+        offset = data_start + begin
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        if offset % itemsize:
+            # Not aligned for a view into the map: copy this one tensor
+            with open(path, "rb") as f:
+                f.seek(offset)
+                buffer = bytearray(f.read(end - begin))
+            tensors[name] = torch.frombuffer(buffer, dtype=dtype).reshape(entry["shape"])
+            continue
+        tensor = torch.empty(0, dtype=dtype)
+        tensor.set_(storage, offset // itemsize, torch.Size(entry["shape"]))
+        tensors[name] = tensor
+    return tensors
+
+
+def map_weights(model, directory: str) -> int:
+    """
+    Point the weights of a loaded SentenceTransformer's transformer modules at
+    memory maps of their safetensors files, freeing the deserialized copies
+    
+    Returns:
+        Number of tensors mapped
+    """
+    with open(os.path.join(directory, "modules.json"), encoding="utf-8") as f:
+        modules = json.load(f)
+    
+    mapped = 0
+    for entry in modules:
+        module = model[entry["idx"]]
+        auto_model = getattr(module, "auto_model", None)
+        if auto_model is None:
+            continue
+        state = {}
+        for path in sorted(Path(directory, entry["path"]).glob("*.safetensors")):
+            state.update(mmap_safetensors(str(path)))
+        if not state:
+            continue
+        result = auto_model.load_state_dict(state, strict=False, assign=True)
+        if result.missing_keys:
+            logger.warning(f"{len(result.missing_keys)} weights of {entry['name']} were not mapped and stay in memory")
+        mapped += len(state) - len(result.unexpected_keys)
+    return mapped
+
+
+def load_packaged_model(directory: str):
+    """
+    Load a packaged SentenceTransformer from disk, without the hub, with memory-mapped weights
+    
+    EMBEDDING_MMAP=false keeps the weights as loaded, in private memory.
+    """
+    hub_offline()
+    from sentence_transformers import SentenceTransformer
+    
+    model = SentenceTransformer(directory, device="cpu")
+    model.eval()
+    if os.getenv("EMBEDDING_MMAP", "true").lower() == "true":
+        mapped = map_weights(model, directory)
+        logger.info(f"Memory-mapped {mapped} weight tensors from {directory}")
+    return model
+
+
+def package_model(model_name: str, directory: str) -> Dict[str, Any]:
+    """
+    Write a SentenceTransformer as a packaged artifact (safetensors weights and a manifest)
+    
+    Args:
+        model_name: Hub name or local path of the model
+        directory: Output directory, created if needed
+    
+    Returns:
+        The manifest
+    """
+    import sentence_transformers
+    from sentence_transformers import SentenceTransformer
+    
+    model = SentenceTransformer(model_name, device="cpu")
+    model.save(directory, safe_serialization=True)
+    # Only the safetensors weights are loaded; drop pickled duplicates
+    for path in Path(directory).rglob("pytorch_model*.bin"):
+        path.unlink()
+    if not any(Path(directory).rglob("*.safetensors")):
+        raise RuntimeError(f"{model_name} was not saved as safetensors")
+    
+    files = {}
+    for path in sorted(Path(directory).rglob("*")):
+        if path.is_file() and path.name != MANIFEST_FILE:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            files[str(path.relative_to(directory))] = {"bytes": path.stat().st_size, "sha256": digest.hexdigest()}
+    
+    manifest = {
+        "model_name": model_name,
+        "sentence_transformers": sentence_transformers.__version__,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "files": files,
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,237 @@
+"""
+On-demand request profiling
+
+A request carrying the profiling token (X-Profile header or ?profile=) is
+run under a sampling profiler: a background thread records the event loop
+thread's stack every few milliseconds. The samples are stored as folded
+stacks, the input format of flamegraph.pl, speedscope and inferno, next to
+a summary with the request's per-stage wall and CPU time and its top
+allocations (from tracemalloc). Nothing runs for requests without the flag,
+and profiling is off unless PROFILE_TOKEN is set.
+"""
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional
+
+from fastapi.responses import JSONResponse
+
+from app.utils.logger import setup_logger
+from app.utils.metrics import stage_breakdown, track_cpu_time
+
+logger = setup_logger(__name__)
+
+# Request header (or query parameter "profile") carrying the profiling token
+PROFILE_HEADER = "X-Profile"
+
+# Response header naming the stored profile
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Allocation sites reported per profile
+TOP_ALLOCATIONS = 10
+
+
+class ProfilerBusyError(Exception):
+    """Another request is being profiled"""
+
+
+def profile_requested(headers: Mapping[str, str], query_params: Mapping[str, str]) -> Optional[str]:
+    """The profiling token a request carries, or None if it did not ask to be profiled"""
+    return headers.get(PROFILE_HEADER) or query_params.get("profile")
+
+
+def token_valid(supplied: str) -> bool:
+    """Whether a supplied token matches PROFILE_TOKEN; always False while profiling is disabled"""
+    expected = os.getenv("PROFILE_TOKEN", "")
+    return bool(expected) and hmac.compare_digest(supplied.encode("utf-8"), expected.encode("utf-8"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's stack at a fixed interval from a background thread
+    """
+    
+    def __init__(self, thread_id: int, interval: float):
+        """
+        Args:
+            thread_id: Thread to sample (the event loop's)
+            interval: Seconds between samples
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+    
+    def folded(self) -> str:
+        """Samples as folded stacks: one "root;...;leaf count" line per distinct stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    """
+    Profiles one request, from start() until finish()
+    
+    Only one request is profiled at a time: the sampler and tracemalloc see
+    the whole process, so concurrent profiles would blur into each other.
+    """
+    
+    _lock = threading.Lock()
+    
+    def __init__(self, request_id: str, directory: Optional[str] = None, interval: Optional[float] = None):
+        """
+        Args:
+            request_id: Correlation id of the request, used as the profile id
+            directory: Where profiles are stored (PROFILE_DIR)
+            interval: Seconds between stack samples (PROFILE_INTERVAL)
+        """
+        self.profile_id = "".join(c for c in request_id if c.isalnum() or c in "-_")[:64] or "profile"
+        self.directory = directory or os.getenv("PROFILE_DIR", "data/profiles")
+        interval = interval if interval is not None else float(os.getenv("PROFILE_INTERVAL", "0.005"))
+        self.sampler = SamplingProfiler(threading.get_ident(), interval)
+        self._traced = False
+        self._started = 0.0
+        self._cpu_started = 0.0
+    
+    def start(self):
+        """
+        Start sampling and allocation tracing for the current request
+        
+        Raises:
+            ProfilerBusyError: If another request is being profiled
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("Another request is being profiled")
+        track_cpu_time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._traced = True
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self.sampler.start()
+    
+    def finish(self, status_code: int) -> Dict[str, Any]:
+        """Stop profiling, store the folded stacks and summary, and return the summary"""
+        try:
+            self.sampler.stop()
+            wall = time.perf_counter() - self._started
+            cpu = time.process_time() - self._cpu_started
+            snapshot = tracemalloc.take_snapshot()
+            if self._traced:
+                tracemalloc.stop()
+        finally:
+            self._lock.release()
+        
+        summary = {
+            "profile_id": self.profile_id,
+            "status_code": status_code,
+            "wall_ms": round(wall * 1000, 2),
+            "cpu_ms": round(cpu * 1000, 2),
+            "samples": sum(self.sampler.stacks.values()),
+            "interval_ms": self.sampler.interval * 1000,
+            "stages": stage_breakdown(),
+            "top_allocations": self._top_allocations(snapshot),
+        }
+        self._store(summary)
+        logger.info(f"Stored profile {self.profile_id}: {summary['samples']} samples over {summary['wall_ms']}ms")
+        return summary
+    
+    @staticmethod
+    def _top_allocations(snapshot) -> List[Dict[str, Any]]:
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        return [
+            {"location": str(statistic.traceback[0]), "size_kb": round(statistic.size / 1024, 1),
+             "count": statistic.count}
+            for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        ]
+    
+    def _store(self, summary: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, self.profile_id)
+        with open(f"{base}.folded", "w", encoding="utf-8") as f:
+            f.write(self.sampler.folded())
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        prune_profiles(self.directory)
+
+
+async def profile_request(request, call_next: Callable[[Any], Awaitable[Any]], request_id: str):
+    """
+    Run a request that asked to be profiled, from the HTTP middleware
+    
+    Returns 403 for a wrong token or while profiling is disabled, 409 while
+    another request is profiled; otherwise the response, with the stored
+    profile named in the X-Profile-Id header.
+    """
+    if not token_valid(profile_requested(request.headers, request.query_params)):
+        return JSONResponse(status_code=403, content={"detail": "Invalid profiling token or profiling disabled"})
+    profile = RequestProfile(request_id)
+    try:
+        profile.start()
+    except ProfilerBusyError as e:
+        return JSONResponse(status_code=409, content={"detail": str(e)})
+    
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        profile.finish(status_code)
+    response.headers[PROFILE_ID_HEADER] = profile.profile_id
+    return response
+
+
+def prune_profiles(directory: str, keep: Optional[int] = None):
+    """Delete all but the newest profiles (PROFILE_KEEP)"""
+    keep = keep if keep is not None else int(os.getenv("PROFILE_KEEP", "50"))
+    summaries = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+    for entry in summaries[keep:]:
+        base = entry.path[:-len(".json")]
+        for path in (f"{base}.json", f"{base}.folded"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def load_profile(profile_id: str, fmt: str = "folded", directory: Optional[str] = None) -> Optional[str]:
+    """A stored profile's folded stacks ("folded") or summary ("json"), or None if unknown"""
+    directory = directory or os.getenv("PROFILE_DIR", "data/profiles")
+    if not profile_id or any(not (c.isalnum() or c in "-_") for c in profile_id):
+        return None
+    path = os.path.join(directory, f"{profile_id}.{'json' if fmt == 'json' else 'folded'}")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,78 @@
+"""
+Reusable question sets for insurance policy analysis
+"""
+import json
+import os
+from typing import List
+
+# Standard battery asked of every insurance policy (mirrors train_arogya_policy.py)
+STANDARD_INSURANCE_QUESTIONS: List[str] = [
+    # Coverage Questions
+    "What is the sum insured under this policy?",
+    "What are the coverage benefits provided?",
+    "What is covered under hospitalization?",
+    "What are the pre-hospitalization expenses covered?",
+    "What are the post-hospitalization expenses covered?",
+    
+    # Exclusions
+    "What are the general exclusions in this policy?",
+    "What medical conditions are not covered?",
+    "Are pre-existing diseases covered?",
+    "What treatments are excluded from coverage?",
+    
+    # Policy Terms
+    "What is the policy period?",
+    "What is the waiting period for coverage?",
+    "What is the waiting period for pre-existing diseases?",
+    "What is the room rent limit?",
+    "What is the ICU room rent limit?",
+    
+    # Claims Process
+    "What is the claim settlement process?",
+    "What documents are required for claims?",
+    "What is the cashless facility procedure?",
+    "What is the reimbursement claim procedure?",
+    "What is the claim intimation time limit?",
+    
+    # Premium and Renewal
+    "How is the premium calculated?",
+    "What are the renewal conditions?",
+    "Is there a grace period for premium payment?",
+    "What happens if premium is not paid on time?",
+    
+    # Additional Benefits
+    "What additional benefits are provided?",
+    "Is ambulance service covered?",
+    "Are health check-ups covered?",
+    "Is home nursing covered?",
+    "What is the ayush treatment coverage?"
+]
+
+
+def load_question_set(spec: str) -> List[str]:
+    """
+    Resolve a question set from configuration
+    
+    Args:
+        spec: "standard" for the built-in insurance battery, a path to a JSON
+            list or a text file with one question per line, or "" for none
+        
+    Returns:
+        List of questions
+    """
+    if not spec:
+        return []
+    if spec.strip().lower() == "standard":
+        return list(STANDARD_INSURANCE_QUESTIONS)
+    if not os.path.exists(spec):
+        raise FileNotFoundError(f"Question set not found: {spec}")
+    
+    with open(spec, "r", encoding="utf-8") as f:
+        content = f.read()
+    if spec.endswith(".json"):
+        questions = json.loads(content)
+        if not isinstance(questions, list):
+            raise ValueError(f"Question set must be a JSON list: {spec}")
+    else:
+        questions = content.splitlines()
+    return [str(q).strip() for q in questions if str(q).strip()]
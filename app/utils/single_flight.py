@@ -0,0 +1,70 @@
+"""
+Single-flight coalescing of concurrent identical work
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; concurrent callers with the same
+    key await the in-flight call and share its result or exception
+    
+    A caller that is cancelled stops waiting without cancelling the shared
+    call, unless it was the last one waiting for it.
+    """
+    
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.counters = {"calls": 0, "executed": 0, "coalesced": 0}
+    
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run func() for key, or join the call already in flight for it
+        
+        Args:
+            key: Identity of the work
+            func: Zero-argument coroutine function doing the work
+        
+        Returns:
+            The result of the shared call
+        """
+        self.counters["calls"] += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._landed(key, flight))
+            self.counters["executed"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+    
+    def _landed(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Nobody may be left to retrieve the exception of an abandoned call
+        if not flight.task.cancelled():
+            flight.task.exception()
+    
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+    
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": self.in_flight, **self.counters}
@@ -0,0 +1,89 @@
+"""
+Background warm-up of slow-to-load services
+
+Importing the app only builds cheap objects. The slow steps (importing
+scikit-learn or torch and loading the embedding model for the retrieval
+backends) run in a background thread once the server has started, so the
+process answers liveness checks at once and reports ready when the warm-up
+has finished. Requests arriving earlier are served by what is loaded so far.
+
+Under gunicorn with preload_app the warm-up runs in the master process
+before the workers are forked (gunicorn.conf.py), so they share the loaded
+models and start ready.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Every warm-up created in this process, for warm_up_all()
+_warmups: List["Warmup"] = []
+
+
+class Warmup:
+    """
+    Named startup steps, run once in order
+    """
+    
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        """
+        Args:
+            steps: (name, zero-argument function) pairs; a step that raises is
+                reported as failed and the warm-up goes on
+        """
+        self.steps = steps
+        self.status: Dict[str, Dict[str, Any]] = {name: {"state": "pending"} for name, _ in steps}
+        self.done = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        _warmups.append(self)
+    
+    @property
+    def ready(self) -> bool:
+        return self.done.is_set()
+    
+    def start(self):
+        """Run the steps in a background thread, unless they have already run or are running"""
+        with self._lock:
+            if self._thread is not None or self.done.is_set():
+                return
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+    
+    def run(self):
+        """Run the steps that have not run yet in the calling thread"""
+        with self._run_lock:
+            if not self.done.is_set():
+                self._run()
+    
+    def _run(self):
+        started = time.perf_counter()
+        for name, step in self.steps:
+            status = self.status[name]
+            if status["state"] != "pending":
+                continue
+            status["state"] = "running"
+            step_started = time.perf_counter()
+            try:
+                step()
+                status["state"] = "done"
+            except Exception as e:
+                logger.error(f"Warm-up step '{name}' failed: {e}")
+                status.update(state="failed", error=str(e))
+            status["seconds"] = round(time.perf_counter() - step_started, 3)
+        self.done.set()
+        logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Readiness and the state and duration of each step"""
+        return {"ready": self.ready, "steps": {name: dict(status) for name, status in self.status.items()}}
+
+
+def warm_up_all():
+    """Run every warm-up created in this process to completion, in the calling thread"""
+    for warmup in _warmups:
+        warmup.run()
@@ -1,8 +1,12 @@
 import re
 import os
+import hashlib
 from typing import List
 from urllib.parse import urlparse
 
+from app.utils.metrics import timed
+
+@timed("chunk")
 def clean_text(text: str) -> str:
     """
     Clean and normalize text content
@@ -25,6 +29,69 @@ def clean_text(text: str) -> str:
     
     return text
 
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question for use as a cache key
+    
+    Args:
+        question: Question text
+    
+    Returns:
+        Lowercased question with collapsed whitespace and no trailing punctuation
+    """
+    if not question:
+        return ""
+    
+    question = re.sub(r'\s+', ' ', question).strip().lower()
+    return question.rstrip('?.! ')
+
+def fingerprint_chunks(chunks: List[str]) -> str:
+    """
+    Compute a stable fingerprint of a list of text chunks
+    
+    Args:
+        chunks: Text chunks in index order
+    
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+def fingerprint_document(doc_type: str, content: str) -> str:
+    """
+    Compute a fingerprint of a submitted document before it is processed
+    
+    Args:
+        doc_type: Document type ('pdf', 'url', 'text', ...)
+        content: Document content as submitted (base64, URL or text)
+    
+    Returns:
+        Hex SHA-256 digest
+    """
+    doc_type = getattr(doc_type, 'value', doc_type)
+    digest = hashlib.sha256(str(doc_type).lower().encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(content.encode('utf-8'))
+    return digest.hexdigest()
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the LLM token count of a text without a tokenizer
+    
+    Args:
+        text: Text to measure
+    
+    Returns:
+        Approximate token count (about 4 characters per token for English)
+    """
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
 def chunk_text(text: str, chunk_size: int = 800, overlap: int = 150) -> List[str]:
     """
     Split text into overlapping chunks optimized for insurance/legal documents
@@ -70,6 +137,7 @@ def chunk_text(text: str, chunk_size: int = 800, overlap: int = 150) -> List[str
     
     return chunks
 
+@timed("chunk")
 def extract_clauses(text: str) -> List[str]:
     """
     Extract clauses from legal/insurance document text
@@ -0,0 +1,50 @@
+"""
+CPU thread budgets for multi-worker serving
+
+Several worker processes on one machine each sizing their BLAS, OpenMP and
+torch pools to every core oversubscribes the CPU. The budget splits the
+cores between the workers: the pool sizes are put in the environment before
+numpy, torch and faiss are imported (they read it once when loaded), and
+the pools of libraries already loaded are resized in each forked worker.
+"""
+import os
+import sys
+
+# Environment variables read by the native thread pools at import time
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects CPU affinity and cpusets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def web_workers() -> int:
+    """Worker processes to serve with: WEB_WORKERS, or one per core"""
+    return int(os.getenv("WEB_WORKERS") or 0) or available_cores()
+
+
+def worker_threads(workers: int) -> int:
+    """Threads each worker's numeric libraries may use: WORKER_THREADS, or an even share of the cores"""
+    return int(os.getenv("WORKER_THREADS") or 0) or max(1, available_cores() // workers)
+
+
+def set_thread_env(threads: int):
+    """Size the native thread pools before their libraries are imported; explicit settings win"""
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+    # The tokenizers pool does not survive fork() and warns in every worker
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def apply_thread_budget(threads: int):
+    """Resize the pools of libraries already loaded in this process (after a fork)"""
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+    faiss = sys.modules.get("faiss")
+    if faiss is not None:
+        faiss.omp_set_num_threads(threads)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark the extractive fast path against answering every question with the LLM
+
+Answers the standard question set over a policy document twice, with and
+without the extractive answerer, and reports the LLM bypass rate, LLM calls
+and wall time of each, and the extractive answers themselves for review.
+
+With GEMINI_API_KEY set the real model is called. With --simulate the model
+is replaced by a fixed-latency stub, so the savings can be measured offline.
+
+Usage:
+    python benchmark_extractive.py [path/to/policy.pdf] [--simulate] [--latency-ms N]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from benchmark_packing import instrument, simulated_generate
+from benchmark_tfidf import load_chunks
+from app.services.answer_scheduler import AnswerScheduler
+from app.services.extractive_answerer import ExtractiveAnswerer
+from app.services.llm_service import LLMService
+from app.services.qa_pipeline import QAPipeline
+from app.services.retriever_router import RetrieverRouter
+from app.utils.question_sets import STANDARD_INSURANCE_QUESTIONS
+
+
+def time_llm(llm: LLMService, counters: dict):
+    """Accumulate the time spent inside llm._generate"""
+    generate = llm._generate
+
+    async def timed(prompt: str, max_output_tokens: int, on_token=None) -> str:
+        start = time.perf_counter()
+        try:
+            return await generate(prompt, max_output_tokens, on_token)
+        finally:
+            counters["llm_ms"] += (time.perf_counter() - start) * 1000
+
+    llm._generate = timed
+
+
+def benchmark(llm: LLMService, router: RetrieverRouter, chunks: list, questions: list, extractive: bool) -> dict:
+    """Answer the question set once and collect bypass, call and timing figures"""
+    counters = {"calls": 0, "prompt_tokens": 0, "llm_ms": 0.0}
+    instrument(llm, counters)
+    time_llm(llm, counters)
+    pipeline = QAPipeline(router, lambda: llm, scheduler=AnswerScheduler(),
+                          extractor=ExtractiveAnswerer() if extractive else None)
+
+    start = time.perf_counter()
+    pipeline.index_facts(chunks)
+    counters["index_ms"] = (time.perf_counter() - start) * 1000
+    results = asyncio.run(pipeline.answer_questions(questions, use_cache=False))
+    counters["wall_ms"] = (time.perf_counter() - start) * 1000
+    counters["report"] = pipeline.extractive_report(results)
+    counters["extracted"] = [result for result in results if result.served_by == "extractive"]
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", default="arogya_policy.pdf")
+    parser.add_argument("--simulate", action="store_true", help="use a latency stub instead of Gemini")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="simulated fixed latency per call")
+    args = parser.parse_args()
+
+    if args.simulate:
+        os.environ.setdefault("GEMINI_API_KEY", "simulated")
+    elif not os.getenv("GEMINI_API_KEY"):
+        parser.error("GEMINI_API_KEY is not set; pass --simulate to benchmark offline")
+
+    print("⚡ Extractive fast path benchmark")
+    print("=" * 60)
+
+    chunks = load_chunks(Path(args.pdf))
+    questions = STANDARD_INSURANCE_QUESTIONS
+    router = RetrieverRouter()
+    router.create_index(chunks, num_queries=len(questions), top_k=5)
+    print(f"📄 {len(chunks)} chunks, ❓ {len(questions)} questions, 🔎 {router.last_selection['engine']} retrieval")
+
+    results = {}
+    for name, extractive in (("llm only", False), ("extractive", True)):
+        llm = LLMService()
+        if args.simulate:
+            llm._generate = simulated_generate(args.latency_ms, 0.0)
+        results[name] = benchmark(llm, router, chunks, questions, extractive)
+
+    print(f"\n{'mode':<12}{'bypassed':>10}{'LLM calls':>12}{'index (ms)':>12}{'wall (ms)':>12}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['report']['answered']:>10}{r['calls']:>12}{r['index_ms']:>12.1f}{r['wall_ms']:>12.0f}")
+
+    baseline, fast = results["llm only"], results["extractive"]
+    print(f"\n🎯 LLM bypass rate: {fast['report']['bypass_rate']:.1%} "
+          f"({fast['report']['avg_extract_ms']:.3f} ms per extraction)")
+    per_call_ms = baseline["llm_ms"] / baseline["calls"] if baseline["calls"] else 0.0
+    print(f"⏱️  LLM calls saved: {baseline['calls'] - fast['calls']} × {per_call_ms:.0f} ms "
+          f"= {(baseline['llm_ms'] - fast['llm_ms']) / 1000:.1f} s of LLM time, "
+          f"wall time {baseline['wall_ms']:.0f} → {fast['wall_ms']:.0f} ms "
+          f"(bounded by LLM_MAX_CONCURRENCY)")
+    for result in fast["extracted"]:
+        print(f"\n❓ {result.question}\n💬 {result.answer}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark multi-question prompt packing against one prompt per question
+
+Answers the standard question set over a policy document twice, without and
+with packing, and reports the LLM calls, prompt tokens and wall time of each.
+
+With GEMINI_API_KEY set the real model is called. With --simulate the model
+is replaced by a stub whose latency grows with the prompt size, so the token
+and call savings can be measured offline.
+
+Usage:
+    python benchmark_packing.py [path/to/policy.pdf] [--simulate] [--max-questions N] [--min-overlap F]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from benchmark_tfidf import load_chunks
+from app.services.answer_scheduler import AnswerScheduler
+from app.services.llm_service import LLMService
+from app.services.qa_pipeline import QAPipeline
+from app.services.retriever_router import RetrieverRouter
+from app.utils.question_sets import STANDARD_INSURANCE_QUESTIONS
+from app.utils.text_processing import estimate_tokens
+
+
+def simulated_generate(latency_ms: float, ms_per_1k_tokens: float):
+    """Stand-in for LLMService._generate with prompt-size dependent latency"""
+    async def generate(prompt: str, max_output_tokens: int, on_token=None) -> str:
+        await asyncio.sleep((latency_ms + ms_per_1k_tokens * estimate_tokens(prompt) / 1000) / 1000)
+        if prompt.rstrip().endswith("JSON:"):
+            block = prompt.rsplit("Questions:", 1)[1]
+            count = len(re.findall(r"^\d+\. ", block, flags=re.MULTILINE))
+            return json.dumps([
+                {"id": number, "answer": f"Section {number}: simulated answer."}
+                for number in range(1, count + 1)
+            ])
+        return "Section 1: simulated answer."
+    return generate
+
+
+def instrument(llm: LLMService, counters: dict):
+    """Count LLM calls and prompt tokens sent through llm._generate"""
+    generate = llm._generate
+
+    async def counted(prompt: str, max_output_tokens: int, on_token=None) -> str:
+        counters["calls"] += 1
+        counters["prompt_tokens"] += estimate_tokens(prompt)
+        return await generate(prompt, max_output_tokens, on_token)
+
+    llm._generate = counted
+
+
+async def run(pipeline: QAPipeline, questions: list) -> list:
+    return await pipeline.answer_questions(questions, use_cache=False)
+
+
+def benchmark(llm: LLMService, router: RetrieverRouter, questions: list, packing: bool,
+              max_questions: int, min_overlap: float) -> dict:
+    """Answer the question set once and collect call, token and timing figures"""
+    counters = {"calls": 0, "prompt_tokens": 0}
+    instrument(llm, counters)
+    pipeline = QAPipeline(router, lambda: llm, scheduler=AnswerScheduler(), packing=packing,
+                          pack_max_questions=max_questions, pack_min_overlap=min_overlap)
+
+    start = time.perf_counter()
+    results = asyncio.run(run(pipeline, questions))
+    counters["wall_ms"] = (time.perf_counter() - start) * 1000
+    counters["fallbacks"] = pipeline.packing_stats["fallbacks"]
+    counters["errors"] = sum(1 for result in results if result.served_by == "error")
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", default="arogya_policy.pdf")
+    parser.add_argument("--simulate", action="store_true", help="use a latency stub instead of Gemini")
+    parser.add_argument("--max-questions", type=int, default=4, help="questions per packed prompt")
+    parser.add_argument("--min-overlap", type=float, default=0.4, help="shared chunk fraction needed to join a group")
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="simulated fixed latency per call")
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=150.0, help="simulated latency per 1k prompt tokens")
+    args = parser.parse_args()
+
+    if args.simulate:
+        os.environ.setdefault("GEMINI_API_KEY", "simulated")
+    elif not os.getenv("GEMINI_API_KEY"):
+        parser.error("GEMINI_API_KEY is not set; pass --simulate to benchmark offline")
+
+    print("📦 Prompt packing benchmark")
+    print("=" * 60)
+
+    chunks = load_chunks(Path(args.pdf))
+    questions = STANDARD_INSURANCE_QUESTIONS
+    router = RetrieverRouter()
+    router.create_index(chunks, num_queries=len(questions), top_k=5)
+    print(f"📄 {len(chunks)} chunks, ❓ {len(questions)} questions, 🔎 {router.last_selection['engine']} retrieval")
+
+    results = {}
+    for name, packing in (("single", False), ("packed", True)):
+        llm = LLMService()
+        if args.simulate:
+            llm._generate = simulated_generate(args.latency_ms, args.ms_per_1k_tokens)
+        results[name] = benchmark(llm, router, questions, packing, args.max_questions, args.min_overlap)
+
+    print(f"\n{'mode':<10}{'LLM calls':>12}{'prompt tokens':>16}{'wall (ms)':>12}{'fallbacks':>12}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['calls']:>12}{r['prompt_tokens']:>16}{r['wall_ms']:>12.0f}{r['fallbacks']:>12}")
+
+    single, packed = results["single"], results["packed"]
+    if single["prompt_tokens"]:
+        saved = 1 - packed["prompt_tokens"] / single["prompt_tokens"]
+        print(f"\n🪙 Prompt tokens saved: {saved:.1%}")
+    if packed["wall_ms"]:
+        print(f"🚀 Wall time speedup: {single['wall_ms'] / packed['wall_ms']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold start against a startup budget
+
+Imports the app in a fresh interpreter under "python -X importtime" and
+reports the total import time, the slowest packages and modules, and which
+of the heavy libraries (torch, sentence-transformers, FAISS, scikit-learn,
+the Gemini SDK, document parsers) were imported before the first request.
+With --serve it also starts the server and measures the time until
+/health/live and /health/ready answer 200.
+
+Exits with status 1 when the import time exceeds --budget-ms, so it can
+guard the startup budget in CI.
+
+Usage:
+    python benchmark_startup.py [--app main|main_minimal] [--budget-ms N] [--top N] [--serve]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# Libraries that should only be imported by the background warm-up or on first use
+HEAVY_MODULES = [
+    "torch", "sentence_transformers", "faiss", "sklearn", "scipy",
+    "google.generativeai", "pypdf", "docx", "bs4",
+]
+
+
+def app_env() -> dict:
+    return {
+        **os.environ,
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "benchmark",
+        "LOG_FILE": "",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def parse_importtime(stderr: str) -> list:
+    """(module, self_us, cumulative_us, depth) for every line of -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure_import(app: str) -> dict:
+    """Import the app in a fresh interpreter and break the time down by package and module"""
+    code = f"import time; start = time.perf_counter(); import {app}; print(time.perf_counter() - start)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=app_env(), capture_output=True, text=True, check=True
+    )
+    rows = parse_importtime(result.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        packages[name.split(".")[0]] += self_us
+    imported = {name for name, _, _, _ in rows}
+    return {
+        "wall_ms": float(result.stdout.strip().splitlines()[-1]) * 1000,
+        "modules": sorted(rows, key=lambda row: row[2], reverse=True),
+        "packages": sorted(packages.items(), key=lambda item: item[1], reverse=True),
+        "heavy": [module for module in HEAVY_MODULES if module in imported],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def measure_serve(app: str, timeout: float = 600) -> dict:
+    """Start the server and time how long until it is live and ready"""
+    import httpx
+
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{app}:app", "--port", str(port), "--log-level", "warning"],
+        env=app_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    timings = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            while "ready_s" not in timings and time.perf_counter() - start < timeout:
+                if process.poll() is not None:
+                    raise RuntimeError(f"server exited with status {process.returncode}")
+                for probe, key in (("/health/live", "live_s"), ("/health/ready", "ready_s")):
+                    if key in timings:
+                        continue
+                    try:
+                        if (await client.get(probe)).status_code == 200:
+                            timings[key] = time.perf_counter() - start
+                    except httpx.TransportError:
+                        pass
+                await asyncio.sleep(0.05)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="main", help="module holding the FastAPI app")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="import time budget")
+    parser.add_argument("--top", type=int, default=10, help="slowest packages and modules to list")
+    parser.add_argument("--serve", action="store_true", help="also time /health/live and /health/ready")
+    args = parser.parse_args()
+
+    print("🧊 Cold start benchmark")
+    print("=" * 60)
+
+    report = measure_import(args.app)
+    print(f"📦 import {args.app}: {report['wall_ms']:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    print(f"\n{'package':<32}{'self (ms)':>12}")
+    for package, self_us in report["packages"][:args.top]:
+        print(f"{package:<32}{self_us / 1000:>12.1f}")
+
+    print(f"\n{'module':<48}{'cumulative (ms)':>16}")
+    for name, _, cumulative_us, _ in report["modules"][:args.top]:
+        print(f"{name:<48}{cumulative_us / 1000:>16.1f}")
+
+    if report["heavy"]:
+        print(f"\n⚠️  Heavy libraries imported at startup: {', '.join(report['heavy'])}")
+    else:
+        print("\n✅ No heavy libraries imported at startup")
+
+    if args.serve:
+        timings = asyncio.run(measure_serve(args.app))
+        for key, label in (("live_s", "live"), ("ready_s", "ready")):
+            print(f"🚦 {label}: " + (f"{timings[key]:.2f} s" if key in timings else "timed out"))
+
+    if report["wall_ms"] > args.budget_ms:
+        print(f"\n❌ Import time over budget by {report['wall_ms'] - args.budget_ms:.0f} ms")
+        sys.exit(1)
+    print("\n🚀 Within the startup budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark the fitted TF-IDF backend against the fit-free hashing backend
+
+Measures index build time and the time to answer the standard question set:
+- fit mode: TfidfVectorizer.fit_transform per index, one argsort per question
+- hashing mode: HashingVectorizer + persisted IDF, one sparse product for all questions
+
+Usage:
+    python benchmark_tfidf.py [path/to/policy.pdf] [--rounds N]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.services.lightweight_vector_search import LightweightVectorSearch
+from app.utils.question_sets import STANDARD_INSURANCE_QUESTIONS
+from app.utils.text_processing import clean_text, extract_clauses
+
+
+def load_chunks(pdf_path: Path) -> list:
+    """Chunk the benchmark document the same way DocumentProcessor does"""
+    if pdf_path.exists():
+        import pypdf
+        reader = pypdf.PdfReader(str(pdf_path))
+        text = "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    else:
+        print(f"⚠️  {pdf_path} not found, using a synthetic policy")
+        text = " ".join(
+            f"Section {i}: The sum insured for benefit {i} is Rs. {i * 10000}. "
+            f"A waiting period of {i % 4 + 1} years applies to pre-existing diseases. "
+            f"Room rent is limited to {i % 3 + 1}% of the sum insured per day."
+            for i in range(1, 400)
+        )
+    return extract_clauses(clean_text(text))
+
+
+def time_call(fn) -> float:
+    """Run fn and return its wall time in milliseconds"""
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def benchmark(chunks: list, questions: list, rounds: int) -> dict:
+    """Time both modes over several rounds"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        idf_path = os.path.join(tmp, "idf.npz")
+
+        fit_search = LightweightVectorSearch(mode="fit")
+        hashing_search = LightweightVectorSearch(mode="hashing", idf_path=idf_path)
+
+        # Prime persisted IDF statistics, as a long-running deployment would have
+        hashing_search.create_index(chunks)
+
+        for name, search, run_queries in (
+            ("fit", fit_search, lambda s: [s.search(q, top_k=5) for q in questions]),
+            ("hashing", hashing_search, lambda s: s.search_batch(questions, top_k=5)),
+        ):
+            index_times = []
+            query_times = []
+            for _ in range(rounds):
+                index_times.append(time_call(lambda: search.create_index(chunks)))
+                query_times.append(time_call(lambda: run_queries(search)))
+            results[name] = {
+                "index_ms": statistics.median(index_times),
+                "query_ms": statistics.median(query_times),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", default="arogya_policy.pdf")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print("⏱️  TF-IDF backend benchmark")
+    print("=" * 60)
+
+    chunks = load_chunks(Path(args.pdf))
+    questions = STANDARD_INSURANCE_QUESTIONS
+    print(f"📄 {len(chunks)} chunks, ❓ {len(questions)} questions, 🔁 {args.rounds} rounds")
+
+    results = benchmark(chunks, questions, args.rounds)
+
+    print(f"\n{'mode':<10}{'index (ms)':>14}{'queries (ms)':>16}{'total (ms)':>14}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['index_ms']:>14.1f}{r['query_ms']:>16.1f}{r['index_ms'] + r['query_ms']:>14.1f}")
+
+    fit_total = results["fit"]["index_ms"] + results["fit"]["query_ms"]
+    hashing_total = results["hashing"]["index_ms"] + results["hashing"]["query_ms"]
+    if hashing_total > 0:
+        print(f"\n🚀 Hashing mode speedup: {fit_total / hashing_total:.2f}x per request")
+
+
+if __name__ == "__main__":
+    main()
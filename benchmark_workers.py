@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmark request throughput against the number of worker processes
+
+Starts the server with each worker count in turn, always pinned to the same
+fixed set of cores, and drives it with concurrent /hackrx/run requests. Each
+request carries its own copy of the policy document, so every request pays
+for chunking, embedding and indexing. The LLM is replaced by a stub with a
+fixed latency, so the figures measure the serving side only.
+
+Reports requests per second, latency percentiles, and the memory of the
+server's processes as PSS, which counts pages shared between the workers
+once. With --server gunicorn the model is loaded before the workers are
+forked (gunicorn.conf.py); --server uvicorn spawns workers that each load
+their own copy, for comparison.
+
+Usage:
+    python benchmark_workers.py [path/to/policy.pdf] [--workers 1,2,4] [--cores N]
+                                [--requests N] [--concurrency N] [--server gunicorn|uvicorn]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BEARER_TOKEN = "benchmark"
+QUESTIONS = [
+    "What is the grace period for premium payment?",
+    "Is cataract surgery covered?",
+    "What is the waiting period for pre-existing diseases?",
+]
+
+
+def create_app():
+    """App factory the benchmarked server loads: main.app with a simulated LLM"""
+    from app.utils.thread_budget import set_thread_env, web_workers, worker_threads
+    # Spawned uvicorn workers do not go through gunicorn.conf.py
+    set_thread_env(worker_threads(web_workers()))
+
+    from benchmark_packing import simulated_generate
+    import main
+    main.llm_service._generate = simulated_generate(float(os.getenv("BENCHMARK_LLM_LATENCY_MS", "200")), 0)
+    return main.app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid: int) -> list:
+    """pid and all of its descendants"""
+    pids = [pid]
+    for task in Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            children = (task / "children").read_text().split()
+        except OSError:
+            continue
+        for child in children:
+            pids.extend(process_tree(int(child)))
+    return pids
+
+
+def pss_mb(pid: int) -> float:
+    """Proportional set size of a process tree in MB (shared pages are split between sharers)"""
+    total = 0
+    for member in process_tree(pid):
+        try:
+            for line in Path(f"/proc/{member}/smaps_rollup").read_text().splitlines():
+                if line.startswith("Pss:"):
+                    total += int(line.split()[1])
+        except OSError:
+            continue
+    return total / 1024
+
+
+def start_server(server: str, workers: int, cores: set, port: int, env: dict) -> subprocess.Popen:
+    env = {**env, "WEB_WORKERS": str(workers), "PORT": str(port)}
+    if server == "gunicorn":
+        command = ["gunicorn", "-c", "gunicorn.conf.py", "benchmark_workers:create_app()"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "benchmark_workers:create_app", "--factory",
+                   "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        preexec_fn=lambda: os.sched_setaffinity(0, cores)
+    )
+
+
+async def wait_ready(client, process: subprocess.Popen, timeout: float = 300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            if (await client.get("/health/ready")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("server did not become ready")
+
+
+async def drive(client, text: str, requests: int, concurrency: int, offset: int) -> list:
+    """Send the requests with bounded concurrency and return each one's latency in seconds"""
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {BEARER_TOKEN}"}
+
+    async def one(number: int) -> float:
+        # A distinct document per request, so nothing is coalesced or reused
+        body = {
+            "documents": [{"type": "text", "content": f"{text}\n\nPolicy reference {offset + number}."}],
+            "questions": QUESTIONS,
+        }
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/hackrx/run", json=body, headers=headers)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(one(number) for number in range(requests)))
+
+
+async def benchmark(args, workers: int, cores: set, text: str, env: dict) -> dict:
+    import httpx
+
+    port = free_port()
+    process = start_server(args.server, workers, cores, port, env)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+            await wait_ready(client, process)
+            # Warm every worker before measuring
+            await drive(client, text, workers * 2, workers, offset=0)
+            start = time.perf_counter()
+            latencies = sorted(await drive(client, text, args.requests, args.concurrency, offset=workers * 2))
+            wall = time.perf_counter() - start
+        return {
+            "workers": workers,
+            "rps": args.requests / wall,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+            "pss_mb": pss_mb(process.pid),
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", default="arogya_policy.pdf")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts to compare")
+    parser.add_argument("--cores", type=int, default=None, help="cores to pin the server to (default: all)")
+    parser.add_argument("--requests", type=int, default=32, help="measured requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--server", choices=("gunicorn", "uvicorn"), default="gunicorn")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="simulated LLM latency per call")
+    args = parser.parse_args()
+
+    if args.server == "gunicorn" and shutil.which("gunicorn") is None:
+        parser.error("gunicorn is not installed; pip install gunicorn or pass --server uvicorn")
+
+    from benchmark_tfidf import load_chunks
+
+    available = sorted(os.sched_getaffinity(0))
+    cores = set(available[:args.cores or len(available)])
+    text = "\n\n".join(load_chunks(Path(args.pdf)))
+
+    with tempfile.TemporaryDirectory() as scratch:
+        env = {
+            **os.environ,
+            "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "simulated",
+            "BEARER_TOKEN": BEARER_TOKEN,
+            "BENCHMARK_LLM_LATENCY_MS": str(args.latency_ms),
+            "ANSWER_CACHE_ENABLED": "false",
+            "SEMANTIC_CACHE_ENABLED": "false",
+            "PREFETCH_QUESTION_SET": "",
+            "JOB_STORE_PATH": os.path.join(scratch, "jobs.sqlite3"),
+        }
+
+        print("🧵 Worker scaling benchmark")
+        print("=" * 60)
+        print(f"🖥️  {len(cores)} cores, {args.server}, {args.requests} requests at concurrency {args.concurrency}")
+
+        results = []
+        for workers in (int(count) for count in args.workers.split(",")):
+            result = asyncio.run(benchmark(args, workers, cores, text, env))
+            results.append(result)
+            print(f"   {workers} workers: {result['rps']:.2f} req/s")
+
+    print(f"\n{'workers':<10}{'req/s':>10}{'p50 (ms)':>12}{'p95 (ms)':>12}{'PSS (MB)':>12}")
+    for r in results:
+        print(f"{r['workers']:<10}{r['rps']:>10.2f}{r['p50_ms']:>12.0f}{r['p95_ms']:>12.0f}{r['pss_mb']:>12.0f}")
+
+    base = results[0]
+    for r in results[1:]:
+        print(f"🚀 {r['workers']} vs {base['workers']} workers: {r['rps'] / base['rps']:.2f}x throughput, "
+              f"{r['pss_mb'] - base['pss_mb']:+.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
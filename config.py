@@ -21,6 +21,10 @@ class Settings:
     # Embedding Model Configuration
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
     
+    # Lightweight TF-IDF Configuration ("fit" or "hashing")
+    TFIDF_MODE: str = os.getenv("TFIDF_MODE", "fit")
+    TFIDF_IDF_PATH: str = os.getenv("TFIDF_IDF_PATH", "data/tfidf_idf_stats.npz")
+    
     # Text Processing Configuration
     MAX_CHUNK_SIZE: int = int(os.getenv("MAX_CHUNK_SIZE", "1000"))
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
@@ -36,7 +40,7 @@ class Settings:
     
     # Request Limits
     MAX_DOCUMENTS: int = int(os.getenv("MAX_DOCUMENTS", "10"))
-    MAX_QUESTIONS: int = int(os.getenv("MAX_QUESTIONS", "20"))
+    MAX_QUESTIONS: int = int(os.getenv("MAX_QUESTIONS", "50"))
     MAX_CONTENT_SIZE: int = int(os.getenv("MAX_CONTENT_SIZE", "10485760"))  # 10MB
     
     # CORS Configuration
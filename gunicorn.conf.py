@@ -0,0 +1,68 @@
+"""
+Gunicorn configuration for multi-worker serving
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The app is imported once in the master process and its startup warm-up,
+which loads the embedding model, runs there before the workers are forked
+(preload_app), so the model weights are shared copy-on-write instead of
+loaded once per worker. The cores are split between the workers (see
+app/utils/thread_budget.py).
+
+Settings:
+    WEB_WORKERS         worker processes (default: one per core)
+    WORKER_THREADS      threads per worker for torch/BLAS/faiss (default: cores / workers)
+    WORKER_TIMEOUT      seconds before a silent worker is restarted
+    WARMUP_BEFORE_FORK  "false" forks at once and warms up in each worker instead
+    METRICS_DIR         where workers publish metrics snapshots, so /metrics covers
+                        them all (default: a new temporary directory per run)
+    PORT                port to listen on
+"""
+import gc
+import os
+import shutil
+import sys
+import tempfile
+
+# The config is read before the app is imported, from wherever gunicorn was started
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.startup import warm_up_all
+from app.utils.thread_budget import apply_thread_budget, set_thread_env, web_workers, worker_threads
+
+workers = web_workers()
+threads_per_worker = worker_threads(workers)
+# Must happen before the app (and numpy/torch) is imported by preload_app
+set_thread_env(threads_per_worker)
+
+# Each worker's /metrics aggregates the snapshots all workers publish here
+_own_metrics_dir = not os.getenv("METRICS_DIR")
+if _own_metrics_dir:
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="qa-metrics-")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+accesslog = "-"
+
+
+def when_ready(server):
+    if os.getenv("WARMUP_BEFORE_FORK", "true").lower() == "true":
+        server.log.info("Warming up before forking workers")
+        warm_up_all()
+    # Objects loaded so far are moved out of the garbage collector's reach, so
+    # collections in the workers do not write to (and so copy) the shared pages
+    gc.freeze()
+    server.log.info(f"Forking {workers} workers with {threads_per_worker} threads each")
+
+
+def post_fork(server, worker):
+    apply_thread_budget(threads_per_worker)
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
@@ -1,31 +1,35 @@
-from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi import FastAPI, HTTPException, Depends, Security, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 import uvicorn
+import asyncio
 import os
+import time
 import logging
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
-from app.models.request_models import DocumentQARequest
-from app.models.response_models import DocumentQAResponse
+from app.models.request_models import DocumentInput, DocumentQARequest, DocumentQuestionsRequest
+from app.models.response_models import DocumentQAResponse, AnswerResult
 from app.services.document_processor import DocumentProcessor
-
-# Try to import vector search services with fallbacks
-try:
-    from app.services.vector_search import VectorSearchService
-    VECTOR_SEARCH_TYPE = "FAISS"
-except ImportError:
-    try:
-        from app.services.lightweight_vector_search import LightweightVectorSearch as VectorSearchService
-        VECTOR_SEARCH_TYPE = "Lightweight"
-    except ImportError:
-        from app.services.basic_text_search import BasicTextSearch as VectorSearchService
-        VECTOR_SEARCH_TYPE = "Basic"
-
+from app.services.retriever_router import RetrieverRouter, BACKENDS
 from app.services.llm_service import LLMService
-from app.utils.logger import setup_logger
+from app.services.qa_pipeline import QAPipeline, create_answer_cache, create_extractive_answerer, create_semantic_cache
+from app.services.answer_cache import bypass_requested
+from app.services.answer_prefetcher import AnswerPrefetcher
+from app.services.admission import AdmissionController, AdmissionRejectedError, RequestLimitError
+from app.services.document_sessions import DocumentSessionStore, UnknownDocumentError
+from app.services.job_queue import IDEMPOTENCY_HEADER, IdempotencyConflictError, JobQueue, JobStore, job_status
+from app.utils.answer_stream import STREAM_HEADERS, STREAM_MEDIA_TYPES, stream_answers, stream_format
+from app.utils.logger import REQUEST_ID_HEADER, bind_request_id, setup_logger
+from app.utils.metrics import CONTENT_TYPE, publish_snapshots, render, service_families, stage_breakdown, start_breakdown, track_in_flight
+from app.utils.profiler import PROFILE_HEADER, load_profile, profile_request, profile_requested, token_valid
+from app.utils.single_flight import SingleFlight
+from app.utils.startup import Warmup
+from app.utils.text_processing import fingerprint_document
 
 # Load environment variables
 load_dotenv()
@@ -33,13 +37,27 @@ load_dotenv()
 # Setup logging
 logger = setup_logger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the warm-up and the job workers; on shutdown stop them and background pre-answering and release pooled HTTP connections"""
+    warmup.start()
+    await job_queue.start()
+    # Publish this worker's metrics for /metrics served by the other workers (METRICS_DIR)
+    snapshots = asyncio.ensure_future(publish_snapshots(collect_families))
+    yield
+    snapshots.cancel()
+    await job_queue.stop()
+    prefetcher.cancel_all()
+    await llm_service.aclose()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Document Q&A System",
     description="AI-powered document analysis and Q&A system for insurance policies and legal documents",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -51,6 +69,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def correlate_request(request: Request, call_next):
+    """Tag the request's log records with a correlation id, echoed back in the response, time its stages, and profile /hackrx/run on request"""
+    request_id = bind_request_id(request.headers.get(REQUEST_ID_HEADER))
+    start_breakdown()
+    with track_in_flight():
+        if request.url.path == "/hackrx/run" and profile_requested(request.headers, request.query_params):
+            response = await profile_request(request, call_next, request_id)
+        else:
+            response = await call_next(request)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -66,11 +97,26 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
 
 # Initialize services
 document_processor = DocumentProcessor()
-vector_search = VectorSearchService()
+# Backends are loaded by the warm-up, off the import path
+vector_search = RetrieverRouter(preload=False)
 llm_service = LLMService()
+semantic_cache = create_semantic_cache()
+answer_cache = create_answer_cache()
+qa_pipeline = QAPipeline(vector_search, lambda: llm_service, semantic_cache=semantic_cache, top_k=5,
+                         answer_cache=answer_cache, extractor=create_extractive_answerer())
+# Hedged LLM calls are charged to the scheduler's rate limits
+llm_service.guard.hedge_budget = qa_pipeline.scheduler.charge_duplicate
+prefetcher = AnswerPrefetcher(qa_pipeline)
+sessions = DocumentSessionStore(vector_search)
+# Concurrent requests for the same document share one download/parse/chunk pass
+ingestions = SingleFlight()
+# Request limits and the concurrency/memory budget for ingestion
+admission = AdmissionController()
+# Slow startup work, run in the background once the server is up
+warmup = Warmup([("retrieval", vector_search.warm_up)])
 
-# Log which vector search implementation is being used
-logger.info(f"Using {VECTOR_SEARCH_TYPE} vector search implementation")
+# Log which vector search implementations the router will load
+logger.info(f"Installed vector search backends: {', '.join(vector_search.installed)}")
 
 @app.get("/")
 async def root():
@@ -87,20 +133,69 @@ async def health_check():
             "vector_search": "healthy" if vector_search else "unhealthy",
             "llm_service": "healthy" if llm_service else "unhealthy",
         }
+        circuit = llm_service.call_stats()["circuit"]["state"]
+        if circuit != "closed":
+            services_status["llm_service"] = f"degraded (circuit {circuit})"
         
         return {
             "status": "healthy",
+            "ready": warmup.ready,
             "services": services_status,
-            "vector_search_type": VECTOR_SEARCH_TYPE,
+            "vector_search_type": BACKENDS[vector_search.available[0]]["label"] if vector_search.available else None,
+            "vector_search_backends": vector_search.available,
             "environment": os.getenv("ENVIRONMENT", "development")
         }
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Service unhealthy")
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and handling requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 200 once the startup warm-up has finished, 503 while it is still loading services"""
+    content = {
+        "status": "ready" if warmup.ready else "warming_up",
+        "warmup": warmup.stats(),
+        "vector_search_backends": vector_search.available,
+    }
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=content)
+
+@app.get("/hackrx/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    """
+    A stored request profile
+    
+    Folded stacks for flame graph tools (flamegraph.pl, speedscope), or the
+    summary with per-stage wall/CPU time and top allocations for ?format=json.
+    Needs the profiling token in the X-Profile header.
+    """
+    if not token_valid(request.headers.get(PROFILE_HEADER, "")):
+        raise HTTPException(status_code=403, detail="Invalid profiling token or profiling disabled")
+    fmt = request.query_params.get("format", "folded")
+    content = load_profile(profile_id, fmt)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=content, media_type="application/json" if fmt == "json" else "text/plain")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latency histograms, cache hit rates, queue depths and requests in flight"""
+    # Off the event loop: with METRICS_DIR set, every worker's snapshot is read from disk
+    content = await asyncio.to_thread(render, collect_families())
+    return Response(content=content, media_type=CONTENT_TYPE)
+
+def collect_families() -> list:
+    """This app's service metric families"""
+    return service_families(qa_pipeline, job_queue, prefetcher, ingestions, sessions, admission)
+
 @app.post("/hackrx/run", response_model=DocumentQAResponse)
 async def process_documents_and_answer(
     request: DocumentQARequest,
+    http_request: Request,
     token: str = Depends(verify_token)
 ):
     """
@@ -108,57 +203,280 @@ async def process_documents_and_answer(
     
     This endpoint:
     1. Processes multiple document types (PDF, URL, text)
-    2. Creates vector embeddings using sentence transformers
-    3. Performs semantic search with FAISS
+    2. Routes retrieval to FAISS, TF-IDF or keyword search by corpus size and latency budget
+    3. Retrieves the most relevant chunks for each question
     4. Uses GPT-4 with specialized prompts for accurate answers
     5. Returns structured JSON responses
+    
+    Send "X-Cache-Bypass: true" (or "Cache-Control: no-cache") to skip cached answers.
     """
+    started_at = time.perf_counter()
     try:
-        logger.info(f"Processing request with {len(request.documents)} documents and {len(request.questions)} questions")
+        # The request gets its own index, so a concurrent request cannot replace it mid-answer
+        router = vector_search.spawn()
+        retrieval = await build_index(request, router)
         
-        # Step 1: Process all documents
-        all_chunks = []
-        for doc in request.documents:
-            logger.info(f"Processing document of type: {doc.type}")
-            chunks = await document_processor.process_document(doc)
-            all_chunks.extend(chunks)
-        
-        if not all_chunks:
-            raise HTTPException(status_code=400, detail="No content could be extracted from the provided documents")
-        
-        logger.info(f"Extracted {len(all_chunks)} text chunks from documents")
-        
-        # Step 2: Create vector index
-        vector_search.create_index(all_chunks)
-        logger.info("Created FAISS vector index")
-        
-        # Step 3: Process each question
-        answers = []
-        for question in request.questions:
-            logger.info(f"Processing question: {question[:50]}...")
-            
-            # Search for relevant context
-            relevant_chunks = vector_search.search(question, top_k=5)
-            context = "\n\n".join(relevant_chunks)
-            
-            # Generate answer using LLM
-            answer_data = await llm_service.generate_answer(question, context)
-            answers.append(answer_data)
+        # Step 3: Answer each question (semantic cache, retrieval, LLM)
+        use_cache = not bypass_requested(http_request.headers)
+        results = await qa_pipeline.for_retriever(router).answer_questions(request.questions, use_cache=use_cache)
+        answers = [AnswerResult(**result.to_dict()) for result in results]
         
         logger.info(f"Successfully processed all {len(request.questions)} questions")
         
         return DocumentQAResponse(
             answers=answers,
-            processing_time=0.0,  # Will be calculated in middleware
-            status="success"
+            processing_time=round(time.perf_counter() - started_at, 3),
+            status="success",
+            metadata=build_metadata(retrieval, results)
         )
-        
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/hackrx/run/stream")
+async def stream_documents_and_answer(
+    request: DocumentQARequest,
+    http_request: Request,
+    tokens: bool = False,
+    token: str = Depends(verify_token)
+):
+    """
+    Streaming variant of /hackrx/run
+    
+    Documents are processed and indexed before the stream starts; each answer
+    is then sent as soon as its question completes, followed by a summary
+    event with timings and the usual metadata. Responds with Server-Sent
+    Events, or NDJSON for "Accept: application/x-ndjson" or ?format=ndjson.
+    Pass ?tokens=true to also receive answer text as the LLM generates it.
+    """
+    started_at = time.perf_counter()
+    # Answers are retrieved while the body streams, from this request's own index
+    router = vector_search.spawn()
+    try:
+        retrieval = await build_index(request, router)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    
+    fmt = stream_format(http_request.query_params, http_request.headers)
+    events = stream_answers(
+        qa_pipeline.for_retriever(router),
+        request.questions,
+        serialize=lambda result: result.to_dict(),
+        fmt=fmt,
+        use_cache=not bypass_requested(http_request.headers),
+        stream_tokens=tokens,
+        started_at=started_at,
+        summarize=lambda results: {"metadata": build_metadata(retrieval, results)}
+    )
+    return StreamingResponse(events, media_type=STREAM_MEDIA_TYPES[fmt], headers=STREAM_HEADERS)
+
+@app.post("/hackrx/documents", status_code=201)
+async def register_document(document: DocumentInput, token: str = Depends(verify_token)):
+    """
+    Process and index a document once, returning a document_id
+    
+    Ask follow-up questions with POST /hackrx/questions; the document stays
+    indexed until it has gone unused for SESSION_TTL seconds or is evicted to
+    keep session indexes within SESSION_MAX_BYTES. Registering the same
+    document again returns its existing id (200 instead of 201).
+    """
+    try:
+        async with admit([document], 0):
+            chunks = await process_document(document)
+            if not chunks:
+                raise HTTPException(status_code=400, detail="No content could be extracted from the document")
+            session, created = sessions.register(chunks)
+            if created:
+                qa_pipeline.index_facts(chunks)
     except HTTPException:
         raise
+    except Exception as e:
+        logger.error(f"Error registering document: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    return JSONResponse(status_code=201 if created else 200, content=session.to_dict(sessions.ttl))
+
+@app.delete("/hackrx/documents/{document_id}", status_code=204)
+async def delete_document(document_id: str, token: str = Depends(verify_token)):
+    """Drop a registered document's index"""
+    if not sessions.delete(document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+
+@app.post("/hackrx/questions", response_model=DocumentQAResponse)
+async def answer_about_documents(
+    request: DocumentQuestionsRequest,
+    http_request: Request,
+    token: str = Depends(verify_token)
+):
+    """
+    Answer questions about one or more documents registered with /hackrx/documents
+    
+    Only retrieval and the LLM calls run; unknown or expired ids are rejected
+    with 404 and must be registered again.
+    """
+    check_limits([], len(request.questions))
+    started_at = time.perf_counter()
+    try:
+        retriever = sessions.retriever(request.document_ids)
+    except UnknownDocumentError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    
+    try:
+        use_cache = not bypass_requested(http_request.headers)
+        results = await qa_pipeline.for_retriever(retriever).answer_questions(request.questions, use_cache=use_cache)
+        retrieval = {"document_ids": request.document_ids, "fingerprint": retriever.fingerprint}
+        return DocumentQAResponse(
+            answers=[AnswerResult(**result.to_dict()) for result in results],
+            processing_time=round(time.perf_counter() - started_at, 3),
+            status="success",
+            metadata=build_metadata(retrieval, results)
+        )
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/hackrx/jobs", status_code=202)
+async def submit_job(
+    request: DocumentQARequest,
+    http_request: Request,
+    token: str = Depends(verify_token)
+):
+    """
+    Queue a /hackrx/run request as a background job and return its id
+    
+    Poll GET /hackrx/jobs/{job_id} for its status, the answers completed so
+    far and, once it succeeds, the full /hackrx/run response. Send an
+    "Idempotency-Key" header to make retries return the job already created
+    for that key (200) instead of queuing the work again (202).
+    """
+    check_limits(request.documents, len(request.questions))
+    try:
+        job, created = await job_queue.submit(
+            jsonable_encoder(request),
+            idempotency_key=http_request.headers.get(IDEMPOTENCY_HEADER),
+            options={"use_cache": not bypass_requested(http_request.headers)}
+        )
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return JSONResponse(status_code=202 if created else 200, content=job_status(job))
+
+@app.get("/hackrx/jobs/{job_id}")
+async def get_job(job_id: str, token: str = Depends(verify_token)):
+    """Status of a job with its answers so far, or its full result once finished"""
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+async def run_job(payload: dict, options: dict, on_answer) -> dict:
+    """Run a queued request through the /hackrx/run pipeline, recording each answer as it completes"""
+    request = DocumentQARequest(**payload)
+    started_at = time.perf_counter()
+    router = vector_search.spawn()
+    retrieval = await build_index(request, router, wait=True)
+    
+    results = [None] * len(request.questions)
+    async for position, result in qa_pipeline.for_retriever(router).iter_answers(request.questions, use_cache=options.get("use_cache", True)):
+        results[position] = result
+        on_answer(position, jsonable_encoder(AnswerResult(**result.to_dict())))
+    
+    return jsonable_encoder(DocumentQAResponse(
+        answers=[AnswerResult(**result.to_dict()) for result in results],
+        processing_time=round(time.perf_counter() - started_at, 3),
+        status="success",
+        metadata=build_metadata(retrieval, results)
+    ))
+
+job_queue = JobQueue(JobStore(), run_job)
+
+async def build_index(request: DocumentQARequest, router: RetrieverRouter, wait: bool = False) -> dict:
+    """
+    Process the request's documents and index their chunks into router, returning the backend selection
+    
+    router is the request's own vector_search.spawn(), so concurrent requests never replace each other's index.
+    Holds an ingestion slot throughout; wait=True (background jobs) waits for one however long it takes.
+    """
+    logger.info(f"Processing request with {len(request.documents)} documents and {len(request.questions)} questions")
+    
+    async with admit(request.documents, len(request.questions), wait=wait):
+        # Step 1: Process all documents, once each
+        documents = list({fingerprint_document(doc.type, doc.content): doc for doc in request.documents}.values())
+        if len(documents) < len(request.documents):
+            logger.info(f"Collapsed {len(request.documents) - len(documents)} duplicate documents")
+        all_chunks = []
+        for doc in documents:
+            logger.info(f"Processing document of type: {doc.type}")
+            chunks = await process_document(doc)
+            all_chunks.extend(chunks)
+        
+        if not all_chunks:
+            raise HTTPException(status_code=400, detail="No content could be extracted from the provided documents")
+        
+        logger.info(f"Extracted {len(all_chunks)} text chunks from documents")
+        
+        # Step 2: Create vector index on the backend suited to this request
+        retrieval = router.create_index(all_chunks, num_queries=len(request.questions), top_k=5)
+        logger.info(f"Created {retrieval['engine']} vector index")
+        
+        # Pull structured facts for the extractive fast path while the document is fresh
+        qa_pipeline.index_facts(all_chunks)
+        # Pre-answer the configured question set in the background for later requests
+        prefetcher.start(exclude=request.questions, retriever=router)
+        return retrieval
+
+def check_limits(documents: list, questions: int) -> int:
+    """A request's estimated ingestion memory; 413 when it exceeds MAX_DOCUMENTS, MAX_QUESTIONS or MAX_CONTENT_SIZE"""
+    try:
+        return admission.check(documents, questions)
+    except RequestLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@asynccontextmanager
+async def admit(documents: list, questions: int, wait: bool = False):
+    """Hold an ingestion slot for a request's documents: 413 over the request limits, 429 when the server is saturated"""
+    cost = check_limits(documents, questions)
+    try:
+        ticket = await admission.acquire(cost, wait=wait)
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield
+    finally:
+        admission.release(ticket)
+
+async def process_document(doc) -> list:
+    """Extract a document's chunks, joining an identical document already being processed"""
+    return await ingestions.do(
+        fingerprint_document(doc.type, doc.content), lambda: document_processor.process_document(doc)
+    )
+
+def build_metadata(retrieval: dict, results: list) -> dict:
+    """Response metadata: retrieval backend, cache hits, extractive answers, prompt tokens, scheduler, LLM call, pre-answering, job queue, admission, document session and coalescing state"""
+    metadata = {"retrieval": retrieval}
+    if semantic_cache is not None:
+        metadata["semantic_cache_hits"] = sum(1 for result in results if result.served_by == "semantic_cache")
+    if answer_cache is not None:
+        metadata["answer_cache_hits"] = sum(1 for result in results if result.served_by == "answer_cache")
+    if qa_pipeline.packing:
+        metadata["packed_answers"] = sum(1 for result in results if result.served_by == "llm_packed")
+    metadata["prompt_tokens"] = qa_pipeline.prompt_token_report(results)
+    metadata["llm_scheduler"] = qa_pipeline.scheduler.stats()
+    if prefetcher.enabled:
+        metadata["prefetch"] = prefetcher.stats()
+    metadata["llm_calls"] = llm_service.call_stats()
+    metadata["extractive"] = qa_pipeline.extractive_report(results, metadata["llm_calls"]["latency_p50"])
+    metadata["jobs"] = job_queue.stats()
+    metadata["admission"] = admission.stats()
+    metadata["document_sessions"] = sessions.stats()
+    metadata["single_flight"] = {"ingestion": ingestions.stats(), "llm": qa_pipeline.llm_flights.stats()}
+    metadata["stages"] = stage_breakdown()
+    return metadata
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(
@@ -2,12 +2,14 @@
 Minimal FastAPI application without Pydantic dependencies
 For ultra-minimal deployment on restricted environments
 """
+import asyncio
 import os
 import time
 import json
+from contextlib import asynccontextmanager
 from typing import Dict, Any
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -17,30 +19,52 @@ from app.services.simple_document_processor import SimpleDocumentProcessor
 from app.services.llm_service import LLMService
 from app.models.simple_models import (
     SimpleDocumentQARequest, 
+    SimpleDocumentInput,
+    SimpleDocumentQuestionsRequest,
     SimpleDocumentQAResponse, 
     SimpleAnswerResult
 )
-
-# Try to import vector search services with fallbacks
-try:
-    from app.services.vector_search import VectorSearchService
-    VECTOR_SEARCH_TYPE = "FAISS"
-except ImportError:
-    try:
-        from app.services.lightweight_vector_search import LightweightVectorSearch as VectorSearchService
-        VECTOR_SEARCH_TYPE = "Lightweight"
-    except ImportError:
-        from app.services.basic_text_search import BasicTextSearch as VectorSearchService
-        VECTOR_SEARCH_TYPE = "Basic"
+from app.services.retriever_router import RetrieverRouter, BACKENDS
+from app.services.qa_pipeline import QAPipeline, create_answer_cache, create_extractive_answerer, create_semantic_cache
+from app.services.answer_cache import bypass_requested
+from app.services.answer_prefetcher import AnswerPrefetcher
+from app.services.admission import AdmissionController, AdmissionRejectedError, RequestLimitError
+from app.services.document_sessions import DocumentSessionStore, UnknownDocumentError
+from app.services.job_queue import IDEMPOTENCY_HEADER, IdempotencyConflictError, JobQueue, JobStore, job_status
+from app.utils.answer_stream import STREAM_HEADERS, STREAM_MEDIA_TYPES, stream_answers, stream_format
+from app.utils.logger import REQUEST_ID_HEADER, bind_request_id, debug_sampled, setup_logger
+from app.utils.metrics import CONTENT_TYPE, publish_snapshots, render, service_families, stage_breakdown, start_breakdown, track_in_flight
+from app.utils.profiler import PROFILE_HEADER, load_profile, profile_request, profile_requested, token_valid
+from app.utils.single_flight import SingleFlight
+from app.utils.startup import Warmup
+from app.utils.text_processing import fingerprint_document
 
 # Load environment variables
 load_dotenv()
 
+# Setup logging
+logger = setup_logger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the warm-up and the job workers; on shutdown stop them and background pre-answering and release pooled HTTP connections"""
+    warmup.start()
+    await job_queue.start()
+    # Publish this worker's metrics for /metrics served by the other workers (METRICS_DIR)
+    snapshots = asyncio.ensure_future(publish_snapshots(collect_families))
+    yield
+    snapshots.cancel()
+    await job_queue.stop()
+    prefetcher.cancel_all()
+    if llm_service is not None:
+        await llm_service.aclose()
+
 # Create FastAPI app
 app = FastAPI(
     title="Document Q&A System",
     description="AI-powered document analysis with Google Gemini",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -52,6 +76,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def correlate_request(request: Request, call_next):
+    """Tag the request's log records with a correlation id, echoed back in the response, time its stages, and profile /hackrx/run on request"""
+    request_id = bind_request_id(request.headers.get(REQUEST_ID_HEADER))
+    start_breakdown()
+    with track_in_flight():
+        if request.url.path == "/hackrx/run" and profile_requested(request.headers, request.query_params):
+            response = await profile_request(request, call_next, request_id)
+        else:
+            response = await call_next(request)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -62,47 +99,63 @@ def verify_token(request: Request) -> bool:
     """Simple token verification without dependencies"""
     # For web interface requests, skip authentication
     user_agent = request.headers.get("user-agent", "").lower()
-    print(f"DEBUG: User-Agent: {user_agent}")
+    logger.debug(f"User-Agent: {user_agent}")
     
     if "mozilla" in user_agent or "chrome" in user_agent or "safari" in user_agent or "webkit" in user_agent:
-        print("DEBUG: Browser detected, allowing access")
+        logger.debug("Browser detected, allowing access")
         return True
     
-    print("DEBUG: Non-browser request, checking auth header")
+    logger.debug("Non-browser request, checking auth header")
     # For API requests, require authentication
     auth_header = request.headers.get("authorization", "")
     if not auth_header.startswith("Bearer "):
-        print("DEBUG: No valid Bearer token found")
+        logger.debug("No valid Bearer token found")
         return False
     token = auth_header.replace("Bearer ", "")
     is_valid = token == BEARER_TOKEN
-    print(f"DEBUG: Token validation result: {is_valid}")
+    logger.debug(f"Token validation result: {is_valid}")
     return is_valid
 
 # Initialize services (LLM service will be initialized on first use)
 document_processor = SimpleDocumentProcessor()
-vector_search = VectorSearchService()
+# Backends are loaded by the warm-up, off the import path
+vector_search = RetrieverRouter(preload=False)
 llm_service = None  # Will be initialized when needed
+semantic_cache = create_semantic_cache()
+answer_cache = create_answer_cache()
 
-# Log which vector search implementation is being used
-print(f"Using {VECTOR_SEARCH_TYPE} vector search implementation")
+# Log which vector search implementations the router will load
+logger.info(f"Installed vector search backends: {', '.join(vector_search.installed)}")
 
 def get_llm_service():
     """Lazy initialization of LLM service"""
     global llm_service
     if llm_service is None:
         try:
-            print("Initializing LLM service...")
+            logger.info("Initializing LLM service...")
             llm_service = LLMService()
-            print("LLM service initialized successfully")
+            # Hedged LLM calls are charged to the scheduler's rate limits
+            llm_service.guard.hedge_budget = qa_pipeline.scheduler.charge_duplicate
+            logger.info("LLM service initialized successfully")
         except Exception as e:
-            print(f"Error initializing LLM service: {str(e)}")
+            logger.error(f"Error initializing LLM service: {str(e)}")
             raise HTTPException(
                 status_code=500, 
                 detail=f"LLM service not available: {str(e)}. Please check GEMINI_API_KEY environment variable."
             )
     return llm_service
 
+qa_pipeline = QAPipeline(vector_search, get_llm_service, semantic_cache=semantic_cache, top_k=5,
+                         answer_cache=answer_cache, extractor=create_extractive_answerer())
+prefetcher = AnswerPrefetcher(qa_pipeline)
+sessions = DocumentSessionStore(vector_search)
+# Concurrent requests for the same document share one download/parse/chunk pass
+ingestions = SingleFlight()
+# Request limits and the concurrency/memory budget for ingestion
+admission = AdmissionController()
+# Slow startup work, run in the background once the server is up
+warmup = Warmup([("retrieval", vector_search.warm_up)])
+
 @app.get("/")
 async def root():
     """Serve the main web interface"""
@@ -113,12 +166,30 @@ async def health_check():
     """Simple health check"""
     return {
         "status": "healthy",
-        "vector_search_type": VECTOR_SEARCH_TYPE,
+        "ready": warmup.ready,
+        "vector_search_type": BACKENDS[vector_search.available[0]]["label"] if vector_search.available else None,
+        "vector_search_backends": vector_search.available,
         "environment": os.getenv("ENVIRONMENT", "development"),
         "version": "v2-auth-fixed",
-        "port": os.getenv("PORT", "not-set")
+        "port": os.getenv("PORT", "not-set"),
+        "llm_circuit": llm_service.call_stats()["circuit"]["state"] if llm_service is not None else None
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and handling requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 200 once the startup warm-up has finished, 503 while it is still loading services"""
+    content = {
+        "status": "ready" if warmup.ready else "warming_up",
+        "warmup": warmup.stats(),
+        "vector_search_backends": vector_search.available,
+    }
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=content)
+
 @app.get("/debug/env")
 async def debug_env():
     """Debug endpoint to check environment variables (remove in production)"""
@@ -130,123 +201,368 @@ async def debug_env():
         "available_env_vars": [key for key in os.environ.keys() if not key.startswith("_")]
     }
 
-@app.post("/hackrx/run")
-async def process_documents_and_answer(request: Request):
+async def parse_request(request: Request) -> SimpleDocumentQARequest:
+    """Authenticate and parse a Q&A request"""
+    # Simple authentication
+    if not verify_token(request):
+        logger.warning("Authentication failed")
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    
+    logger.debug("Authentication successful")
+    
+    # Parse request manually
+    try:
+        body = await request.json()
+        if debug_sampled(logger):
+            logger.debug(f"Request body received: {str(body)[:200]}...")
+    except Exception as e:
+        logger.warning(f"Failed to parse JSON: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+    
+    try:
+        qa_request = SimpleDocumentQARequest(body)
+        logger.debug("Request object created successfully")
+    except Exception as e:
+        logger.warning(f"Failed to create request object: {str(e)}")
+        raise HTTPException(status_code=422, detail=f"Request validation failed: {str(e)}")
+    return qa_request
+
+async def build_index(qa_request: SimpleDocumentQARequest, router: RetrieverRouter,
+                      wait: bool = False) -> Dict[str, Any]:
     """
-    Main endpoint for document Q&A processing
-    Simplified version without Pydantic validation
+    Process the request's documents and index their chunks into router, returning the backend selection
+    
+    router is the request's own vector_search.spawn(), so concurrent requests never replace each other's index.
+    Holds an ingestion slot throughout; wait=True (background jobs) waits for one however long it takes.
     """
-    try:
-        print("=== Starting request processing ===")
-        
-        # Simple authentication
-        if not verify_token(request):
-            print("Authentication failed")
-            raise HTTPException(status_code=403, detail="Not authenticated")
-        
-        print("Authentication successful")
-        
-        # Parse request manually
-        try:
-            body = await request.json()
-            print(f"Request body received: {str(body)[:200]}...")
-        except Exception as e:
-            print(f"Failed to parse JSON: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
-        
-        try:
-            qa_request = SimpleDocumentQARequest(body)
-            print("Request object created successfully")
-        except Exception as e:
-            print(f"Failed to create request object: {str(e)}")
-            raise HTTPException(status_code=422, detail=f"Request validation failed: {str(e)}")
-        
-        start_time = time.time()
-        
-        print(f"Processing request with {len(qa_request.documents)} documents and {len(qa_request.questions)} questions")
-        
-        # Process documents and extract text
+    logger.info(f"Processing request with {len(qa_request.documents)} documents and {len(qa_request.questions)} questions")
+    
+    async with admit(qa_request.documents, len(qa_request.questions), wait=wait):
+        # Process documents and extract text, once per distinct document
+        documents = list({fingerprint_document(doc.type, doc.content): doc for doc in qa_request.documents}.values())
+        if len(documents) < len(qa_request.documents):
+            logger.info(f"Collapsed {len(qa_request.documents) - len(documents)} duplicate documents")
         all_chunks = []
         try:
-            for doc in qa_request.documents:
-                print(f"Processing document of type: {doc.type}")
+            for doc in documents:
+                logger.info(f"Processing document of type: {doc.type}")
                 try:
-                    chunks = await document_processor.process_document(doc.type, doc.content, doc.filename)
+                    chunks = await process_document(doc)
                     all_chunks.extend(chunks)
-                    print(f"Successfully processed document: {len(chunks)} chunks")
+                    logger.info(f"Successfully processed document: {len(chunks)} chunks")
                 except Exception as e:
-                    print(f"Error processing document: {str(e)}")
+                    logger.error(f"Error processing document: {str(e)}")
                     raise HTTPException(status_code=400, detail=f"Document processing failed: {str(e)}")
         except HTTPException:
             raise
         except Exception as e:
-            print(f"Unexpected error in document processing: {str(e)}")
+            logger.error(f"Unexpected error in document processing: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Document processing error: {str(e)}")
         
-        print(f"Extracted {len(all_chunks)} text chunks from documents")
+        logger.info(f"Extracted {len(all_chunks)} text chunks from documents")
         
-        # Create vector index
+        # Create vector index on the backend suited to this request
         try:
-            vector_search.create_index(all_chunks)
-            print("Created vector index")
+            retrieval = router.create_index(all_chunks, num_queries=len(qa_request.questions), top_k=5)
+            logger.info(f"Created {retrieval['engine']} vector index ({retrieval['reason']})")
         except Exception as e:
-            print(f"Error creating vector index: {str(e)}")
+            logger.error(f"Error creating vector index: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Vector index creation failed: {str(e)}")
         
-        # Process each question
-        answers = []
-        for question in qa_request.questions:
-            print(f"Processing question: {question[:50]}...")
-            
-            # Search for relevant chunks
-            relevant_chunks = vector_search.search(question, top_k=5)
-            print(f"Found {len(relevant_chunks)} relevant chunks")
-            
-            # Generate answer using LLM
-            context_text = "\n\n".join([chunk.get('text', chunk) for chunk in relevant_chunks])
-            
-            try:
-                llm = get_llm_service()  # Lazy initialization
-                answer_result = await llm.generate_answer(question, context_text)
-                source_texts = [chunk.get('text', chunk)[:200] + "..." for chunk in relevant_chunks[:3]]
-                
-                answers.append(SimpleAnswerResult(
-                    question=question,
-                    answer=answer_result.answer,
-                    confidence=answer_result.confidence,
-                    sources=source_texts
-                ))
-            except Exception as e:
-                print(f"Error generating answer: {str(e)}")
-                answers.append(SimpleAnswerResult(
-                    question=question,
-                    answer="An error occurred while processing this question. Please try again.",
-                    confidence=0.0,
-                    sources=[]
-                ))
+        # Pull structured facts for the extractive fast path while the document is fresh
+        qa_pipeline.index_facts(all_chunks)
+        # Pre-answer the configured question set in the background for later requests
+        prefetcher.start(exclude=qa_request.questions, retriever=router)
+        return retrieval
+
+def check_limits(documents: list, questions: int) -> int:
+    """A request's estimated ingestion memory; 413 when it exceeds MAX_DOCUMENTS, MAX_QUESTIONS or MAX_CONTENT_SIZE"""
+    try:
+        return admission.check(documents, questions)
+    except RequestLimitError as e:
+        logger.warning(f"Request over limits: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+
+@asynccontextmanager
+async def admit(documents: list, questions: int, wait: bool = False):
+    """Hold an ingestion slot for a request's documents: 413 over the request limits, 429 when the server is saturated"""
+    cost = check_limits(documents, questions)
+    try:
+        ticket = await admission.acquire(cost, wait=wait)
+    except AdmissionRejectedError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield
+    finally:
+        admission.release(ticket)
+
+async def process_document(doc) -> list:
+    """Extract a document's chunks, joining an identical document already being processed"""
+    return await ingestions.do(
+        fingerprint_document(doc.type, doc.content),
+        lambda: document_processor.process_document(doc.type, doc.content, doc.filename)
+    )
+
+def to_simple_answer(answer_result) -> SimpleAnswerResult:
+    """Convert a pipeline answer into the response model, with short source excerpts"""
+    source_texts = [] if answer_result.served_by == "error" else [
+        chunk[:200] + "..." for chunk in answer_result.retrieved_chunks[:3]
+    ]
+    return SimpleAnswerResult(
+        question=answer_result.question,
+        answer=answer_result.answer,
+        confidence=answer_result.confidence,
+        sources=source_texts
+    )
+
+def build_metadata(retrieval: Dict[str, Any], results: list) -> Dict[str, Any]:
+    """Response metadata: retrieval backend, cache hits, extractive answers, prompt tokens, scheduler, LLM call, pre-answering, job queue, admission, document session and coalescing state"""
+    metadata = {"retrieval": retrieval}
+    if semantic_cache is not None:
+        metadata["semantic_cache_hits"] = sum(1 for r in results if r.served_by == "semantic_cache")
+    if answer_cache is not None:
+        metadata["answer_cache_hits"] = sum(1 for r in results if r.served_by == "answer_cache")
+    if qa_pipeline.packing:
+        metadata["packed_answers"] = sum(1 for r in results if r.served_by == "llm_packed")
+    metadata["prompt_tokens"] = qa_pipeline.prompt_token_report(results)
+    metadata["llm_scheduler"] = qa_pipeline.scheduler.stats()
+    if prefetcher.enabled:
+        metadata["prefetch"] = prefetcher.stats()
+    if llm_service is not None:
+        metadata["llm_calls"] = llm_service.call_stats()
+    metadata["extractive"] = qa_pipeline.extractive_report(
+        results, metadata["llm_calls"]["latency_p50"] if "llm_calls" in metadata else None
+    )
+    metadata["jobs"] = job_queue.stats()
+    metadata["admission"] = admission.stats()
+    metadata["document_sessions"] = sessions.stats()
+    metadata["single_flight"] = {"ingestion": ingestions.stats(), "llm": qa_pipeline.llm_flights.stats()}
+    metadata["stages"] = stage_breakdown()
+    return metadata
+
+@app.get("/hackrx/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    """
+    A stored request profile
+    
+    Folded stacks for flame graph tools (flamegraph.pl, speedscope), or the
+    summary with per-stage wall/CPU time and top allocations for ?format=json.
+    Needs the profiling token in the X-Profile header.
+    """
+    if not token_valid(request.headers.get(PROFILE_HEADER, "")):
+        raise HTTPException(status_code=403, detail="Invalid profiling token or profiling disabled")
+    fmt = request.query_params.get("format", "folded")
+    content = load_profile(profile_id, fmt)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=content, media_type="application/json" if fmt == "json" else "text/plain")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latency histograms, cache hit rates, queue depths and requests in flight"""
+    # Off the event loop: with METRICS_DIR set, every worker's snapshot is read from disk
+    content = await asyncio.to_thread(render, collect_families())
+    return Response(content=content, media_type=CONTENT_TYPE)
+
+def collect_families() -> list:
+    """This app's service metric families"""
+    return service_families(qa_pipeline, job_queue, prefetcher, ingestions, sessions, admission)
+
+@app.post("/hackrx/run")
+async def process_documents_and_answer(request: Request):
+    """
+    Main endpoint for document Q&A processing
+    Simplified version without Pydantic validation
+    """
+    try:
+        logger.info("Starting request processing")
+        qa_request = await parse_request(request)
+        
+        start_time = time.time()
+        # The request gets its own index, so a concurrent request cannot replace it mid-answer
+        router = vector_search.spawn()
+        retrieval = await build_index(qa_request, router)
+        
+        # Process each question (semantic cache, retrieval, LLM with lazy initialization)
+        use_cache = not bypass_requested(request.headers)
+        if not use_cache:
+            logger.info("Cache bypass requested, generating fresh answers")
+        results = await qa_pipeline.for_retriever(router).answer_questions(qa_request.questions, use_cache=use_cache)
+        answers = [to_simple_answer(answer_result) for answer_result in results]
         
         processing_time = time.time() - start_time
-        print(f"Successfully processed all {len(qa_request.questions)} questions")
+        logger.info(f"Successfully processed all {len(qa_request.questions)} questions")
         
         # Create response
         try:
-            response = SimpleDocumentQAResponse(answers, processing_time)
+            response = SimpleDocumentQAResponse(answers, processing_time, metadata=build_metadata(retrieval, results))
             response_dict = response.to_dict()
-            print("Response created successfully")
+            logger.debug("Response created successfully")
             return JSONResponse(content=response_dict)
         except Exception as e:
-            print(f"Error creating response: {str(e)}")
+            logger.error(f"Error creating response: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Response creation failed: {str(e)}")
-        
+    
+    except HTTPException:
+        raise
     except ValueError as e:
-        print(f"Validation error: {str(e)}")
+        logger.warning(f"Validation error: {str(e)}")
         raise HTTPException(status_code=422, detail=f"Validation error: {str(e)}")
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/hackrx/run/stream")
+async def stream_documents_and_answer(request: Request):
+    """
+    Streaming variant of /hackrx/run
+    
+    Sends each answer as soon as it is ready, then a summary event with timings.
+    Server-Sent Events by default; NDJSON for "Accept: application/x-ndjson" or
+    ?format=ndjson. Pass ?tokens=true to also stream answer text as it is generated.
+    """
+    logger.info("Starting streaming request")
+    qa_request = await parse_request(request)
+    
+    started_at = time.perf_counter()
+    # Answers are retrieved while the body streams, from this request's own index
+    router = vector_search.spawn()
+    retrieval = await build_index(qa_request, router)
+    
+    fmt = stream_format(request.query_params, request.headers)
+    logger.info(f"Streaming {len(qa_request.questions)} answers as {fmt}")
+    events = stream_answers(
+        qa_pipeline.for_retriever(router),
+        qa_request.questions,
+        serialize=lambda result: to_simple_answer(result).to_dict(),
+        fmt=fmt,
+        use_cache=not bypass_requested(request.headers),
+        stream_tokens=request.query_params.get("tokens", "false").lower() == "true",
+        started_at=started_at,
+        summarize=lambda results: {"metadata": build_metadata(retrieval, results)}
+    )
+    return StreamingResponse(events, media_type=STREAM_MEDIA_TYPES[fmt], headers=STREAM_HEADERS)
+
+async def parse_body(request: Request, model):
+    """Authenticate a request and parse its JSON body into a simple model"""
+    if not verify_token(request):
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    try:
+        body = await request.json()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+    try:
+        return model(body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Request validation failed: {str(e)}")
+
+@app.post("/hackrx/documents")
+async def register_document(request: Request):
+    """
+    Process and index a document once and return its document_id
+    
+    Follow-up questions go to /hackrx/questions. Sessions expire after
+    SESSION_TTL seconds without use and are evicted beyond SESSION_MAX_BYTES.
+    """
+    doc = await parse_body(request, SimpleDocumentInput)
+    logger.info(f"Registering document of type: {doc.type}")
+    async with admit([doc], 0):
+        try:
+            chunks = await process_document(doc)
+        except Exception as e:
+            logger.error(f"Error processing document: {str(e)}")
+            raise HTTPException(status_code=400, detail=f"Document processing failed: {str(e)}")
+        if not chunks:
+            raise HTTPException(status_code=400, detail="No content could be extracted from the document")
+        
+        session, created = sessions.register(chunks)
+        if created:
+            qa_pipeline.index_facts(chunks)
+    logger.info(f"Document {session.document_id[:12]} {'registered' if created else 'already registered'}")
+    return JSONResponse(status_code=201 if created else 200, content=session.to_dict(sessions.ttl))
+
+@app.delete("/hackrx/documents/{document_id}")
+async def delete_document(document_id: str, request: Request):
+    """Drop a registered document's index"""
+    if not verify_token(request):
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    if not sessions.delete(document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return Response(status_code=204)
+
+@app.post("/hackrx/questions")
+async def answer_about_documents(request: Request):
+    """Answer questions about documents registered with /hackrx/documents"""
+    qa_request = await parse_body(request, SimpleDocumentQuestionsRequest)
+    check_limits([], len(qa_request.questions))
+    start_time = time.time()
+    try:
+        retriever = sessions.retriever(qa_request.document_ids)
+    except UnknownDocumentError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    
+    logger.info(f"Answering {len(qa_request.questions)} questions about {len(qa_request.document_ids)} registered documents")
+    results = await qa_pipeline.for_retriever(retriever).answer_questions(
+        qa_request.questions, use_cache=not bypass_requested(request.headers)
+    )
+    retrieval = {"document_ids": qa_request.document_ids, "fingerprint": retriever.fingerprint}
+    response = SimpleDocumentQAResponse(
+        [to_simple_answer(result) for result in results],
+        time.time() - start_time,
+        metadata=build_metadata(retrieval, results)
+    )
+    return JSONResponse(content=response.to_dict())
+
+@app.post("/hackrx/jobs")
+async def submit_job(request: Request):
+    """
+    Queue a /hackrx/run request as a background job and return its id
+    
+    Poll GET /hackrx/jobs/{job_id} for progress and the result. Retries sending
+    the same "Idempotency-Key" header get the existing job back (200) instead
+    of a new one (202).
+    """
+    qa_request = await parse_request(request)
+    check_limits(qa_request.documents, len(qa_request.questions))
+    body = await request.json()
+    try:
+        job, created = await job_queue.submit(
+            body,
+            idempotency_key=request.headers.get(IDEMPOTENCY_HEADER),
+            options={"use_cache": not bypass_requested(request.headers)}
+        )
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Job {job['id']} for {len(qa_request.questions)} questions: {'queued' if created else job['status']}")
+    return JSONResponse(status_code=202 if created else 200, content=job_status(job))
+
+@app.get("/hackrx/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Job status with the answers completed so far, or the full result once finished"""
+    if not verify_token(request):
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    job = job_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job_status(job))
+
+async def run_job(payload: Dict[str, Any], options: Dict[str, Any], on_answer) -> Dict[str, Any]:
+    """Run a queued request through the /hackrx/run pipeline, recording each answer as it completes"""
+    qa_request = SimpleDocumentQARequest(payload)
+    start_time = time.time()
+    router = vector_search.spawn()
+    retrieval = await build_index(qa_request, router, wait=True)
+    
+    results = [None] * len(qa_request.questions)
+    async for position, result in qa_pipeline.for_retriever(router).iter_answers(qa_request.questions, use_cache=options.get("use_cache", True)):
+        results[position] = result
+        on_answer(position, to_simple_answer(result).to_dict())
+    
+    answers = [to_simple_answer(result) for result in results]
+    return SimpleDocumentQAResponse(answers, time.time() - start_time, metadata=build_metadata(retrieval, results)).to_dict()
+
+job_queue = JobQueue(JobStore(), run_job)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
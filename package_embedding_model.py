@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Package the embedding model as a memory-mapped artifact
+
+Writes EMBEDDING_MODEL (or --model) to EMBEDDING_MODEL_PATH (or --output)
+with its weights in safetensors files and a manifest. VectorSearchService
+then loads it from there without the HuggingFace hub and memory-maps its
+weights, so worker processes share one page cache copy.
+
+Run it once at build time, with network access, e.g. in the build command.
+It then checks the artifact: it loads the model both ways in fresh
+processes and reports load time, private (anonymous) and file-backed
+resident memory, and the largest difference between their embeddings.
+
+Usage:
+    python package_embedding_model.py [--model NAME] [--output DIR] [--no-verify]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from app.utils.model_artifacts import artifact_dir, package_model
+
+SAMPLE_TEXTS = [
+    "What is the grace period for premium payment?",
+    "The policy covers cataract surgery after a waiting period of two years.",
+    "Pre-existing diseases are covered after 36 months of continuous coverage.",
+]
+
+# Run in a fresh interpreter: load the model one way, then report and save embeddings
+LOAD_SCRIPT = """
+import json, sys, time
+import numpy as np
+start = time.perf_counter()
+if sys.argv[1] == "packaged":
+    from app.utils.model_artifacts import load_packaged_model
+    model = load_packaged_model(sys.argv[2])
+else:
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(sys.argv[2], device="cpu")
+seconds = time.perf_counter() - start
+np.save(sys.argv[3], model.encode(json.loads(sys.argv[4])))
+memory = {}
+for line in open("/proc/self/smaps_rollup"):
+    key, _, value = line.partition(":")
+    if key in ("Rss", "Anonymous", "Pss"):
+        memory[key] = int(value.split()[0]) / 1024
+print(json.dumps({"seconds": seconds, **memory}))
+"""
+
+
+def measure_load(kind: str, source: str, embeddings_path: str) -> dict:
+    """Load the model in a fresh process; load time, memory in MB, and its embeddings of SAMPLE_TEXTS"""
+    result = subprocess.run(
+        [sys.executable, "-c", LOAD_SCRIPT, kind, source, embeddings_path, json.dumps(SAMPLE_TEXTS)],
+        env={**os.environ, "LOG_FILE": "", "LOG_LEVEL": "WARNING"},
+        capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["embeddings"] = np.load(embeddings_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2"))
+    parser.add_argument("--output", default=artifact_dir(), help="artifact directory")
+    parser.add_argument("--no-verify", action="store_true", help="skip the load comparison")
+    args = parser.parse_args()
+
+    print(f"📦 Packaging {args.model} into {args.output}")
+    manifest = package_model(args.model, args.output)
+    size = sum(entry["bytes"] for entry in manifest["files"].values())
+    print(f"✅ {len(manifest['files'])} files, {size / 1024 / 1024:.1f} MB, dimension {manifest['dimension']}")
+
+    if args.no_verify:
+        return
+
+    with tempfile.TemporaryDirectory() as scratch:
+        hub = measure_load("hub", args.model, str(Path(scratch, "hub.npy")))
+        packaged = measure_load("packaged", args.output, str(Path(scratch, "packaged.npy")))
+
+    print(f"\n{'load':<12}{'seconds':>10}{'RSS (MB)':>12}{'private (MB)':>15}{'file (MB)':>12}")
+    for label, report in (("hub", hub), ("packaged", packaged)):
+        print(
+            f"{label:<12}{report['seconds']:>10.2f}{report['Rss']:>12.0f}"
+            f"{report['Anonymous']:>15.0f}{report['Rss'] - report['Anonymous']:>12.0f}"
+        )
+
+    difference = float(np.abs(hub["embeddings"] - packaged["embeddings"]).max())
+    print(f"\n📐 Largest embedding difference: {difference:.2e}")
+    if difference > 1e-4:
+        print("❌ The packaged model does not reproduce the original embeddings")
+        sys.exit(1)
+    print("🚀 Packaged model verified")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.services.answer_scheduler import AnswerScheduler
+from app.services.llm_service import SimpleAnswerResult
+from app.services.prompt_packing import PackedAnswerError
+from app.services.qa_pipeline import QAPipeline
+
+class FakeRetriever:
+    """
+    Retriever over a fixed index
+    
+    results maps each question to its chunks, as a dictionary or a function;
+    without it every question retrieves one chunk naming the question.
+    """
+    fingerprint = "doc"
+    
+    def __init__(self, results=None):
+        self.results = results
+    
+    def embed_query(self, query):
+        return None
+    
+    def search(self, query, top_k=5):
+        if self.results is None:
+            chunks = [f"Context for {query}."]
+        elif callable(self.results):
+            chunks = self.results(query)
+        else:
+            chunks = self.results[query]
+        return [chunk if isinstance(chunk, dict) else {"text": chunk, "score": 1.0, "index": None} for chunk in chunks]
+    
+    def search_batch(self, queries, top_k=5):
+        return [self.search(query, top_k) for query in queries]
+
+class FakeLLM:
+    """LLM answering 'Answer to <question>.' after delay seconds (a number, or per question), recording its calls"""
+    model_name = "fake-model"
+    prompt_version = "single"
+    packed_prompt_version = "packed"
+    max_tokens = 0
+    
+    def __init__(self, delay=0.0, packed_ok=True):
+        self.delay = delay
+        self.packed_ok = packed_ok
+        self.calls = []
+        self.packed_calls = []
+    
+    async def generate_answer(self, question, context, raise_on_error=False, on_token=None):
+        self.calls.append(question)
+        await asyncio.sleep(self.delay.get(question, 0.0) if isinstance(self.delay, dict) else self.delay)
+        answer = f"Answer to {question}."
+        if on_token is not None:
+            for word in answer.split(" "):
+                on_token(word + " ")
+        return SimpleAnswerResult(answer=answer, confidence=0.8, question=question)
+    
+    async def generate_answers_packed(self, questions, context):
+        self.packed_calls.append((list(questions), context))
+        if not self.packed_ok:
+            raise PackedAnswerError("Invalid JSON in packed response")
+        return [SimpleAnswerResult(answer=f"Packed answer to {q}.", confidence=0.8, question=q) for q in questions]
+
+@pytest.fixture
+def fake_llm():
+    """FakeLLM factory, for tests that set its delay or inspect its calls"""
+    return FakeLLM
+
+@pytest.fixture
+def make_pipeline():
+    """
+    Build a QAPipeline over fakes
+    
+    make_pipeline(results=None, retriever=None, llm=None, **options) answers
+    from FakeRetriever(results) unless a retriever is given, with llm or a
+    new FakeLLM (reachable as pipeline.get_llm()), and an unthrottled
+    scheduler unless options set one.
+    """
+    def make(results=None, retriever=None, llm=None, **options):
+        llm = llm or FakeLLM()
+        options.setdefault("scheduler", AnswerScheduler(requests_per_minute=0))
+        return QAPipeline(retriever or FakeRetriever(results), lambda: llm, **options)
+    return make
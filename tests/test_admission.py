@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.admission import (
+    MEMORY_PER_CONTENT_BYTE, MEMORY_PER_QUESTION, AdmissionController, AdmissionRejectedError, RequestLimitError
+)
+
+def doc(doc_type, content):
+    return SimpleNamespace(type=doc_type, content=content)
+
+def test_limits_and_cost_estimate():
+    admission = AdmissionController(max_documents=2, max_questions=3, max_content_size=1000)
+    cost = admission.check([doc("text", "x" * 100), doc("pdf", "A" * 400)], 2)
+    # base64 content counts at its decoded size
+    assert cost == 400 * MEMORY_PER_CONTENT_BYTE + 2 * MEMORY_PER_QUESTION
+    
+    with pytest.raises(RequestLimitError, match="documents"):
+        admission.check([doc("text", "x")] * 3, 1)
+    with pytest.raises(RequestLimitError, match="questions"):
+        admission.check([doc("text", "x")], 4)
+    with pytest.raises(RequestLimitError, match="too large"):
+        admission.check([doc("text", "x" * 1001)], 1)
+
+def test_queue_bounded_and_full_queue_rejected():
+    async def run():
+        admission = AdmissionController(max_concurrent=1, queue_size=1, max_wait=5)
+        running = await admission.acquire(10)
+        queued = asyncio.ensure_future(admission.acquire(10))
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"] == 1
+        
+        with pytest.raises(AdmissionRejectedError) as info:
+            await admission.acquire(10)
+        assert info.value.retry_after >= 1
+        
+        admission.release(running)
+        admission.release(await queued)
+        return admission.stats()
+    
+    stats = asyncio.run(run())
+    assert stats["in_flight"] == stats["reserved_bytes"] == 0
+    assert stats["admitted"] == 2 and stats["rejected"] == 1
+
+def test_memory_budget_admits_in_arrival_order():
+    async def run():
+        admission = AdmissionController(max_concurrent=4, memory_budget=100, queue_size=4, max_wait=5)
+        order = []
+        
+        async def ingest(name, cost):
+            ticket = await admission.acquire(cost)
+            order.append(name)
+            await asyncio.sleep(0.01)
+            admission.release(ticket)
+        
+        first = await admission.acquire(80)
+        tasks = [asyncio.ensure_future(ingest("large", 60)), asyncio.ensure_future(ingest("small", 10))]
+        await asyncio.sleep(0.01)
+        # "small" fits the budget but waits behind "large"
+        assert order == []
+        admission.release(first)
+        await asyncio.gather(*tasks)
+        return order
+    
+    assert asyncio.run(run()) == ["large", "small"]
+
+def test_wait_times_out_and_background_waits():
+    async def run():
+        admission = AdmissionController(max_concurrent=1, queue_size=0, max_wait=0.01)
+        running = await admission.acquire(1)
+        with pytest.raises(AdmissionRejectedError):
+            await admission.acquire(1)
+        
+        # Background work ignores the queue bound and the timeout
+        background = asyncio.ensure_future(admission.acquire(1, wait=True))
+        await asyncio.sleep(0.05)
+        assert not background.done()
+        admission.release(running)
+        admission.release(await background)
+        return admission.stats()
+    
+    assert asyncio.run(run())["in_flight"] == 0
+
+def test_oversized_request_runs_alone():
+    async def run():
+        admission = AdmissionController(max_concurrent=2, memory_budget=100, max_wait=5)
+        ticket = await admission.acquire(1000)
+        assert admission.reserved == 100
+        admission.release(ticket)
+    
+    asyncio.run(run())
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from app.services.answer_cache import AnswerCache, bypass_requested
+
+ANSWER = {"question": "What is the grace period?", "answer": "Thirty days.", "confidence": 0.9,
+          "source_chunks": [], "reasoning": "Found explicit reference in document structure"}
+
+def test_key_covers_model_prompt_question_and_context():
+    """Changing any key component produces a different key"""
+    base = AnswerCache.make_key("gemini-1.5-flash", "v1", "What is the grace period?", "context")
+    assert base == AnswerCache.make_key("gemini-1.5-flash", "v1", "What is the grace period?", "context")
+    assert base != AnswerCache.make_key("gemini-1.5-pro", "v1", "What is the grace period?", "context")
+    assert base != AnswerCache.make_key("gemini-1.5-flash", "v2", "What is the grace period?", "context")
+    assert base != AnswerCache.make_key("gemini-1.5-flash", "v1", "What is the waiting period?", "context")
+    assert base != AnswerCache.make_key("gemini-1.5-flash", "v1", "What is the grace period?", "context ")
+
+def test_persists_across_instances(tmp_path):
+    """Answers survive a restart"""
+    path = str(tmp_path / "answers.sqlite3")
+    AnswerCache(path=path, max_bytes=1 << 20, ttl=0).set("key", ANSWER)
+    
+    cache = AnswerCache(path=path, max_bytes=1 << 20, ttl=0)
+    assert cache.get("key") == ANSWER
+    assert cache.get("other") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_forked_worker_opens_its_own_connection(tmp_path):
+    """A worker forked from a preloaded app does not reuse the parent's SQLite connection"""
+    cache = AnswerCache(path=str(tmp_path / "answers.sqlite3"), max_bytes=1 << 20, ttl=0)
+    cache.set("key", ANSWER)
+    parent_connection = cache._conn
+    
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            ok = cache.get("key") == ANSWER and cache._conn is not parent_connection
+            cache.set("child", ANSWER)
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert cache._conn is parent_connection
+    assert cache.get("child") == ANSWER
+
+def test_expires_entries():
+    """Entries older than the TTL are misses"""
+    cache = AnswerCache(path=":memory:", max_bytes=1 << 20, ttl=0.05)
+    cache.set("key", ANSWER)
+    assert cache.get("key") == ANSWER
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+def test_evicts_least_recently_used_over_budget():
+    """Storing beyond the byte budget evicts the least recently used answers"""
+    entry_size = AnswerCache(path=":memory:", max_bytes=1 << 20, ttl=0)
+    entry_size.set("probe", ANSWER)
+    size = entry_size.stats()["bytes"]
+    
+    cache = AnswerCache(path=":memory:", max_bytes=2 * size, ttl=0)
+    cache.set("a", ANSWER)
+    time.sleep(0.01)
+    cache.set("b", ANSWER)
+    time.sleep(0.01)
+    assert cache.get("a") is not None
+    time.sleep(0.01)
+    cache.set("c", ANSWER)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["bytes"] <= 2 * size
+    assert cache.stats()["evictions"] == 1
+
+def test_totals_track_every_write(tmp_path):
+    """Stored byte and entry counts follow inserts, overwrites, evictions and clears without rescanning"""
+    path = str(tmp_path / "answers.sqlite3")
+    cache = AnswerCache(path=path, max_bytes=1 << 20, ttl=0)
+    
+    def counted():
+        stats = cache.stats()
+        entries, size = cache._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        return (stats["entries"], stats["bytes"]) == (entries, size)
+    
+    cache.set("a", ANSWER)
+    cache.set("b", {**ANSWER, "answer": "Thirty days from the due date."})
+    assert cache.stats()["entries"] == 2 and counted()
+    cache.set("a", {**ANSWER, "answer": "30 days."})
+    assert cache.stats()["entries"] == 2 and counted()
+    
+    # A second process opening the same file sees the same totals
+    assert AnswerCache(path=path, max_bytes=1 << 20, ttl=0).stats()["bytes"] == cache.stats()["bytes"]
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and counted()
+
+def test_totals_count_a_store_created_before_them(tmp_path):
+    """A store written without the totals table is counted once when opened"""
+    import sqlite3
+    path = str(tmp_path / "answers.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE answers (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                 "created_at REAL NOT NULL, last_used REAL NOT NULL)")
+    conn.execute("INSERT INTO answers VALUES ('old', ?, 7, ?, ?)", (json.dumps(ANSWER), time.time(), time.time()))
+    conn.commit()
+    conn.close()
+    
+    cache = AnswerCache(path=path, max_bytes=1 << 20, ttl=0)
+    assert cache.stats()["entries"] == 1 and cache.stats()["bytes"] == 7
+    indexes = {row[0] for row in cache._conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "answers_created_at" in indexes
+
+def test_bypass_header():
+    """Bypass is requested by X-Cache-Bypass or Cache-Control: no-cache"""
+    assert bypass_requested({"X-Cache-Bypass": "true"})
+    assert bypass_requested({"Cache-Control": "no-cache"})
+    assert not bypass_requested({"X-Cache-Bypass": "false"})
+    assert not bypass_requested({})
+
+def test_pipeline_serves_repeats_from_cache(make_pipeline):
+    """Repeated questions skip the LLM unless the cache is bypassed"""
+    pipeline = make_pipeline(lambda question: ["The grace period is thirty days."],
+                             answer_cache=AnswerCache(path=":memory:", max_bytes=1 << 20, ttl=0))
+    llm = pipeline.get_llm()
+    questions = ["What is the grace period?"]
+    
+    first = asyncio.run(pipeline.answer_questions(questions))
+    second = asyncio.run(pipeline.answer_questions(questions))
+    assert len(llm.calls) == 1
+    assert first[0].served_by == "llm"
+    assert second[0].served_by == "answer_cache"
+    assert second[0].answer == first[0].answer
+    assert second[0].retrieved_chunks == ["The grace period is thirty days."]
+    
+    fresh = asyncio.run(pipeline.answer_questions(questions, use_cache=False))
+    assert len(llm.calls) == 2
+    assert fresh[0].served_by == "llm"
+
+def test_pipeline_reads_and_writes_the_cache_off_the_event_loop(make_pipeline):
+    """SQLite calls run in worker threads, not on the thread running the event loop"""
+    threads = []
+    
+    class RecordingCache(AnswerCache):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+        
+        def set(self, key, answer):
+            threads.append(threading.get_ident())
+            super().set(key, answer)
+    
+    pipeline = make_pipeline(answer_cache=RecordingCache(path=":memory:", max_bytes=1 << 20, ttl=0))
+    asyncio.run(pipeline.answer_questions(["What is the grace period?"]))
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
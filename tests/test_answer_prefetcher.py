@@ -0,0 +1,85 @@
+import asyncio
+
+from app.services.answer_cache import AnswerCache
+from app.services.answer_prefetcher import AnswerPrefetcher
+from app.services.answer_scheduler import AnswerScheduler
+from app.services.retriever_router import RetrieverRouter
+
+POLICY = [
+    "The grace period for premium payment is thirty days from the due date.",
+    "Cataract treatment is covered up to Rs. 40,000 per eye.",
+    "Ambulance charges are covered up to Rs. 2,000 per hospitalisation.",
+    "Home nursing is not covered under this policy.",
+]
+OTHER_POLICY = ["Travel insurance covers lost baggage up to USD 500.", "Trip cancellation is covered."]
+QUESTIONS = ["Is cataract treatment covered?", "Is ambulance service covered?", "Is home nursing covered?"]
+
+def make_router_pipeline(make_pipeline, tmp_path, llm=None):
+    return make_pipeline(
+        retriever=RetrieverRouter(backend="basic"), llm=llm, top_k=2,
+        scheduler=AnswerScheduler(max_concurrency=2, requests_per_minute=0, tokens_per_minute=0),
+        answer_cache=AnswerCache(path=str(tmp_path / "answers.sqlite3"))
+    )
+
+def test_prefetched_answers_are_served_from_cache(tmp_path, make_pipeline, fake_llm):
+    llm = fake_llm()
+    pipeline = make_router_pipeline(make_pipeline, tmp_path, llm)
+    prefetcher = AnswerPrefetcher(pipeline, questions=QUESTIONS)
+    
+    async def run():
+        pipeline.retriever.create_index(POLICY)
+        await prefetcher.start(exclude=[QUESTIONS[0]])
+        prefetched = list(llm.calls)
+        results = await pipeline.answer_questions(QUESTIONS[1:])
+        # The same document again: nothing left to pre-answer
+        assert prefetcher.start() is None
+        return prefetched, results
+    
+    prefetched, results = asyncio.run(run())
+    assert prefetched == QUESTIONS[1:]
+    assert [result.served_by for result in results] == ["answer_cache", "answer_cache"]
+    assert llm.calls == QUESTIONS[1:]
+    stats = prefetcher.stats()
+    assert stats["completed"] == 1 and stats["answered"] == 2
+    assert pipeline.scheduler.stats()["background_calls"] == 2
+
+def test_prefetch_is_cancelled_when_document_is_evicted(tmp_path, make_pipeline, fake_llm):
+    pipeline = make_router_pipeline(make_pipeline, tmp_path, fake_llm(delay=0.2))
+    prefetcher = AnswerPrefetcher(pipeline, questions=QUESTIONS)
+    
+    async def run():
+        pipeline.retriever.create_index(POLICY)
+        task = prefetcher.start()
+        await asyncio.sleep(0.05)
+        pipeline.retriever.create_index(OTHER_POLICY)
+        await asyncio.gather(task, return_exceptions=True)
+        return task
+    
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert prefetcher.stats()["cancelled"] == 1
+    assert prefetcher.stats()["running"] == 0
+    assert pipeline.answer_cache.stats()["entries"] == 0
+
+def test_prefetch_disabled_without_question_set_or_cache(tmp_path, make_pipeline):
+    pipeline = make_router_pipeline(make_pipeline, tmp_path)
+    assert not AnswerPrefetcher(pipeline, questions=[]).enabled
+    pipeline.answer_cache = None
+    assert not AnswerPrefetcher(pipeline, questions=QUESTIONS).enabled
+
+def test_prefetches_a_requests_own_index(tmp_path, make_pipeline, fake_llm):
+    """A request indexed into a spawned router is pre-answered from that router"""
+    llm = fake_llm()
+    pipeline = make_router_pipeline(make_pipeline, tmp_path, llm)
+    prefetcher = AnswerPrefetcher(pipeline, questions=QUESTIONS)
+    router = pipeline.retriever.spawn()
+    
+    async def run():
+        router.create_index(POLICY)
+        await prefetcher.start(retriever=router)
+        return await pipeline.for_retriever(router).answer_questions(QUESTIONS)
+    
+    results = asyncio.run(run())
+    assert pipeline.retriever.fingerprint is None
+    assert [result.served_by for result in results] == ["answer_cache"] * 3
+    assert sorted(llm.calls) == sorted(QUESTIONS)
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.answer_scheduler import AnswerScheduler, TokenBucket, is_retryable
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """Fake LLM endpoint: answers after a per-question delay, failing a configured number of times first"""
+    
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        question = payload["question"]
+        
+        with server.lock:
+            server.attempts[question] = server.attempts.get(question, 0) + 1
+            attempt = server.attempts[question]
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(payload.get("delay", 0.0))
+            failures = server.failures.get(question, (0, 200))
+            if attempt <= failures[0]:
+                self.send_response(failures[1])
+                self.end_headers()
+                return
+            body = json.dumps({"answer": f"answer to {question}"}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def fake_llm_server():
+    """Local HTTP server standing in for the LLM provider"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeLLMHandler)
+    server.lock = threading.Lock()
+    server.attempts = {}
+    server.failures = {}
+    server.active = 0
+    server.max_active = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def ask(server, question: str, delay: float = 0.0):
+    """Coroutine function calling the fake LLM from a worker thread"""
+    async def call():
+        def post():
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{server.server_address[1]}/generate",
+                data=json.dumps({"question": question, "delay": delay}).encode(),
+                headers={"Content-Type": "application/json"}
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return json.loads(response.read())["answer"]
+        return await asyncio.to_thread(post)
+    return call
+
+def make_scheduler(**overrides):
+    options = dict(max_concurrency=4, requests_per_minute=0, tokens_per_minute=0,
+                   max_retries=3, base_delay=0.01, max_delay=0.05)
+    options.update(overrides)
+    return AnswerScheduler(**options)
+
+def test_calls_run_concurrently(fake_llm_server):
+    """Calls overlap instead of waiting for one another"""
+    scheduler = make_scheduler()
+    questions = [("q1", 0.3), ("q2", 0.0), ("q3", 0.15), ("q4", 0.0)]
+    
+    async def run():
+        return await asyncio.gather(*(scheduler.call(ask(fake_llm_server, *item)) for item in questions))
+    
+    start = time.perf_counter()
+    answers = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    
+    assert answers == [f"answer to {q}" for q, _ in questions]
+    assert elapsed < 0.45  # concurrent, not the 0.45s sum of delays
+
+def test_concurrency_is_bounded(fake_llm_server):
+    """No more than max_concurrency calls are in flight"""
+    scheduler = make_scheduler(max_concurrency=2)
+    
+    async def run():
+        return await asyncio.gather(*(scheduler.call(ask(fake_llm_server, f"q{i}", 0.05)) for i in range(6)))
+    
+    asyncio.run(run())
+    assert fake_llm_server.max_active <= 2
+
+def test_retries_rate_limited_calls(fake_llm_server):
+    """429 and 5xx responses are retried until the call succeeds"""
+    fake_llm_server.failures = {"limited": (2, 429), "flaky": (1, 503)}
+    scheduler = make_scheduler()
+    
+    async def run():
+        return await asyncio.gather(*(scheduler.call(ask(fake_llm_server, q)) for q in ["limited", "flaky"]))
+    
+    assert asyncio.run(run()) == ["answer to limited", "answer to flaky"]
+    assert fake_llm_server.attempts == {"limited": 3, "flaky": 2}
+    assert scheduler.stats()["retries"] == 3
+
+def test_does_not_retry_client_errors(fake_llm_server):
+    """Non-retryable errors are raised immediately"""
+    fake_llm_server.failures = {"bad": (1, 400)}
+    scheduler = make_scheduler()
+    
+    with pytest.raises(urllib.error.HTTPError):
+        asyncio.run(scheduler.call(ask(fake_llm_server, "bad")))
+    assert fake_llm_server.attempts == {"bad": 1}
+    assert scheduler.stats()["failures"] == 1
+
+def test_gives_up_after_max_retries(fake_llm_server):
+    """A persistently failing call raises after max_retries retries"""
+    fake_llm_server.failures = {"down": (10, 500)}
+    scheduler = make_scheduler(max_retries=2)
+    
+    with pytest.raises(urllib.error.HTTPError):
+        asyncio.run(scheduler.call(ask(fake_llm_server, "down")))
+    assert fake_llm_server.attempts == {"down": 3}
+
+def test_request_rate_is_limited(fake_llm_server):
+    """The requests-per-minute bucket throttles bursts beyond its capacity"""
+    scheduler = make_scheduler()
+    scheduler.request_bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 10/s after a burst of 2
+    
+    async def run():
+        return await asyncio.gather(*(scheduler.call(ask(fake_llm_server, f"q{i}")) for i in range(4)))
+    
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - start >= 0.18
+    assert scheduler.stats()["throttled_seconds"] > 0
+
+def test_token_rate_is_limited():
+    """The tokens-per-minute bucket waits for enough tokens to refill"""
+    bucket = TokenBucket(rate_per_minute=6000, capacity=100)  # 100 tokens/s
+    
+    async def run():
+        await bucket.acquire(100)
+        return await bucket.acquire(20)
+    
+    assert asyncio.run(run()) >= 0.15
+
+def test_live_calls_take_slots_before_background_calls():
+    """A freed slot goes to a waiting live call even if a background call queued first"""
+    scheduler = make_scheduler(max_concurrency=1, background_concurrency=1)
+    order = []
+    
+    def record(name, delay=0.0):
+        async def call():
+            order.append(name)
+            await asyncio.sleep(delay)
+            return name
+        return call
+    
+    async def run():
+        holder = asyncio.ensure_future(scheduler.call(record("holder", 0.05)))
+        await asyncio.sleep(0.01)
+        background = asyncio.ensure_future(scheduler.call(record("background"), background=True))
+        await asyncio.sleep(0.01)
+        live = asyncio.ensure_future(scheduler.call(record("live")))
+        return await asyncio.gather(holder, background, live)
+    
+    asyncio.run(run())
+    assert order == ["holder", "live", "background"]
+    assert scheduler.stats()["background_calls"] == 1
+
+def test_is_retryable():
+    """Rate limits, server errors and timeouts are retryable; client errors are not"""
+    class StatusError(Exception):
+        def __init__(self, code):
+            self.code = code
+    
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(502))
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError("bad prompt"))
@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from app.utils.answer_stream import encode_event, stream_answers, stream_format
+
+DELAYS = {"slow question": 0.3, "fast question": 0.0, "medium question": 0.1}
+
+def collect(make_pipeline, fake_llm, fmt="ndjson", **options):
+    pipeline = make_pipeline(llm=fake_llm(delay=DELAYS), packing=False)
+    
+    async def run():
+        events = []
+        async for chunk in stream_answers(pipeline, list(DELAYS), serialize=lambda r: r.to_dict(),
+                                          fmt=fmt, **options):
+            events.append(chunk)
+        return events
+    return asyncio.run(run())
+
+def test_answers_stream_in_completion_order(make_pipeline, fake_llm):
+    """Each answer is sent as soon as it completes, then a summary"""
+    events = [json.loads(line) for line in collect(make_pipeline, fake_llm)]
+    
+    assert [event["event"] for event in events] == ["answer", "answer", "answer", "summary"]
+    assert [event["question"] for event in events[:3]] == ["fast question", "medium question", "slow question"]
+    assert [event["index"] for event in events[:3]] == [1, 2, 0]
+    assert events[0]["served_by"] == "llm"
+    
+    summary = events[-1]
+    assert summary["total_questions"] == 3
+    assert summary["answered"] == 3
+    assert summary["time_to_first_answer"] < 0.2 <= summary["processing_time"]
+
+def test_summary_includes_extra_fields(make_pipeline, fake_llm):
+    events = [json.loads(line) for line in collect(make_pipeline, fake_llm, summarize=lambda results: {"metadata": {"answers": len(results)}})]
+    assert events[-1]["metadata"] == {"answers": 3}
+
+def test_streams_tokens_before_answers(make_pipeline, fake_llm):
+    """With stream_tokens, answer text arrives as token events ahead of each answer"""
+    events = [json.loads(line) for line in collect(make_pipeline, fake_llm, stream_tokens=True)]
+    fast_tokens = [e["text"] for e in events if e["event"] == "token" and e["index"] == 1]
+    first_answer = next(i for i, e in enumerate(events) if e["event"] == "answer")
+    
+    assert "".join(fast_tokens).strip() == "Answer to fast question."
+    assert events[first_answer - 1]["event"] == "token"
+
+def test_sse_format(make_pipeline, fake_llm):
+    chunks = collect(make_pipeline, fake_llm, fmt="sse")
+    assert chunks[0].startswith("event: answer\ndata: {")
+    assert chunks[-1].startswith("event: summary\n")
+    assert all(chunk.endswith("\n\n") for chunk in chunks)
+
+def test_stream_format_negotiation():
+    assert stream_format({"format": "ndjson"}, {}) == "ndjson"
+    assert stream_format({}, {"accept": "application/x-ndjson"}) == "ndjson"
+    assert stream_format({}, {"accept": "text/event-stream"}) == "sse"
+    assert encode_event("summary", {"answered": 1}, "ndjson") == '{"event": "summary", "answered": 1}\n'
@@ -13,6 +13,15 @@ def test_health_check():
     assert "status" in data
     assert data["status"] == "healthy"
 
+def test_liveness_and_readiness():
+    """Liveness answers at once; readiness once the startup warm-up has run"""
+    from main import warmup
+    assert client.get("/health/live").status_code == 200
+    warmup.run()
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["warmup"]["steps"]["retrieval"]["state"] == "done"
+
 def test_root_endpoint():
     """Test the root endpoint"""
     response = client.get("/")
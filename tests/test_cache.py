@@ -0,0 +1,80 @@
+import time
+
+from app.services.retrieval_cache import RetrievalCache
+from app.utils.cache import LRUCache
+from app.utils.question_sets import load_question_set, STANDARD_INSURANCE_QUESTIONS
+from app.utils.text_processing import normalize_question
+
+def test_lru_cache_evicts_least_recently_used():
+    """The least recently used entry is evicted when the cache is full"""
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_lru_cache_ttl_expiry():
+    """Entries expire after their TTL"""
+    cache = LRUCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+def test_lru_cache_hit_rate():
+    """Hits and misses are counted"""
+    cache = LRUCache(maxsize=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+def test_normalize_question():
+    """Case, whitespace and trailing punctuation do not change the key"""
+    assert normalize_question("  What is the  Room Rent limit? ") == "what is the room rent limit"
+    assert normalize_question("what is the room rent limit") == "what is the room rent limit"
+
+def test_load_question_set(tmp_path):
+    """Question sets resolve from the built-in name or a file"""
+    assert load_question_set("") == []
+    assert load_question_set("standard") == STANDARD_INSURANCE_QUESTIONS
+    
+    path = tmp_path / "questions.txt"
+    path.write_text("What is the sum insured?\n\nIs there a grace period?\n")
+    assert load_question_set(str(path)) == ["What is the sum insured?", "Is there a grace period?"]
+
+def test_retrieval_cache_keyed_by_fingerprint():
+    """Results are shared across phrasings but not across index fingerprints"""
+    cache = RetrievalCache(maxsize=10, ttl=0)
+    results = [{"text": "Grace period of 30 days", "score": 0.9, "index": 3}]
+    cache.set("fp1", "Is there a grace period?", 5, "tfidf", results)
+    
+    assert cache.get("fp1", "is there a grace period", 5, "tfidf") == results
+    assert cache.get("fp2", "is there a grace period", 5, "tfidf") is None
+    assert cache.get("fp1", "is there a grace period", 3, "tfidf") is None
+    assert cache.get("fp1", "is there a grace period", 5, "basic") is None
+
+def test_retrieval_cache_invalidate():
+    """Invalidating a fingerprint drops only its entries"""
+    cache = RetrievalCache(maxsize=10, ttl=0)
+    cache.set("fp1", "q1", 5, "tfidf", [])
+    cache.set("fp1", "q2", 5, "tfidf", [])
+    cache.set("fp2", "q1", 5, "tfidf", [])
+    
+    assert cache.invalidate("fp1") == 2
+    assert cache.get("fp1", "q1", 5, "tfidf") is None
+    assert cache.get("fp2", "q1", 5, "tfidf") == []
+
+def test_retrieval_cache_returns_copies():
+    """Callers cannot corrupt cached results"""
+    cache = RetrievalCache(maxsize=10, ttl=0)
+    cache.set("fp1", "q1", 5, "tfidf", [{"text": "a", "score": 1.0, "index": 0}])
+    cache.get("fp1", "q1", 5, "tfidf")[0]["text"] = "changed"
+    assert cache.get("fp1", "q1", 5, "tfidf")[0]["text"] == "a"
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.answer_scheduler import AnswerScheduler
+from app.services.call_guard import CallGuard, CircuitBreaker, CircuitOpenError, DeadlineExceededError
+from app.services.gemini_client import GeminiAPIError
+
+def make_guard(**kwargs):
+    options = dict(deadline=2.0, hedging=True, hedge_quantile=0.95, hedge_min_samples=5,
+                   hedge_min_delay=0.01, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.2))
+    options.update(kwargs)
+    return CallGuard(**options)
+
+def warm_up(guard, seconds=0.02, samples=10):
+    for _ in range(samples):
+        guard.latency.record(seconds)
+
+def test_slow_call_is_hedged_and_loser_cancelled():
+    """A call slower than the p95 gets a duplicate; the fast duplicate wins and the slow one is cancelled"""
+    guard = make_guard()
+    warm_up(guard)
+    attempts = []
+    cancelled = []
+    
+    async def call():
+        attempt = len(attempts)
+        attempts.append(attempt)
+        try:
+            await asyncio.sleep(1.0 if attempt == 0 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        return f"answer {attempt}"
+    
+    async def run():
+        started = time.perf_counter()
+        result = await guard.call(call)
+        await asyncio.sleep(0)
+        return result, time.perf_counter() - started
+    
+    result, elapsed = asyncio.run(run())
+    assert result == "answer 1"
+    assert elapsed < 0.5
+    assert cancelled == [0]
+    stats = guard.stats()
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+def test_no_hedge_without_latency_history_or_for_streams():
+    guard = make_guard()
+    calls = []
+    
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "ok"
+    
+    assert asyncio.run(guard.call(call)) == "ok"
+    warm_up(guard, seconds=0.001)
+    assert asyncio.run(guard.call(call, hedge=False)) == "ok"
+    assert len(calls) == 2
+    assert guard.stats()["hedged"] == 0
+
+def test_hedges_are_charged_to_the_rate_limiter():
+    """A hedge is only sent when the scheduler's request budget has room for it"""
+    async def call():
+        await asyncio.sleep(0.05)
+        return "ok"
+    
+    def run(requests_per_minute):
+        scheduler = AnswerScheduler(max_concurrency=2, requests_per_minute=requests_per_minute, tokens_per_minute=0)
+        guard = make_guard(hedge_budget=scheduler.charge_duplicate)
+        warm_up(guard, seconds=0.001)
+        assert asyncio.run(scheduler.call(lambda: guard.call(call), tokens=100)) == "ok"
+        return guard.stats(), scheduler.stats()
+    
+    guard_stats, scheduler_stats = run(requests_per_minute=2)
+    assert guard_stats["hedged"] == 1 and scheduler_stats["duplicate_calls"] == 1
+    # The primary call took the only request in the budget
+    guard_stats, scheduler_stats = run(requests_per_minute=1)
+    assert guard_stats["hedged"] == 0 and guard_stats["hedges_skipped"] == 1
+    assert scheduler_stats["duplicates_refused"] == 1
+
+def test_failed_primary_falls_back_to_hedge():
+    """If the primary fails after the hedge started, the hedge's answer is still used"""
+    guard = make_guard()
+    warm_up(guard)
+    attempts = []
+    
+    async def call():
+        attempt = len(attempts)
+        attempts.append(attempt)
+        if attempt == 0:
+            await asyncio.sleep(0.1)
+            raise GeminiAPIError("server error", status_code=503)
+        await asyncio.sleep(0.2)
+        return "hedged answer"
+    
+    assert asyncio.run(guard.call(call)) == "hedged answer"
+
+def test_deadline_exceeded():
+    guard = make_guard(deadline=0.05, hedging=False)
+    
+    async def call():
+        await asyncio.sleep(1.0)
+    
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(guard.call(call))
+    assert guard.stats()["deadline_exceeded"] == 1
+
+def test_circuit_opens_fails_fast_and_recovers():
+    guard = make_guard(hedging=False)
+    healthy = False
+    calls = []
+    
+    async def call():
+        calls.append(1)
+        if not healthy:
+            raise GeminiAPIError("unavailable", status_code=503)
+        return "ok"
+    
+    async def attempt():
+        try:
+            return await guard.call(call)
+        except Exception as e:
+            return e
+    
+    for _ in range(3):
+        assert isinstance(asyncio.run(attempt()), GeminiAPIError)
+    assert guard.breaker.state == "open"
+    
+    # Open: fails without calling the provider
+    error = asyncio.run(attempt())
+    assert isinstance(error, CircuitOpenError)
+    assert error.retry_after > 0
+    assert len(calls) == 3
+    
+    # After the reset timeout a probe goes through and closes the circuit
+    time.sleep(0.25)
+    healthy = True
+    assert asyncio.run(attempt()) == "ok"
+    stats = guard.stats()
+    assert stats["circuit"]["state"] == "closed"
+    assert stats["circuit"]["opened"] == 1
+    assert stats["circuit"]["short_circuited"] == 1
+
+def test_failed_probe_reopens_circuit_and_client_errors_do_not_trip():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure(GeminiAPIError("bad request", status_code=400))
+    breaker.record_failure(GeminiAPIError("bad request", status_code=400))
+    assert breaker.state == "closed"
+    
+    breaker.record_failure(TimeoutError())
+    breaker.record_failure(TimeoutError())
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_failure(TimeoutError())
+    assert breaker.state == "open"
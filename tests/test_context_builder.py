@@ -0,0 +1,52 @@
+from app.services.context_builder import ContextBuilder, merge_spans, overlap_length
+
+WINDOW_A = "Section 4.2: The grace period for premium payment is thirty days from the due date."
+WINDOW_B = "thirty days from the due date. Coverage continues during the grace period without a break."
+
+def chunk(text, score=1.0):
+    return {"text": text, "score": score, "index": None}
+
+def test_overlap_length():
+    assert overlap_length(WINDOW_A, WINDOW_B, 10) == len("thirty days from the due date.")
+    assert overlap_length(WINDOW_B, WINDOW_A, 10) == 0
+    assert overlap_length("abcdef", "defxyz", 4) == 0
+
+def test_merges_contained_and_overlapping_chunks():
+    """Sliding-window edges are joined and contained clauses are absorbed"""
+    clause = "The grace period for premium payment is thirty days"
+    spans = merge_spans([WINDOW_A, clause, WINDOW_B, "Cataract is covered after two years."], 10)
+    
+    assert [text for text, _ in spans] == [
+        WINDOW_A + WINDOW_B[len("thirty days from the due date."):],
+        "Cataract is covered after two years."
+    ]
+    assert [members for _, members in spans] == [[0, 1, 2], [3]]
+
+def test_drops_chunks_below_relative_score():
+    builder = ContextBuilder(token_budget=0, min_relative_score=0.5, min_overlap=10)
+    built = builder.build([chunk("Relevant clause.", 0.8), chunk("Barely related clause.", 0.2)])
+    assert built["text"] == "Relevant clause."
+    assert built["chunks"] == ["Relevant clause."]
+
+def test_packs_spans_within_token_budget():
+    """Spans that do not fit are skipped; the context never exceeds the budget"""
+    long_text = "Exclusions apply to cosmetic surgery. " * 20
+    builder = ContextBuilder(token_budget=60, min_relative_score=0, min_overlap=10)
+    built = builder.build([chunk(WINDOW_A), chunk(long_text), chunk(WINDOW_B)])
+    
+    assert long_text.strip() not in built["text"]
+    assert WINDOW_A in built["text"]
+    assert built["tokens"] <= 60
+    assert built["raw_tokens"] > built["tokens"]
+
+def test_truncates_single_oversized_chunk():
+    """The most relevant chunk is kept even when it alone exceeds the budget"""
+    builder = ContextBuilder(token_budget=10, min_relative_score=0, min_overlap=10)
+    built = builder.build([chunk("x" * 400)])
+    assert built["text"]
+    assert built["tokens"] <= 10
+
+def test_no_budget_keeps_everything():
+    builder = ContextBuilder(token_budget=0, min_relative_score=0, min_overlap=10)
+    built = builder.build([chunk("First clause."), chunk("Second clause.")])
+    assert built["text"] == "First clause.\n\nSecond clause."
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.document_sessions import DocumentSessionStore, UnknownDocumentError
+from app.services.llm_service import SimpleAnswerResult
+from app.services.qa_pipeline import QAPipeline
+from app.services.retriever_router import RetrieverRouter
+
+POLICY_A = [
+    "The grace period for premium payment is thirty days from the due date.",
+    "Cataract treatment is covered up to Rs. 40,000 per eye.",
+    "Ambulance charges are covered up to Rs. 2,000 per hospitalisation.",
+]
+POLICY_B = [
+    "Travel insurance covers lost baggage up to USD 500.",
+    "Trip cancellation is covered for medical emergencies.",
+]
+
+def make_store(**kwargs):
+    return DocumentSessionStore(RetrieverRouter(backend="basic"), **kwargs)
+
+def test_register_once_and_reuse():
+    store = make_store(ttl=60, max_bytes=10 ** 9)
+    session, created = store.register(POLICY_A)
+    again, created_again = store.register(list(POLICY_A))
+    assert created and not created_again
+    assert again is session
+    assert store.router.active is None  # The shared router's own index is left alone
+    
+    results = store.retriever([session.document_id]).search("cataract treatment", top_k=1)
+    assert results[0]["text"] == POLICY_A[1]
+    assert store.stats()["registered"] == 1 and store.stats()["reused"] == 1
+
+def test_sessions_expire_after_ttl():
+    store = make_store(ttl=0.05, max_bytes=10 ** 9)
+    session, _ = store.register(POLICY_A)
+    time.sleep(0.1)
+    with pytest.raises(UnknownDocumentError) as error:
+        store.retriever([session.document_id, "missing"])
+    assert error.value.document_ids == [session.document_id, "missing"]
+    assert store.stats()["expired"] == 1
+
+def test_least_recently_used_session_evicted_over_budget():
+    probe = make_store(ttl=0, max_bytes=10 ** 9)
+    a, _ = probe.register(POLICY_A)
+    b, _ = probe.register(POLICY_B)
+    
+    store = make_store(ttl=0, max_bytes=a.size + b.size)
+    a, _ = store.register(POLICY_A)
+    b, _ = store.register(POLICY_B)
+    store.get(a.document_id)
+    c, _ = store.register(["Home nursing is not covered under this policy."])
+    assert set(store.sessions) == {a.document_id, c.document_id}
+    assert store.stats()["evicted"] == 1
+
+def test_questions_across_registered_documents():
+    class FakeLLM:
+        model_name = "fake"
+        prompt_version = "v1"
+        max_tokens = 0
+        
+        async def generate_answer(self, question, context, raise_on_error=False):
+            return SimpleAnswerResult(answer=context, confidence=0.8, question=question)
+    
+    store = make_store(ttl=60, max_bytes=10 ** 9)
+    a, _ = store.register(POLICY_A)
+    b, _ = store.register(POLICY_B)
+    pipeline = QAPipeline(store.router, lambda: FakeLLM(), top_k=2)
+    
+    retriever = store.retriever([a.document_id, b.document_id])
+    results = asyncio.run(pipeline.for_retriever(retriever).answer_questions(
+        ["Is cataract treatment covered?", "Is lost baggage covered?"]
+    ))
+    assert "Cataract" in results[0].answer
+    assert "baggage" in results[1].answer
+    assert pipeline.retriever is store.router
+
+def test_spawned_vector_search_shares_empty_query_cache():
+    pytest.importorskip("sentence_transformers")
+    from app.services.vector_search import VectorSearchService
+    
+    parent = VectorSearchService("model", model=object())
+    assert len(parent.query_cache) == 0
+    child = parent.spawn()
+    assert child.query_cache is parent.query_cache
@@ -0,0 +1,100 @@
+import asyncio
+
+from app.services.extractive_answerer import (
+    ExtractiveAnswerer, classify_question, extract_facts, normalize_value
+)
+
+ROOM_RENT = ("Room Rent, Boarding, Nursing Expenses all inclusive as provided by the Hospital/ Nursing Home "
+             "up to 2% of the Sum Insured subject to maximum of Rs. 5,000/- per day.")
+ICU = ("Intensive Care Unit (ICU) charges all-inclusive as provided by the Hospital up to 5 % of th e sum insured "
+       "subject to maximum of Rs. 10 ,000/- per day.")
+GRACE = "The Grace Period for payment of the premium shall be thirty days."
+PED = ("Expenses related to the treatment of a Pre -Existing Disease (PED) shall be excluded until the expiry "
+       "of 36 (thirty six) months of continuous coverage.")
+INITIAL = ("Expenses related to the treatment of any illness within 30 days from the first policy commencement "
+           "date shall be excluded except claims arising due to an accident. First 30 days waiting period (Excl 03)")
+EXCLUSIONS = "Cosmetic or plastic surgery is excluded unless required for reconstruction following an accident."
+
+def ranked(*texts):
+    return [{"text": text, "score": 1.0 - 0.1 * rank} for rank, text in enumerate(texts)]
+
+def test_extracts_values_despite_pdf_spacing():
+    facts = {fact["kind"]: fact["value"] for fact in extract_facts(" ".join([ROOM_RENT, ICU, GRACE, PED]))}
+    assert facts["room_rent_limit"] == "2% of the Sum Insured subject to maximum of Rs. 5,000/- per day"
+    assert facts["icu_room_rent_limit"] == "5 % of th e sum insured subject to maximum of Rs. 10 ,000/- per day"
+    assert facts["grace_period"] == "thirty days"
+    assert facts["pre_existing_waiting_period"] == "36 (thirty six) months"
+
+def test_classifies_specific_facts_first():
+    assert classify_question("What is the ICU room rent limit?")["kind"] == "icu_room_rent_limit"
+    assert classify_question("What is the room rent limit?")["kind"] == "room_rent_limit"
+    assert classify_question("What is the waiting period for pre-existing diseases?")["kind"] == \
+        "pre_existing_waiting_period"
+    assert classify_question("What are the general exclusions in this policy?") is None
+
+def test_initial_waiting_period_only_answers_generic_questions():
+    answerer = ExtractiveAnswerer(min_confidence=0.8)
+    for question in ("What is the waiting period?", "What is the waiting period for coverage?",
+                     "Is there an initial waiting period for new policies?"):
+        assert answerer.answer(question, ranked(INITIAL))["kind"] == "initial_waiting_period", question
+    # A specific waiting period, or an exception to the initial one, is left to the LLM
+    for question in ("What is the waiting period for hernia surgery?",
+                     "What is the waiting period for joint replacement surgery?",
+                     "What is the waiting period for modern treatments?",
+                     "What is the waiting period for accidents?",
+                     "How long is the cataract waiting period?"):
+        assert classify_question(question) is None, question
+        assert answerer.answer(question, ranked(INITIAL)) is None, question
+
+def test_normalized_values_compare_across_spellings():
+    assert normalize_value("thirty days") == normalize_value("30 days")
+    assert normalize_value("3 years") == normalize_value("36 (thirty six) months")
+    assert normalize_value("Rs. 10 ,000/- per day") == normalize_value("Rs. 10,000")
+
+def test_answers_from_top_clause_and_falls_back_otherwise():
+    answerer = ExtractiveAnswerer(min_confidence=0.8)
+    answerer.index([ROOM_RENT, GRACE, EXCLUSIONS])
+    
+    answer = answerer.answer("Is there a grace period for premium payment?", ranked(GRACE, EXCLUSIONS))
+    assert answer["value"] == "thirty days"
+    assert answer["confidence"] >= 0.8
+    assert GRACE in answer["answer"]
+    
+    # Not a single-value question, or the value is not in the retrieved clauses
+    assert answerer.answer("What are the general exclusions in this policy?", ranked(EXCLUSIONS)) is None
+    assert answerer.answer("What is the room rent limit?", ranked(EXCLUSIONS, GRACE)) is None
+    # Stated only in a low-ranked clause
+    assert answerer.answer("What is the room rent limit?", ranked(EXCLUSIONS, GRACE, PED, ROOM_RENT)) is None
+
+def test_conflicting_values_defer_to_llm():
+    other = "The grace period of fifteen days is available for monthly instalments."
+    answerer = ExtractiveAnswerer(min_confidence=0.8)
+    assert answerer.answer("Is there a grace period for premium payment?", ranked(GRACE, other)) is None
+    agreeing = "A grace period of 30 days is allowed for renewal."
+    assert answerer.answer("Is there a grace period for premium payment?", ranked(GRACE, agreeing))["confidence"] > 0.9
+
+def test_pipeline_bypasses_llm_for_extracted_answers(make_pipeline):
+    results = {
+        "Is there a grace period for premium payment?": ranked(GRACE, EXCLUSIONS),
+        "What are the general exclusions in this policy?": ranked(EXCLUSIONS, GRACE),
+    }
+    pipeline = make_pipeline(results, extractor=ExtractiveAnswerer(min_confidence=0.8))
+    calls = pipeline.get_llm().calls
+    pipeline.index_facts([GRACE, EXCLUSIONS])
+    
+    results = asyncio.run(pipeline.answer_questions(list(results)))
+    assert [result.served_by for result in results] == ["extractive", "llm"]
+    assert calls == ["What are the general exclusions in this policy?"]
+    assert results[0].prompt_tokens["after"] == 0
+    
+    report = pipeline.extractive_report(results, llm_latency=1.5)
+    assert report["answered"] == 1
+    assert report["bypass_rate"] == 0.5
+    assert report["estimated_seconds_saved"] == 1.5
+    
+    # A cache bypass asks for a fresh LLM answer, and pre-answering does not count as traffic
+    fresh = asyncio.run(pipeline.answer_questions(["Is there a grace period for premium payment?"], use_cache=False))
+    assert fresh[0].served_by == "llm"
+    stats = dict(pipeline.extractive_stats)
+    asyncio.run(pipeline.precompute(["Is there a grace period for premium payment?"], "doc"))
+    assert pipeline.extractive_stats == stats
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services.answer_scheduler import is_retryable
+from app.services.gemini_client import GeminiAPIError, GeminiRestClient, GeminiTimeoutError
+
+def reply(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+def make_client(handler, **options):
+    options.setdefault("timeout", 5)
+    return GeminiRestClient("test-key", "models/gemini-1.5-flash", base_url="https://gemini.test/v1beta",
+                            transport=httpx.MockTransport(handler), **options)
+
+def test_generate_posts_prompt_and_returns_text():
+    """The prompt and generation config are sent to generateContent with the API key header"""
+    seen = {}
+    
+    def handler(request):
+        seen["url"] = str(request.url)
+        seen["key"] = request.headers["x-goog-api-key"]
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json=reply("Thirty days."))
+    
+    client = make_client(handler)
+    text = asyncio.run(client.generate("What is the grace period?", {"maxOutputTokens": 500}))
+    
+    assert text == "Thirty days."
+    assert seen["url"] == "https://gemini.test/v1beta/models/gemini-1.5-flash:generateContent"
+    assert seen["key"] == "test-key"
+    assert seen["body"]["contents"][0]["parts"][0]["text"] == "What is the grace period?"
+    assert seen["body"]["generationConfig"] == {"maxOutputTokens": 500}
+
+def test_client_of_a_previous_event_loop_is_closed():
+    client = make_client(lambda request: httpx.Response(200, json=reply("ok")))
+    asyncio.run(client.generate("first"))
+    first = client._client
+    
+    async def second_loop():
+        await client.generate("second")
+        await client.aclose()
+    
+    asyncio.run(second_loop())
+    assert client._client is None
+    assert first.is_closed
+
+def test_rate_limit_error_is_retryable():
+    """429 responses carry the status and Retry-After hint the scheduler uses"""
+    def handler(request):
+        return httpx.Response(429, headers={"Retry-After": "2"}, json={"error": {"message": "Quota exceeded"}})
+    
+    with pytest.raises(GeminiAPIError) as info:
+        asyncio.run(make_client(handler).generate("prompt"))
+    assert info.value.status_code == 429
+    assert info.value.retry_after == 2.0
+    assert "Quota exceeded" in str(info.value)
+    assert is_retryable(info.value)
+
+def test_client_error_is_not_retryable():
+    def handler(request):
+        return httpx.Response(400, json={"error": {"message": "Invalid argument"}})
+    
+    with pytest.raises(GeminiAPIError) as info:
+        asyncio.run(make_client(handler).generate("prompt"))
+    assert not is_retryable(info.value)
+
+def test_blocked_prompt_raises():
+    def handler(request):
+        return httpx.Response(200, json={"promptFeedback": {"blockReason": "SAFETY"}})
+    
+    with pytest.raises(GeminiAPIError, match="SAFETY"):
+        asyncio.run(make_client(handler).generate("prompt"))
+
+def test_timeout_is_retryable():
+    def handler(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+    
+    with pytest.raises(GeminiTimeoutError) as info:
+        asyncio.run(make_client(handler).generate("prompt"))
+    assert is_retryable(info.value)
+
+def test_concurrency_is_limited():
+    """No more than max_concurrency calls are in flight"""
+    state = {"active": 0, "max_active": 0}
+    
+    async def handler(request):
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        await asyncio.sleep(0.02)
+        state["active"] -= 1
+        return httpx.Response(200, json=reply("ok"))
+    
+    client = make_client(handler, max_concurrency=3)
+    
+    async def run():
+        results = await asyncio.gather(*(client.generate(f"prompt {i}") for i in range(10)))
+        await client.aclose()
+        return results
+    
+    assert asyncio.run(run()) == ["ok"] * 10
+    assert state["max_active"] == 3
+
+def test_stream_generate_yields_text_deltas():
+    """streamGenerateContent server-sent events are yielded as text pieces"""
+    def handler(request):
+        assert request.url.path.endswith(":streamGenerateContent")
+        assert request.url.params["alt"] == "sse"
+        body = "".join(f"data: {json.dumps(reply(text))}\r\n\r\n" for text in ("Thirty ", "days."))
+        return httpx.Response(200, content=body.encode(), headers={"Content-Type": "text/event-stream"})
+    
+    client = make_client(handler)
+    
+    async def run():
+        return [piece async for piece in client.stream_generate("What is the grace period?")]
+    
+    assert asyncio.run(run()) == ["Thirty ", "days."]
@@ -0,0 +1,87 @@
+import pytest
+
+from app.services.basic_text_search import BasicTextSearch
+from app.services.chunk_registry import ChunkRegistry
+
+POLICY_A = [
+    "The waiting period for pre-existing diseases is 48 months.",
+    "Room rent is limited to 2% of the sum insured per day.",
+    "Ambulance charges are covered up to Rs 2000 per hospitalization.",
+    "Cataract treatment is covered up to 25% of the sum insured.",
+]
+POLICY_B = [
+    "A grace period of 30 days is allowed for premium payment.",
+]
+
+def test_registry_tombstones_until_compaction():
+    """Removed chunks are tombstoned and purged only when compaction is due"""
+    registry = ChunkRegistry(compaction_ratio=0.5)
+    registry.add("a", POLICY_A)
+    b_ids = registry.add("b", POLICY_B)
+    
+    assert registry.remove("b") == b_ids
+    assert not registry.is_live(b_ids[0])
+    assert not registry.needs_compaction()
+    assert registry.num_live == len(POLICY_A)
+    
+    assert registry.purge() == b_ids
+    assert b_ids[0] not in registry.texts
+
+def test_registry_rejects_duplicate_document():
+    """Adding a registered document id is an error"""
+    registry = ChunkRegistry()
+    registry.add("a", POLICY_A)
+    with pytest.raises(ValueError):
+        registry.add("a", POLICY_A)
+
+def test_basic_search_add_and_remove_document():
+    """Documents can be added and removed without rebuilding the index"""
+    search = BasicTextSearch()
+    search.create_index(POLICY_A)
+    search.add_documents({"b": POLICY_B})
+    
+    results = search.search("grace period premium", top_k=1)
+    assert results[0]["text"] == POLICY_B[0]
+    
+    assert search.remove_document("b")
+    results = search.search("grace period premium", top_k=5)
+    assert all(r["text"] != POLICY_B[0] for r in results)
+    assert not search.remove_document("b")
+
+def test_basic_search_replaces_existing_document():
+    """Re-adding a document id replaces its chunks"""
+    search = BasicTextSearch()
+    search.add_documents({"b": POLICY_B})
+    search.add_documents({"b": ["A grace period of 15 days applies to monthly premiums."]})
+    
+    assert search.get_stats()["num_chunks"] == 1
+    assert "15 days" in search.search("grace period", top_k=1)[0]["text"]
+
+def test_idf_statistics_merge_workers_saves(tmp_path):
+    """Workers sharing the IDF file add to each other's counts, counting each corpus once"""
+    pytest.importorskip("sklearn")
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from app.services.lightweight_vector_search import HASHING_N_FEATURES, IdfStatistics
+    
+    vectorizer = HashingVectorizer(n_features=HASHING_N_FEATURES, alternate_sign=False, norm=None)
+    path = str(tmp_path / "idf.npz")
+    first = IdfStatistics(path, save_delay=60)
+    second = IdfStatistics(path, save_delay=60)
+    
+    assert first.update(vectorizer.transform(POLICY_A), "a")
+    assert second.update(vectorizer.transform(POLICY_B), "b")
+    assert second.update(vectorizer.transform(POLICY_A), "a")
+    first.save()
+    second.save()
+    
+    merged = IdfStatistics(path)
+    assert merged.seen_corpora == {"a", "b"}
+    assert merged.n_docs == len(POLICY_A) + len(POLICY_B)
+    assert second.n_docs == merged.n_docs
+    assert (second.doc_freq == merged.doc_freq).all()
+    
+    first.save_delay = 0.01
+    assert first.update(vectorizer.transform(["Maternity expenses are covered."]), "c")
+    first.schedule_save()
+    first._timer.join(5)
+    assert "c" in IdfStatistics(path).seen_corpora
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.services.job_queue import (
+    FAILED, QUEUED, RUNNING, SUCCEEDED, IdempotencyConflictError, JobQueue, JobStore, job_status
+)
+
+REQUEST = {"documents": [{"type": "text", "content": "policy"}], "questions": ["q1", "q2", "q3"]}
+
+def test_idempotency_key_returns_existing_job(tmp_path):
+    store = JobStore(path=str(tmp_path / "jobs.sqlite3"))
+    job, created = store.create(REQUEST, idempotency_key="retry-1")
+    assert created and job["status"] == QUEUED
+    
+    again, created = store.create(dict(REQUEST), idempotency_key="retry-1")
+    assert not created
+    assert again["id"] == job["id"]
+    assert store.create(REQUEST)[0]["id"] != job["id"]
+    
+    with pytest.raises(IdempotencyConflictError):
+        store.create({**REQUEST, "questions": ["other"]}, idempotency_key="retry-1")
+
+def test_partial_answers_visible_while_running(tmp_path):
+    store = JobStore(path=str(tmp_path / "jobs.sqlite3"))
+    release = asyncio.Event()
+    calls = []
+    
+    async def handler(request, options, on_answer):
+        calls.append(options)
+        on_answer(1, {"answer": "a2"})
+        await release.wait()
+        on_answer(0, {"answer": "a1"})
+        on_answer(2, {"answer": "a3"})
+        return {"answers": ["a1", "a2", "a3"]}
+    
+    async def run():
+        queue = JobQueue(store, handler, workers=2)
+        job, _ = await queue.submit(REQUEST, idempotency_key="k", options={"use_cache": False})
+        await asyncio.sleep(0.05)
+        partial = job_status(store.get(job["id"]))
+        
+        # A retry while the job runs gets the running job back instead of new work
+        retried, created = await queue.submit(REQUEST, idempotency_key="k")
+        release.set()
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return job["id"], partial, retried, created, queue.stats()
+    
+    job_id, partial, retried, created, stats = asyncio.run(run())
+    assert partial["status"] == RUNNING
+    assert partial["answered"] == 1
+    assert partial["answers"] == [{"index": 1, "answer": "a2"}]
+    assert retried["id"] == job_id and not created
+    assert calls == [{"use_cache": False}]
+    
+    final = job_status(store.get(job_id))
+    assert final["status"] == SUCCEEDED
+    assert final["result"] == {"answers": ["a1", "a2", "a3"]}
+    assert stats["succeeded"] == 1 and stats["deduplicated"] == 1
+
+def test_job_running_in_another_live_process_is_not_claimed(tmp_path):
+    store = JobStore(path=str(tmp_path / "jobs.sqlite3"))
+    job, _ = store.create(REQUEST)
+    assert store.claim(job["id"])["attempts"] == 1
+    
+    # Every worker process requeues unfinished jobs on start; a live owner keeps its job
+    store._conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (os.getppid(), job["id"]))
+    assert store.claim(job["id"]) is None
+    
+    # A job whose owner has exited is taken over
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    store._conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (finished.pid, job["id"]))
+    claimed = store.claim(job["id"])
+    assert claimed["attempts"] == 2 and claimed["status"] == RUNNING
+    
+    store.finish(job["id"], {"done": True})
+    assert store.claim(job["id"]) is None
+
+def test_unfinished_jobs_resume_after_restart(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    
+    async def never_finishes(request, options, on_answer):
+        on_answer(0, {"answer": "a1"})
+        await asyncio.sleep(10)
+    
+    async def first_process():
+        queue = JobQueue(JobStore(path=path), never_finishes)
+        job, _ = await queue.submit(REQUEST)
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return job["id"]
+    
+    job_id = asyncio.run(first_process())
+    assert JobStore(path=path).get(job_id)["status"] == RUNNING
+    
+    async def handler(request, options, on_answer):
+        for position, question in enumerate(request["questions"]):
+            on_answer(position, {"answer": question})
+        return {"done": True}
+    
+    async def second_process():
+        queue = JobQueue(JobStore(path=path), handler)
+        await queue.start()
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return queue.stats()
+    
+    stats = asyncio.run(second_process())
+    job = JobStore(path=path).get(job_id)
+    assert stats["resumed"] == 1
+    assert job["status"] == SUCCEEDED and job["attempts"] == 2
+    assert job["result"] == {"done": True}
+
+def test_failed_job_keeps_error_and_answers(tmp_path):
+    store = JobStore(path=str(tmp_path / "jobs.sqlite3"))
+    
+    async def handler(request, options, on_answer):
+        on_answer(0, {"answer": "a1"})
+        raise RuntimeError("document download failed")
+    
+    async def run():
+        queue = JobQueue(store, handler)
+        job, _ = await queue.submit(REQUEST)
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return job["id"]
+    
+    status = job_status(store.get(asyncio.run(run())))
+    assert status["status"] == FAILED
+    assert status["error"] == "document download failed"
+    assert status["answered"] == 1
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sklearn")
+
+from app.services.lightweight_vector_search import LightweightVectorSearch
+from app.services.retriever_router import RetrieverRouter
+
+POLICY = [
+    "The grace period for premium payment is thirty days from the due date.",
+    "Pre-existing diseases are covered after thirty six months of continuous coverage.",
+    "Cataract surgery is covered after a waiting period of two years.",
+    "Room rent is limited to two percent of the sum insured per day.",
+    "Intensive care unit charges are limited to five percent of the sum insured per day.",
+    "Ambulance charges are covered up to two thousand rupees per hospitalisation.",
+    "Maternity expenses are covered after a waiting period of two years.",
+    "Organ donor expenses are covered for the harvesting of the organ.",
+    "A no claim discount of five percent is given on the base premium at renewal.",
+    "Preventive health check-ups are reimbursed at the end of every block of two policy years.",
+    "AYUSH treatment is covered up to the sum insured in an AYUSH hospital.",
+    "Home nursing is not covered under this policy.",
+]
+QUESTIONS = [
+    "What is the grace period for premium payment?",
+    "What is the waiting period for cataract surgery?",
+    "Are maternity expenses covered?",
+    "Is there a limit on room rent and ICU charges?",
+    "Does the policy cover organ donor expenses?",
+    "Is home nursing covered?",
+]
+
+def test_hashing_batch_search_matches_single_queries(tmp_path):
+    """One batched sparse product ranks each question's top-k exactly as searching it alone"""
+    search = LightweightVectorSearch(mode="hashing", idf_path=str(tmp_path / "idf.npz"))
+    search.create_index(POLICY)
+    
+    batched = search.search_batch(QUESTIONS, top_k=3)
+    assert len(batched) == len(QUESTIONS)
+    for question, results in zip(QUESTIONS, batched):
+        single = search.search(question, top_k=3)
+        assert [r["index"] for r in results] == [r["index"] for r in single]
+        assert [r["score"] for r in results] == pytest.approx([r["score"] for r in single])
+        assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+    assert batched[0][0]["text"] == POLICY[0]
+
+def test_pipeline_retrieves_a_request_in_one_batch(tmp_path, monkeypatch, make_pipeline):
+    """A request's questions reach the backend as one batch; repeats are served by the retrieval cache"""
+    monkeypatch.setenv("TFIDF_MODE", "hashing")
+    monkeypatch.setenv("TFIDF_IDF_PATH", str(tmp_path / "idf.npz"))
+    monkeypatch.setenv("TFIDF_IDF_SAVE_DELAY", "60")
+    router = RetrieverRouter(backend="tfidf", preload=False)
+    router.create_index(POLICY)
+    engine = router.engine
+    
+    batches = []
+    search_batch = engine.search_batch
+    engine.search_batch = lambda queries, top_k=5: batches.append(list(queries)) or search_batch(queries, top_k)
+    pipeline = make_pipeline(retriever=router, top_k=3)
+    
+    first = asyncio.run(pipeline.answer_questions(QUESTIONS))
+    assert batches == [QUESTIONS]
+    assert first[0].retrieved_chunks[0] == POLICY[0]
+    
+    asyncio.run(pipeline.answer_questions(QUESTIONS[:2] + ["Is ambulance service covered?"]))
+    assert batches[1:] == [["Is ambulance service covered?"]]
+
+def test_spawned_index_shares_idf_statistics_without_reloading(tmp_path, monkeypatch):
+    """Spawning an index neither reads the statistics file again nor registers another exit save"""
+    search = LightweightVectorSearch(mode="hashing", idf_path=str(tmp_path / "idf.npz"))
+    search.create_index(POLICY)
+    search.idf_stats.save()
+    
+    from app.services import lightweight_vector_search
+    monkeypatch.setattr(lightweight_vector_search.IdfStatistics, "_load", lambda self: pytest.fail("reloaded"))
+    registered = []
+    monkeypatch.setattr(lightweight_vector_search.atexit, "register", registered.append)
+    spawned = search.spawn()
+    assert spawned.idf_stats is search.idf_stats
+    assert registered == []
+    
+    spawned.create_index(POLICY[:4])
+    assert spawned.search("grace period for premium payment", top_k=1)[0]["text"] == POLICY[0]
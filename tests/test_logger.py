@@ -0,0 +1,88 @@
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.utils.logger import (
+    ContextFilter, JsonFormatter, bind_request_id, debug_sampled, request_id_var, setup_logger, worker_log_file
+)
+
+def make_record(level=logging.INFO, msg="Indexed %d chunks", args=(12,), **extra):
+    record = logging.LogRecord("app.test", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_module_loggers_share_one_background_writer():
+    first = setup_logger("test_logger.first")
+    second = setup_logger("test_logger.second")
+    assert len(first.handlers) == 1
+    assert first.handlers[0] is second.handlers[0]
+    assert setup_logger("test_logger.first").handlers == first.handlers
+
+def test_json_record_carries_request_id_and_extra_fields():
+    bind_request_id("req-123")
+    record = make_record(chunks=12)
+    assert ContextFilter().filter(record)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Indexed 12 chunks"
+    assert entry["request_id"] == "req-123"
+    assert entry["chunks"] == 12
+    assert entry["level"] == "INFO" and entry["logger"] == "app.test"
+
+def test_request_ids_do_not_leak_between_concurrent_requests():
+    async def handle(request_id):
+        bind_request_id(request_id)
+        await asyncio.sleep(0.01)
+        return request_id_var.get()
+    
+    async def run():
+        return await asyncio.gather(*(asyncio.ensure_future(handle(f"req-{n}")) for n in range(5)))
+    
+    assert asyncio.run(run()) == [f"req-{n}" for n in range(5)]
+    assert len(bind_request_id()) == 32  # Generated when the client sends none
+
+def test_debug_records_sampled_per_request(monkeypatch):
+    logger = setup_logger("test_logger.sampling", level="DEBUG")
+    context_filter = ContextFilter()
+    
+    monkeypatch.setenv("LOG_DEBUG_SAMPLE_RATE", "0")
+    bind_request_id("unsampled")
+    assert not debug_sampled(logger)
+    assert not context_filter.filter(make_record(level=logging.DEBUG))
+    assert context_filter.filter(make_record(level=logging.WARNING))
+    
+    monkeypatch.setenv("LOG_DEBUG_SAMPLE_RATE", "1")
+    bind_request_id("sampled")
+    assert debug_sampled(logger)
+    assert context_filter.filter(make_record(level=logging.DEBUG))
+
+FORK_SCRIPT = """
+import os
+from app.utils.logger import setup_logger, stop_logging
+logger = setup_logger("fork_test")
+logger.info("master")
+pid = os.fork()
+if pid == 0:
+    logger.info("worker")
+    stop_logging()
+    os._exit(0)
+os.waitpid(pid, 0)
+print(pid)
+"""
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_forked_workers_write_their_own_log_file(tmp_path):
+    log_file = tmp_path / "app.log"
+    result = subprocess.run(
+        [sys.executable, "-c", FORK_SCRIPT], env={**os.environ, "LOG_FILE": str(log_file)},
+        capture_output=True, text=True, check=True, cwd=os.getcwd()
+    )
+    pid = int(result.stdout.strip().splitlines()[-1])
+    worker_file = tmp_path / f"app.{pid}.log"
+    assert worker_log_file(str(log_file), pid) == str(worker_file)
+    assert [json.loads(line)["message"] for line in log_file.read_text().splitlines()] == ["master"]
+    assert [json.loads(line)["message"] for line in worker_file.read_text().splitlines()] == ["worker"]
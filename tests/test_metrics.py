@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from app.utils.metrics import (
+    STAGES, Histogram, cache_families, render, stage, stage_breakdown, stage_seconds, start_breakdown, timed
+)
+
+def test_nested_stage_time_counted_once():
+    start_breakdown()
+    with stage("index"):
+        time.sleep(0.02)
+        with stage("embed"):
+            time.sleep(0.05)
+    
+    breakdown = stage_breakdown()
+    assert breakdown["embed"]["ms"] >= 50
+    assert 20 <= breakdown["index"]["ms"] < 50
+    assert breakdown["index"]["count"] == breakdown["embed"]["count"] == 1
+
+def test_breakdowns_kept_per_request():
+    @timed("llm")
+    async def call_llm(delay):
+        await asyncio.sleep(delay)
+    
+    async def handle(calls):
+        start_breakdown()
+        # Concurrent calls of one request all count towards it
+        await asyncio.gather(*(call_llm(0.01) for _ in range(calls)))
+        return stage_breakdown()
+    
+    async def run():
+        return await asyncio.gather(handle(1), handle(3))
+    
+    before = stage_seconds["llm"].count
+    first, second = asyncio.run(run())
+    assert first["llm"]["count"] == 1
+    assert second["llm"]["count"] == 3
+    assert stage_seconds["llm"].count == before + 4
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value)
+    samples = {(name, labels.get("le")): value for name, labels, value in histogram.samples("t", {})}
+    assert samples[("t_bucket", "0.1")] == 1
+    assert samples[("t_bucket", "1.0")] == 3
+    assert samples[("t_bucket", "+Inf")] == 4
+    assert samples[("t_count", None)] == 4
+
+def test_render_exposition_format():
+    families = cache_families({
+        "answer": {"hits": 3, "misses": 1},
+        "semantic": None,
+    })
+    text = render(families)
+    assert "# TYPE qa_stage_seconds histogram" in text
+    assert 'qa_stage_seconds_bucket{stage="llm",le="+Inf"}' in text
+    assert 'qa_cache_hits_total{cache="answer"} 3' in text
+    assert 'qa_cache_hit_ratio{cache="answer"} 0.75' in text
+    assert "semantic" not in text
+    assert text.endswith("\n")
+
+def test_render_aggregates_worker_snapshots(tmp_path, monkeypatch):
+    # A worker that has exited, with one LLM call and some cache hits
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                            capture_output=True, text=True, check=True)
+    histogram = Histogram()
+    histogram.observe(2.0)
+    (tmp_path / f"{exited.stdout.strip()}.json").write_text(json.dumps({
+        "pid": int(exited.stdout),
+        "stages": {name: (histogram if name == "llm" else Histogram()).state() for name in STAGES},
+        "families": [
+            ["qa_cache_hits_total", "counter", "Cache lookups that hit", [[{"cache": "answer"}, 5]]],
+            ["qa_requests_in_flight", "gauge", "HTTP requests being handled", [[{}, 7]]],
+        ],
+    }))
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    
+    before = stage_seconds["llm"].count
+    text = render(cache_families({"answer": {"hits": 3, "misses": 1}}))
+    # Counters and histograms add up across workers, exited ones included
+    assert 'qa_cache_hits_total{cache="answer"} 8' in text
+    assert f'qa_stage_seconds_count{{stage="llm"}} {before + 1}' in text
+    # Gauges are reported per live worker
+    assert f'qa_requests_in_flight{{pid="{os.getpid()}"}}' in text
+    assert f'pid="{exited.stdout.strip()}"' not in text
+    assert (tmp_path / f"{os.getpid()}.json").exists()
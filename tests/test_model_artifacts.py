@@ -0,0 +1,49 @@
+import json
+import struct
+
+import pytest
+
+from app.utils.model_artifacts import MANIFEST_FILE, mmap_safetensors, packaged_model_path, read_safetensors_header
+
+def write_safetensors(path, tensors):
+    """A minimal safetensors file: (name, dtype, shape, raw bytes) entries"""
+    header, data = {"__metadata__": {"format": "pt"}}, b""
+    for name, dtype, shape, raw in tensors:
+        header[name] = {"dtype": dtype, "shape": shape, "data_offsets": [len(data), len(data) + len(raw)]}
+        data += raw
+    encoded = json.dumps(header).encode()
+    # Pad the header so the data starts 8-byte aligned, as the writers do
+    encoded += b" " * (-len(encoded) % 8)
+    path.write_bytes(struct.pack("<Q", len(encoded)) + encoded + data)
+
+def sample_tensors():
+    return [
+        ("weight", "F32", [2, 2], struct.pack("<4f", 1.0, 2.0, 3.0, 4.0)),
+        ("ids", "I64", [3], struct.pack("<3q", 7, 8, 9)),
+    ]
+
+def test_read_safetensors_header(tmp_path):
+    path = tmp_path / "model.safetensors"
+    write_safetensors(path, sample_tensors())
+    data_start, header = read_safetensors_header(str(path))
+    assert set(header) == {"weight", "ids"}
+    assert header["ids"]["data_offsets"] == [16, 40]
+    assert data_start % 8 == 0
+    assert path.read_bytes()[data_start:data_start + 4] == struct.pack("<f", 1.0)
+
+def test_packaged_model_path_matches_model_name(tmp_path):
+    assert packaged_model_path("some/model", str(tmp_path)) is None
+    (tmp_path / MANIFEST_FILE).write_text(json.dumps({"model_name": "some/model"}))
+    assert packaged_model_path("some/model", str(tmp_path)) == str(tmp_path)
+    # An artifact of another model is not used
+    assert packaged_model_path("other/model", str(tmp_path)) is None
+
+def test_mmap_safetensors_views_file(tmp_path):
+    torch = pytest.importorskip("torch")
+    path = tmp_path / "model.safetensors"
+    write_safetensors(path, sample_tensors())
+    tensors = mmap_safetensors(str(path))
+    assert torch.equal(tensors["weight"], torch.tensor([[1.0, 2.0], [3.0, 4.0]]))
+    assert torch.equal(tensors["ids"], torch.tensor([7, 8, 9]))
+    # Both tensors are views into one mapping of the file
+    assert tensors["weight"].untyped_storage().data_ptr() == tensors["ids"].untyped_storage().data_ptr()
@@ -0,0 +1,64 @@
+import json
+import os
+import time
+
+import pytest
+
+from app.utils.metrics import stage, start_breakdown
+from app.utils.profiler import (
+    ProfilerBusyError, RequestProfile, load_profile, profile_requested, prune_profiles, token_valid
+)
+
+def test_token_gating(monkeypatch):
+    monkeypatch.delenv("PROFILE_TOKEN", raising=False)
+    assert not token_valid("anything")
+    monkeypatch.setenv("PROFILE_TOKEN", "secret")
+    assert token_valid("secret")
+    assert not token_valid("wrong")
+    assert profile_requested({}, {"profile": "secret"}) == "secret"
+    assert profile_requested({}, {}) is None
+
+def test_profile_stores_folded_stacks_and_summary(tmp_path):
+    def busy_parse():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+    
+    start_breakdown()
+    profile = RequestProfile("req-1", directory=str(tmp_path), interval=0.001)
+    profile.start()
+    with stage("parse"):
+        busy_parse()
+    summary = profile.finish(200)
+    
+    assert summary["samples"] > 0
+    assert summary["stages"]["parse"]["cpu_ms"] > 0
+    assert isinstance(summary["top_allocations"], list)
+    folded = load_profile("req-1", directory=str(tmp_path))
+    # "frame;frame;... count" lines, leaf last
+    stack, count = folded.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert "busy_parse" in folded
+    assert json.loads(load_profile("req-1", "json", directory=str(tmp_path)))["status_code"] == 200
+    assert load_profile("../req-1", directory=str(tmp_path)) is None
+
+def test_one_profile_at_a_time(tmp_path):
+    first = RequestProfile("a", directory=str(tmp_path))
+    first.start()
+    try:
+        with pytest.raises(ProfilerBusyError):
+            RequestProfile("b", directory=str(tmp_path)).start()
+    finally:
+        first.finish(200)
+    second = RequestProfile("b", directory=str(tmp_path))
+    second.start()
+    second.finish(200)
+
+def test_prune_keeps_newest(tmp_path):
+    for number in range(3):
+        for extension in ("json", "folded"):
+            path = tmp_path / f"p{number}.{extension}"
+            path.write_text("{}")
+            os.utime(path, (number, number))
+    prune_profiles(str(tmp_path), keep=1)
+    assert sorted(os.listdir(tmp_path)) == ["p2.folded", "p2.json"]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from app.services.prompt_packing import (
+    PackedAnswerError, group_by_overlap, parse_packed_answers
+)
+
+def test_groups_questions_by_chunk_overlap():
+    """Questions sharing most of their chunks are grouped, up to the group size"""
+    chunk_keys = [["a", "b"], ["x", "y"], ["a", "b", "c"], ["b", "a"], ["y", "z"]]
+    assert group_by_overlap(chunk_keys, min_overlap=0.5, max_group_size=4) == [[0, 2, 3], [1, 4]]
+    assert group_by_overlap(chunk_keys, min_overlap=0.5, max_group_size=2) == [[0, 2], [1, 4], [3]]
+    assert group_by_overlap(chunk_keys, min_overlap=1.0, max_group_size=4) == [[0, 3], [1], [2], [4]]
+
+def test_parse_packed_answers():
+    """JSON arrays are mapped back by id, tolerating code fences and wrappers"""
+    assert parse_packed_answers('[{"id": 2, "answer": "B"}, {"id": 1, "answer": "A"}]', 2) == ["A", "B"]
+    assert parse_packed_answers('```json\n[{"id": 1, "answer": "A"}]\n```', 1) == ["A"]
+    assert parse_packed_answers('Here you go: {"answers": [{"id": "1", "answer": "A"}]}', 1) == ["A"]
+
+@pytest.mark.parametrize("text", [
+    "The grace period is thirty days.",
+    '[{"id": 1, "answer": "A"}]',
+    '[{"id": 1, "answer": "A"}, {"id": 2, "answer": ""}]',
+    '[{"id": 1, "answer": "A"}, {"id": 2, "answer": "B"',
+])
+def test_parse_packed_answers_rejects_incomplete_output(text):
+    with pytest.raises(PackedAnswerError):
+        parse_packed_answers(text, 2)
+
+CHUNKS = {
+    "grace": ["Grace period is thirty days.", "Premiums are paid yearly."],
+    "premium": ["Premiums are paid yearly.", "Grace period is thirty days."],
+    "cataract": ["Cataract surgery is covered after two years."],
+}
+
+def chunks_for(question):
+    return CHUNKS[question.split()[0]]
+
+QUESTIONS = ["grace period?", "cataract waiting period?", "premium frequency?"]
+
+def test_pipeline_packs_overlapping_questions(make_pipeline):
+    """Overlapping questions share one prompt; the rest are asked individually"""
+    pipeline = make_pipeline(chunks_for, packing=True, pack_max_questions=4, pack_min_overlap=0.5)
+    llm = pipeline.get_llm()
+    results = asyncio.run(pipeline.answer_questions(QUESTIONS))
+    
+    assert [r.question for r in results] == QUESTIONS
+    assert [r.served_by for r in results] == ["llm_packed", "llm", "llm_packed"]
+    assert llm.calls == ["cataract waiting period?"]
+    assert len(llm.packed_calls) == 1
+    questions, context = llm.packed_calls[0]
+    assert questions == ["grace period?", "premium frequency?"]
+    assert context == "Grace period is thirty days.\n\nPremiums are paid yearly."
+    assert results[0].retrieved_chunks == CHUNKS["grace"]
+    assert pipeline.packing_stats["packed_questions"] == 2
+    assert pipeline.packing_stats["context_tokens_saved"] > 0
+
+def test_pipeline_falls_back_when_packed_response_is_unparseable(make_pipeline, fake_llm):
+    """A packed prompt whose answers cannot be parsed is retried one question at a time"""
+    llm = fake_llm(packed_ok=False)
+    pipeline = make_pipeline(chunks_for, llm=llm, packing=True, pack_max_questions=4, pack_min_overlap=0.5)
+    results = asyncio.run(pipeline.answer_questions(QUESTIONS))
+    
+    assert [r.answer for r in results] == [f"Answer to {q}." for q in QUESTIONS]
+    assert sorted(llm.calls) == sorted(QUESTIONS)
+    assert pipeline.packing_stats["fallbacks"] == 1
@@ -0,0 +1,123 @@
+import pytest
+
+from app.services.basic_text_search import BasicTextSearch
+from app.services.retriever_router import RetrieverRouter
+
+POLICY = [
+    "The grace period for premium payment is thirty days from the due date.",
+    "Cataract treatment is covered up to Rs. 40,000 per eye.",
+    "Ambulance charges are covered up to Rs. 2,000 per hospitalisation.",
+    "Home nursing is not covered under this policy.",
+    "Maternity expenses are covered after a waiting period of two years.",
+    "Room rent is limited to 2% of the sum insured per day.",
+]
+
+class FailingEngine:
+    """A backend whose index build always fails"""
+    
+    def __init__(self, raises=False):
+        self.raises = raises
+        self.calls = 0
+    
+    def create_index(self, chunks):
+        self.calls += 1
+        if self.raises:
+            raise MemoryError("index too large")
+        return False
+
+def make_router(**options):
+    """A router that sees all three backends as installed without loading any"""
+    options.setdefault("backend", "auto")
+    router = RetrieverRouter(preload=False, **options)
+    router.installed = ["faiss", "tfidf", "basic"]
+    return router
+
+@pytest.mark.parametrize("num_chunks, options, backend, reason", [
+    (3, {}, "basic", "corpus_within_top_k"),
+    (10, {}, "tfidf", "small_corpus"),
+    (100, {}, "faiss", "within_budget"),
+    (100, {"latency_budget_ms": 1}, "basic", "cheapest_over_budget"),
+    (100, {"backend": "tfidf"}, "tfidf", "configured"),
+])
+def test_select_backend(num_chunks, options, backend, reason):
+    router = make_router(min_semantic_chunks=20, **options)
+    selection = router.select_backend(num_chunks, num_queries=1, top_k=5)
+    assert (selection["backend"], selection["reason"]) == (backend, reason)
+    assert selection["estimated_ms"] == round(router.estimate_ms(backend, num_chunks, 1), 1)
+
+def test_select_backend_skips_semantic_search_over_budget():
+    """A corpus too slow to embed within the budget goes to the best lexical backend that fits"""
+    router = make_router(min_semantic_chunks=20, latency_budget_ms=500)
+    selection = router.select_backend(100, num_queries=10, top_k=5)
+    assert (selection["backend"], selection["reason"]) == ("tfidf", "within_budget")
+
+def test_unknown_forced_backend_is_rejected():
+    with pytest.raises(ValueError):
+        RetrieverRouter(backend="elasticsearch", preload=False)
+
+@pytest.mark.parametrize("raises", [False, True])
+def test_falls_back_when_a_backend_fails_to_index(raises):
+    """A backend that returns False or raises hands the corpus to the next one down"""
+    router = make_router(min_semantic_chunks=0)
+    router.installed = ["tfidf", "basic"]
+    failing = FailingEngine(raises=raises)
+    router.engines = {"tfidf": failing, "basic": BasicTextSearch()}
+    
+    selection = router.create_index(POLICY)
+    assert failing.calls == 1
+    assert (selection["backend"], selection["engine"], selection["reason"]) == ("basic", "Basic", "fallback")
+    assert router.active == "basic"
+    assert router.search("cataract treatment", top_k=1)[0]["text"] == POLICY[1]
+
+def test_fails_when_every_backend_fails_to_index():
+    router = make_router(min_semantic_chunks=0)
+    router.installed = ["tfidf", "basic"]
+    router.engines = {"tfidf": FailingEngine(), "basic": FailingEngine(raises=True)}
+    with pytest.raises(RuntimeError):
+        router.create_index(POLICY)
+    assert router.active is None
+    assert not router.served
+
+def test_served_and_last_selection_bookkeeping():
+    """Every build, including a reused one, is counted and recorded"""
+    router = RetrieverRouter(backend="basic", preload=False)
+    first = router.create_index(POLICY)
+    assert router.last_selection is first
+    assert first["num_chunks"] == len(POLICY) and first["index_ms"] >= 0
+    assert first["fingerprint"] == router.fingerprint
+    
+    again = router.create_index(list(POLICY))
+    assert again["reused"] and again["index_ms"] == 0.0
+    assert router.last_selection is again
+    
+    router.create_index(POLICY[:2])
+    assert router.served == {"basic": 3}
+    assert router.last_selection["num_chunks"] == 2
+    
+    stats = router.get_stats()
+    assert stats["served"] == {"basic": 3}
+    assert stats["last_selection"] is router.last_selection
+
+@pytest.mark.parametrize("change", ["create_index", "add_documents", "remove_document"])
+def test_cached_results_go_away_when_the_index_changes(change):
+    """Rebuilding, adding to or removing from the index drops results cached for the old fingerprint"""
+    router = RetrieverRouter(backend="basic", preload=False)
+    evicted = []
+    router.add_eviction_listener(evicted.append)
+    router.create_index(POLICY)
+    if change == "remove_document":
+        router.add_documents({"extra": ["Dental treatment is covered after one year."]})
+    previous = router.fingerprint
+    router.search("cataract treatment", top_k=2)
+    assert router.result_cache.get(previous, "cataract treatment", 2, "basic") is not None
+    
+    if change == "create_index":
+        router.create_index(POLICY[:3])
+    elif change == "add_documents":
+        router.add_documents({"other": ["Travel insurance covers lost baggage."]})
+    else:
+        router.remove_document("extra")
+    
+    assert router.fingerprint != previous
+    assert router.result_cache.get(previous, "cataract treatment", 2, "basic") is None
+    assert evicted[-1] == previous
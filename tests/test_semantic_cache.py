@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.llm_service import SimpleAnswerResult
+from app.services.qa_pipeline import QAPipeline
+from app.services.semantic_cache import SemanticAnswerCache
+
+ANSWER = {"question": "What is the waiting period for PED?", "answer": "48 months.", "confidence": 0.9}
+
+def test_hit_within_threshold():
+    """A question embedding close to a cached one returns the stored answer"""
+    cache = SemanticAnswerCache(threshold=0.9, max_entries_per_document=4, max_documents=2, ttl=0)
+    cache.store("doc1", np.array([1.0, 0.0, 0.0]), ANSWER["question"], ANSWER)
+    
+    hit = cache.lookup("doc1", np.array([0.95, 0.1, 0.0]))
+    assert hit is not None
+    assert hit["answer"] == ANSWER
+    assert cache.lookup("doc1", np.array([0.0, 1.0, 0.0])) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_scoped_to_document_fingerprint():
+    """Answers are never reused across documents"""
+    cache = SemanticAnswerCache(threshold=0.9, max_entries_per_document=4, max_documents=2, ttl=0)
+    cache.store("doc1", np.array([1.0, 0.0]), ANSWER["question"], ANSWER)
+    assert cache.lookup("doc2", np.array([1.0, 0.0])) is None
+
+def test_evicts_least_recently_used_entry():
+    """A full document scope evicts its least recently used question"""
+    cache = SemanticAnswerCache(threshold=0.99, max_entries_per_document=2, max_documents=2, ttl=0)
+    cache.store("doc1", np.array([1.0, 0.0, 0.0]), "q1", ANSWER)
+    cache.store("doc1", np.array([0.0, 1.0, 0.0]), "q2", ANSWER)
+    assert cache.lookup("doc1", np.array([1.0, 0.0, 0.0])) is not None
+    cache.store("doc1", np.array([0.0, 0.0, 1.0]), "q3", ANSWER)
+    
+    assert cache.lookup("doc1", np.array([0.0, 1.0, 0.0])) is None
+    assert cache.lookup("doc1", np.array([1.0, 0.0, 0.0]))["question"] == "q1"
+    assert cache.stats()["evictions"] == 1
+
+def test_evicts_least_recently_used_document():
+    """Only max_documents document scopes are kept"""
+    cache = SemanticAnswerCache(threshold=0.9, max_entries_per_document=2, max_documents=1, ttl=0)
+    cache.store("doc1", np.array([1.0, 0.0]), "q1", ANSWER)
+    cache.store("doc2", np.array([1.0, 0.0]), "q1", ANSWER)
+    assert cache.lookup("doc1", np.array([1.0, 0.0])) is None
+    assert cache.stats()["documents"] == 1
+
+def test_answer_cached_under_the_index_it_was_retrieved_from():
+    """An index rebuilt while the LLM answers does not receive the answer"""
+    class Retriever:
+        fingerprint = "doc1"
+        
+        def embed_query(self, question):
+            return np.array([1.0, 0.0])
+        
+        def search_batch(self, questions, top_k=5):
+            return [[{"text": "The waiting period for PED is 48 months.", "score": 1.0}] for _ in questions]
+    
+    retriever = Retriever()
+    
+    class LLM:
+        model_name = "m"
+        prompt_version = "p"
+        max_tokens = 0
+        
+        async def generate_answer(self, question, context, raise_on_error=False):
+            # Another request re-indexes the shared retriever meanwhile
+            retriever.fingerprint = "doc2"
+            return SimpleAnswerResult(answer="48 months.", confidence=0.9, question=question)
+    
+    cache = SemanticAnswerCache(threshold=0.9, max_entries_per_document=4, max_documents=2, ttl=0)
+    llm = LLM()
+    pipeline = QAPipeline(retriever, lambda: llm, semantic_cache=cache)
+    asyncio.run(pipeline.answer_question(ANSWER["question"]))
+    
+    assert cache.lookup("doc1", np.array([1.0, 0.0])) is not None
+    assert cache.lookup("doc2", np.array([1.0, 0.0])) is None
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app.services.retriever_router import RetrieverRouter
+from app.utils.single_flight import SingleFlight
+
+POLICY = [
+    "The grace period for premium payment is thirty days from the due date.",
+    "Cataract treatment is covered up to Rs. 40,000 per eye.",
+    "Ambulance charges are covered up to Rs. 2,000 per hospitalisation.",
+    "Home nursing is not covered under this policy.",
+    "Organ donor expenses are covered for the harvesting of the organ.",
+    "Maternity expenses are covered after a waiting period of two years.",
+]
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    runs = []
+    
+    async def work(key):
+        runs.append(key)
+        await asyncio.sleep(0.02)
+        return f"result {key}"
+    
+    async def run():
+        return await asyncio.gather(*(flights.do(key, lambda key=key: work(key)) for key in ["a", "a", "b", "a"]))
+    
+    assert asyncio.run(run()) == ["result a", "result a", "result b", "result a"]
+    assert runs == ["a", "b"]
+    assert flights.stats() == {"in_flight": 0, "calls": 4, "executed": 2, "coalesced": 2}
+
+def test_errors_are_shared_and_not_cached():
+    flights = SingleFlight()
+    runs = []
+    
+    async def failing():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("download failed")
+    
+    async def run():
+        return await asyncio.gather(flights.do("doc", failing), flights.do("doc", failing), return_exceptions=True)
+    
+    assert [type(error) for error in asyncio.run(run())] == [ValueError, ValueError]
+    with pytest.raises(ValueError):
+        asyncio.run(flights.do("doc", failing))
+    assert len(runs) == 2
+
+def test_shared_call_cancelled_only_with_its_last_waiter():
+    flights = SingleFlight()
+    cancelled = []
+    
+    async def work():
+        try:
+            await asyncio.sleep(0.05)
+            return "done"
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+    
+    async def run():
+        first = asyncio.ensure_future(flights.do("k", work))
+        second = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        
+        alone = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        alone.cancel()
+        await asyncio.sleep(0.01)
+        return result
+    
+    assert asyncio.run(run()) == "done"
+    assert cancelled == [1]
+
+def test_identical_concurrent_questions_make_one_llm_call(make_pipeline, fake_llm):
+    llm = fake_llm(delay=0.02)
+    router = RetrieverRouter(backend="basic")
+    router.create_index(POLICY)
+    pipeline = make_pipeline(retriever=router, llm=llm, top_k=2)
+    
+    async def run():
+        return await asyncio.gather(
+            pipeline.answer_questions(["Is cataract treatment covered?", "Is home nursing covered?"]),
+            pipeline.answer_questions(["Is cataract treatment covered?"])
+        )
+    
+    first, second = asyncio.run(run())
+    assert sorted(llm.calls) == ["Is cataract treatment covered?", "Is home nursing covered?"]
+    assert second[0].answer == first[0].answer
+    assert second[0] is not first[0]
+    assert pipeline.llm_flights.counters["coalesced"] == 1
+
+def test_rebuilding_the_same_document_reuses_the_index():
+    router = RetrieverRouter(backend="basic")
+    evicted = []
+    router.add_eviction_listener(evicted.append)
+    built = router.create_index(POLICY)
+    again = router.create_index(list(POLICY))
+    assert again.get("reused") and not built.get("reused")
+    assert again["fingerprint"] == built["fingerprint"]
+    assert not router.create_index(POLICY[:3]).get("reused")
+    assert evicted == [built["fingerprint"]]
@@ -0,0 +1,54 @@
+import threading
+
+from app.services.retriever_router import RetrieverRouter
+from app.utils.startup import Warmup
+
+def test_warmup_runs_steps_once_and_reports_failures():
+    calls = []
+    
+    def broken():
+        raise RuntimeError("model missing")
+    
+    warmup = Warmup([("load", lambda: calls.append("load")), ("broken", broken)])
+    assert not warmup.ready
+    warmup.run()
+    warmup.run()
+    warmup.start()
+    
+    assert calls == ["load"]
+    stats = warmup.stats()
+    assert stats["ready"]
+    assert stats["steps"]["load"]["state"] == "done"
+    assert stats["steps"]["broken"] == {"state": "failed", "error": "model missing",
+                                        "seconds": stats["steps"]["broken"]["seconds"]}
+
+def test_warmup_start_runs_in_background():
+    release = threading.Event()
+    warmup = Warmup([("slow", release.wait)])
+    warmup.start()
+    assert not warmup.ready
+    assert warmup.stats()["steps"]["slow"]["state"] == "running"
+    release.set()
+    assert warmup.done.wait(5)
+
+def test_router_routes_to_loaded_backends_while_warming():
+    router = RetrieverRouter(preload=False)
+    assert router.available == []
+    
+    # Without a warm-up, backends load on first use
+    assert router.candidates() == router.installed
+    
+    router.warming = True
+    # Nothing loaded yet: only the cheapest backend, which loads instantly
+    assert router.candidates() == ["basic"]
+    chunks = [f"Clause {i}: benefit {i} is covered." for i in range(30)]
+    assert router.create_index(chunks)["backend"] == "basic"
+    
+    # A router spawned during the warm-up picks up backends loaded after it
+    session = router.spawn()
+    router.warming = False
+    timings = router.warm_up()
+    assert set(timings) == set(router.installed) - {"basic"}
+    assert session.candidates() == router.installed
+    for name in router.installed:
+        assert session._get_engine(name) is not None